@@ -0,0 +1,40 @@
+from django.db.backends.postgresql import base
+
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend, which takes connections from a process-wide pool and
+    returns them there instead of closing. Threads of WSGI and ASGI servers
+    share the pool, as it is guarded with a lock.
+
+    Pool options are given in `POOL` dict of the database settings:
+        - SIZE (int): the maximum number of open connections
+        - TIMEOUT (float): seconds to wait for a connection, if all of them are in use
+        - MAX_IDLE (float): seconds, after which an idle connection is closed
+        - CHECK_AFTER (float): seconds of idleness, after which a connection
+          is checked with a query on checkout
+    `CONN_MAX_AGE` should be 0, so connections are returned after each request.
+    """
+    creation_class = DatabaseCreation
+
+    def get_pool(self):
+        options = self.settings_dict.get('POOL', {})
+        key = (self.alias, *(self.settings_dict[name] for name in ('NAME', 'HOST', 'PORT', 'USER')))
+        return get_pool(key, **{name.lower(): value for name, value in options.items()})
+
+    def get_new_connection(self, conn_params):
+        return self.get_pool().get(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        # Connections, closed inside of a transaction, are kept by the wrapper until
+        # the transaction ends, so they can't be given to anyone else
+        if self.in_atomic_block:
+            self.get_pool().discard(self.connection)
+        else:
+            self.get_pool().put(self.connection)
@@ -0,0 +1,20 @@
+from django.db.backends.postgresql import creation
+
+from .pool import get_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Closes idle pooled connections, which would keep test databases from being dropped or cloned."""
+    def close_pools(self, database_name):
+        for (alias, name, *_), pool in get_pools().items():
+            if name == database_name:
+                pool.close()
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close()
+        self.close_pools(self.connection.settings_dict['NAME'])
+        super()._clone_test_db(suffix, verbosity, keepdb)
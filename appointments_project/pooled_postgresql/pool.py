@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import OperationalError, extensions
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections to one database.
+
+    Connections are checked out in LIFO order, so the least recently used
+    ones stay idle and get evicted after `max_idle` seconds. A connection,
+    which has been idle for more than `check_after` seconds, is checked
+    with a query on checkout and replaced if it is broken. If all of `size`
+    connections are checked out, callers wait for one up to `timeout` seconds.
+    """
+    def __init__(self, size=10, timeout=10, max_idle=300, check_after=1):
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        # (connection, time it was returned) tuples, the most recent go last
+        self.idle = deque()
+        self.opened = 0
+        self.stats = dict.fromkeys(
+            ('checkouts', 'waits', 'wait_time', 'timeouts', 'evictions', 'failed_checks'), 0
+        )
+
+    def get(self, connect):
+        """
+        :returns: healthy connection, opened with `connect` function if there are no idle ones,
+        :raise: OperationalError if none is available in time.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            with self.condition:
+                self._reset_after_fork()
+                self._evict(time.monotonic())
+
+                while not self.idle and self.opened >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise OperationalError(
+                            f'No database connection is available in {self.timeout} seconds.'
+                        )
+                    waited = True
+                    self.condition.wait(remaining)
+
+                if self.idle:
+                    connection, returned_at = self.idle.pop()
+                else:
+                    connection, returned_at = None, None
+                    self.opened += 1
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_healthy(connection, returned_at):
+                self._discard(connection)
+                with self.condition:
+                    self.stats['failed_checks'] += 1
+                continue
+
+            with self.condition:
+                self.stats['checkouts'] += 1
+                if waited:
+                    self.stats['waits'] += 1
+                    self.stats['wait_time'] += time.monotonic() - started
+            return connection
+
+    def put(self, connection):
+        """Returns a checked out connection to the pool, or closes it if it can't be reused."""
+        if self.pid != os.getpid():
+            return
+
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            reusable = connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        except Exception:
+            # Closed or broken connections can't even report their status
+            reusable = False
+
+        if not reusable:
+            self._discard(connection)
+            return
+
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        """Closes a checked out connection instead of returning it to the pool."""
+        if self.pid == os.getpid():
+            self._discard(connection)
+
+    def close(self):
+        """Closes all idle connections."""
+        with self.condition:
+            idle, self.idle = self.idle, deque()
+            self.opened -= len(idle)
+        for connection, _ in idle:
+            connection.close()
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'opened': self.opened,
+                'idle': len(self.idle),
+                **self.stats,
+            }
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at <= self.check_after:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            self._forget()
+
+    def _forget(self):
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def _evict(self, now):
+        # Called with the lock held. The oldest idle connections are first.
+        while self.idle and now - self.idle[0][1] > self.max_idle:
+            connection, _ = self.idle.popleft()
+            self.opened -= 1
+            self.stats['evictions'] += 1
+            connection.close()
+
+    def _reset_after_fork(self):
+        # Called with the lock held. Connections, inherited from the parent
+        # process, share its sockets, so they are dropped without closing.
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.idle = deque()
+            self.opened = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, **options):
+    """:returns: the pool of given key, created with given options if needed."""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def get_pools():
+    """:returns: dict of all pools by their keys."""
+    with _pools_lock:
+        return dict(_pools)
@@ -52,10 +52,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [    
     'django.middleware.security.SecurityMiddleware',
+    'specialist_api.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,18 +89,70 @@ WSGI_APPLICATION = 'appointments_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
+# Connections are taken from a pool of each process and returned there
+# after each request, see `appointments_project.pooled_postgresql`.
+# Use 'django.db.backends.postgresql_psycopg2' engine to connect per request.
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'appointments_project.pooled_postgresql',
         'NAME': secrets['db_name'],
         'USER': secrets['db_user'],
         'PASSWORD': secrets['db_password'],
         'HOST': '127.0.0.1',
-        'PORT': '5432'
+        'PORT': '5432',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': secrets.get('db_pool_size', 20),
+            'TIMEOUT': 10,
+            'MAX_IDLE': 5 * 60,
+            'CHECK_AFTER': 1,
+        },
     }
 }
 
+# Read replicas of the default database are given in secrets.json as
+# `"db_replicas": [{"host": "...", "port": "5432"}]`. Safe reads are spread
+# over them, and a client reads from the primary for `REPLICATION_LAG`
+# seconds after each write. Tests are run with `appointments_project.test_settings`,
+# which add a database, standing for a replica, for tests of the router.
+
+for i, replica in enumerate(secrets.get('db_replicas', []), start=1):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'HOST': replica['host'],
+        'PORT': str(replica.get('port', '5432')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['specialist_api.routers.ReplicaRouter']
+REPLICATION_LAG = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Free intervals of workers, responses and their version stamps are cached,
+# and stamps are invalidated by writes of any process, so every process must
+# share the cache. A Redis server is given in secrets.json as
+# `"cache_url": "redis://127.0.0.1:6379/0"`, its client is the `redis` package.
+# Without it the cache is local to a process, which is only valid for a single
+# process server, e.g. `runserver`, and `check --deploy` fails.
+
+if secrets.get('cache_url'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': secrets['cache_url'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -0,0 +1,16 @@
+"""
+Settings of the test run, which are given explicitly:
+
+    python manage.py test --settings=appointments_project.test_settings
+"""
+from .settings import *  # noqa: F401, F403
+from .settings import DATABASES, secrets
+
+
+# Tests read from the primary only, except for ones of the router,
+# which use a second database as a replica
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'TEST': {'NAME': f"test_{secrets['db_name']}_replica", 'MIGRATE': False},
+}
+DATABASE_REPLICAS = []
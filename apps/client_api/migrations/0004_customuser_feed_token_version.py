@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_api', '0003_alter_customuser_is_superuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='feed_token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -15,6 +15,9 @@ class CustomUser(AbstractUser):
     Stores a single user entry.
     """
     role = models.IntegerField(default=0, choices=ROLE_CHOICES)
+    # Tokens of calendar feeds of the user, or of their worker profile, are
+    # signed with this version, so increasing it revokes all of them
+    feed_token_version = models.PositiveIntegerField(default=0)
     
     REQUIRED_FIELDS = [
         'email',
@@ -1,3 +1,1082 @@
-from django.test import TestCase
+import calendar
+import json
+import threading
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import override_settings
+from django.urls import reverse
+
+from specialist_api.models import (
+    Worker, Location, Schedule, Service, Appointment, AppointmentSeries
+)
+from specialist_api.availability import WorkerCalendar
+from specialist_api.booking import AppointmentBatch
+from specialist_api.bitmaps import SLOTS_PER_DAY
+from specialist_api.query_budget import DATASET_START, QueryBudgetMixin
+
+from .views import AsyncEarliestSlotsAPIView
+
+
+User = get_user_model()
+
+
+class AvailableSlotsAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.AvailableSlotsAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        client_user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        worker_user = User.objects.create_user(
+            username='username2',
+            email='testmail2@mail.com',
+            password='testpass2'
+        )
+        self.worker = Worker.objects.create(profile=worker_user)
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        self.worker.services.add(self.service)
+        location = Location.objects.create(
+            city='City',
+            street='Street',
+            street_number='100'
+        )
+        Schedule.objects.create(
+            location=location,
+            worker=self.worker,
+            day_of_week=calendar.MONDAY,
+            start_time=time(8),
+            end_time=time(10)
+        )
+
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        Appointment.objects.create(
+            client=client_user,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=datetime.combine(self.monday, time(8, 30))
+        )
+        self.url = reverse('client_api:available_slots', kwargs={'worker_id': self.worker.id})
+
+    def get_slots(self, lower_date, upper_date):
+        params = {
+            'service': self.service.id,
+            'lower_date': lower_date.strftime('%d-%m-%Y'),
+            'upper_date': upper_date.strftime('%d-%m-%Y'),
+        }
+        return self.client.get(self.url, params)
+
+    def test_slots(self):
+        response = self.get_slots(self.monday, self.monday)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['slots'],
+            [datetime.combine(self.monday, time(9, 15)).strftime('%d-%m-%Y %H:%M:%S')]
+        )
+
+    def test_slots_are_bookable(self):
+        response = self.get_slots(self.monday, self.monday + timedelta(days=7))
+
+        for slot in response.data['slots']:
+            scheduled_for = datetime.strptime(slot, '%d-%m-%Y %H:%M:%S')
+            self.assertIs(
+                Appointment.is_apoointment_avaliable(self.worker, scheduled_for, self.service),
+                True
+            )
+
+    def test_query_count_does_not_depend_on_range(self):
+        # worker, service, schedules, appointments and series
+        with self.assertNumQueries(5):
+            self.get_slots(self.monday, self.monday)
+        with self.assertNumQueries(5):
+            self.get_slots(self.monday, self.monday + timedelta(days=30))
+
+    def test_bad_params(self):
+        response = self.get_slots(self.monday, self.monday - timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_days(self):
+        self.get_slots(self.monday, self.monday + timedelta(days=7))
+
+        # worker and service only
+        with self.assertNumQueries(2):
+            response = self.get_slots(self.monday, self.monday + timedelta(days=7))
+        self.assertEqual(len(response.data['slots']), 7)
+
+    def test_appointment_invalidates_day(self):
+        self.get_slots(self.monday, self.monday)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                client=self.worker.profile,
+                worker=self.worker,
+                service=self.service,
+                scheduled_for=datetime.combine(self.monday, time(9, 15))
+            )
+        response = self.get_slots(self.monday, self.monday)
+
+        self.assertEqual(response.data['slots'], [])
+
+    def test_moved_appointment_invalidates_both_days(self):
+        next_monday = self.monday + timedelta(days=7)
+        self.get_slots(self.monday, next_monday)
+
+        appointment = Appointment.objects.get()
+        appointment.scheduled_for = datetime.combine(next_monday, time(8))
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        response = self.get_slots(self.monday, next_monday)
+
+        self.assertEqual(len(response.data['slots']), 9)
+        self.assertNotIn(datetime.combine(next_monday, time(8)).strftime('%d-%m-%Y %H:%M:%S'),
+                         response.data['slots'])
+
+    def test_schedule_invalidates_worker(self):
+        self.get_slots(self.monday, self.monday)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.filter(worker=self.worker).get().delete()
+        response = self.get_slots(self.monday, self.monday)
+
+        self.assertEqual(response.data['slots'], [])
+
+    def test_service_duration_invalidates_workers(self):
+        self.get_slots(self.monday, self.monday)
+
+        self.service.duration = timedelta(minutes=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+        response = self.get_slots(self.monday, self.monday)
+
+        # 08:30 appointment lasts till 09:30 now
+        self.assertEqual(response.data['slots'], [])
+
+    def test_cache_stats(self):
+        self.get_slots(self.monday, self.monday)
+        self.get_slots(self.monday, self.monday + timedelta(days=1))
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@mail.com', 'pass'))
+
+        response = self.client.get(reverse('specialist_api:availability_cache_stats'))
+
+        self.assertEqual(response.data, {'hits': 1, 'misses': 2})
+
+
+class AvailabilityHeatmapAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.AvailabilityHeatmapAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        self.worker = Worker.objects.create(profile=user)
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        self.worker.services.add(self.service)
+        Schedule.objects.create(
+            location=Location.objects.create(city='City', street='Street', street_number='100'),
+            worker=self.worker,
+            day_of_week=calendar.MONDAY,
+            start_time=time(8),
+            end_time=time(10)
+        )
+        
+        self.month = (date.today().replace(day=1) + timedelta(days=62)).replace(day=1)
+        self.mondays = [day for day in (self.month + timedelta(days=i) for i in range(28))
+                        if day.weekday() == calendar.MONDAY]
+        Appointment.objects.create(
+            client=user,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=datetime.combine(self.mondays[0], time(8, 30))
+        )
+        self.url = reverse('client_api:availability_heatmap', kwargs={'worker_id': self.worker.id})
+    
+    def test_heatmap(self):
+        # worker, service, schedules, appointments and series
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, {'service': self.service.id,
+                                                  'month': self.month.strftime('%m-%Y')})
+        days = {datetime.strptime(day['date'], '%d-%m-%Y').date(): day for day in response.data['days']}
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(days), calendar.monthrange(self.month.year, self.month.month)[1])
+        self.assertEqual(days[self.mondays[0]], {'date': self.mondays[0].strftime('%d-%m-%Y'),
+                                                 'free_minutes': 80, 'slots': 1})
+        for monday in self.mondays[1:]:
+            self.assertEqual((days[monday]['free_minutes'], days[monday]['slots']), (120, 6))
+        self.assertEqual(days[self.month + timedelta(days=(calendar.TUESDAY - self.month.weekday()) % 7)]['slots'], 0)
+    
+    def test_past_days_are_empty(self):
+        month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        response = self.client.get(self.url, {'service': self.service.id, 'month': month.strftime('%m-%Y')})
+        
+        self.assertEqual({day['free_minutes'] for day in response.data['days']}, {0})
+        self.assertEqual({day['slots'] for day in response.data['days']}, {0})
+    
+    def test_bad_params(self):
+        self.assertEqual(self.client.get(self.url, {'service': self.service.id, 'month': '13-2030'}).status_code, 400)
+    
+    def test_past_bitmaps_are_bounded(self):
+        monday = self.mondays[0]
+        worker_calendar = WorkerCalendar(self.worker, monday, monday)
+        
+        for after in (datetime(9999, 1, 1), datetime.combine(monday, time(23, 59))):
+            bitmap = worker_calendar.get_bitmap(monday, after=after)
+            self.assertEqual(bitmap.busy, (1 << SLOTS_PER_DAY) - 1)
+            self.assertEqual(bitmap.get_start_times(self.service.duration), [])
+    
+    def test_month_too_far(self):
+        for month in ('01-0001', '01-9999', (date.today() + timedelta(days=400)).strftime('%m-%Y')):
+            response = self.client.get(self.url, {'service': self.service.id, 'month': month})
+            self.assertEqual(response.status_code, 400)
+
+
+class EarliestSlotsAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.EarliestSlotsAPIView`.
+    """
+    def setUp(self):
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=30)
+        )
+        locations = [
+            Location.objects.create(city='Kyiv', street='Street', street_number='1'),
+            Location.objects.create(city='Lviv', street='Street', street_number='2'),
+            Location.objects.create(city='Kyiv', street='Street', street_number='3'),
+        ]
+        self.workers = []
+        
+        for i, (location, start_hour, end_hour, provides) in enumerate([(locations[0], 8, 10, True),
+                                                                         (locations[1], 9, 11, True),
+                                                                         (locations[2], 7, 12, False)]):
+            user = User.objects.create_user(
+                username=f'username{i}',
+                email=f'testmail{i}@mail.com',
+                password='testpass1'
+            )
+            worker = Worker.objects.create(profile=user)
+            if provides:
+                worker.services.add(self.service)
+            Schedule.objects.create(
+                location=location,
+                worker=worker,
+                day_of_week=calendar.MONDAY,
+                start_time=time(start_hour),
+                end_time=time(end_hour)
+            )
+            self.workers.append(worker)
+        
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        Appointment.objects.create(
+            client=self.workers[2].profile,
+            worker=self.workers[0],
+            service=self.service,
+            scheduled_for=datetime.combine(self.monday, time(8))
+        )
+        self.url = reverse('client_api:earliest_slots')
+    
+    def get_slots(self, **params):
+        params = {
+            'service': self.service.id,
+            'lower_date': self.monday.strftime('%d-%m-%Y'),
+            **params
+        }
+        return self.client.get(self.url, params)
+    
+    def get_expected(self, *slots):
+        return [{'worker': self.workers[i].id,
+                 'start': datetime.combine(self.monday, start).strftime('%d-%m-%Y %H:%M:%S')}
+                for i, start in slots]
+    
+    def test_earliest_slots(self):
+        response = self.get_slots(limit=4)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['slots'],
+            self.get_expected((0, time(8, 30)), (0, time(8, 45)), (0, time(9)), (1, time(9)))
+        )
+    
+    def test_city_and_time_window(self):
+        response = self.get_slots(city='lviv', time_from='10:00',
+                                  upper_date=self.monday.strftime('%d-%m-%Y'))
+        
+        self.assertEqual(
+            response.data['slots'],
+            self.get_expected((1, time(10)), (1, time(10, 15)), (1, time(10, 30)))
+        )
+    
+    def test_stops_loading_when_limit_is_reached(self):
+        # service, schedules, then appointments and series of the first day only
+        with self.assertNumQueries(4):
+            response = self.get_slots(upper_date=(self.monday + timedelta(days=30)).strftime('%d-%m-%Y'), limit=2)
+        self.assertEqual(len(response.data['slots']), 2)
+    
+    def test_bad_params(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.get_slots(limit=0).status_code, 400)
+
+
+class WorkerListAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.WorkerListAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(
+            city='City',
+            street='Street',
+            street_number='100'
+        )
+        self.workers = []
+
+        for i, (day_of_week, start_hour, end_hour) in enumerate([(calendar.MONDAY, 8, 12),
+                                                                 (calendar.MONDAY, 14, 18),
+                                                                 (calendar.FRIDAY, 8, 12)]):
+            user = User.objects.create_user(
+                username=f'username{i}',
+                email=f'testmail{i}@mail.com',
+                password='testpass1'
+            )
+            worker = Worker.objects.create(profile=user, proffession='barber')
+            Schedule.objects.create(
+                location=location,
+                worker=worker,
+                day_of_week=day_of_week,
+                start_time=time(start_hour, 15 * i),
+                end_time=time(end_hour)
+            )
+            self.workers.append(worker)
+
+        self.url = reverse('client_api:workers')
+
+    def get_usernames(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(worker['profile']['username'] for worker in response.data['results'])
+
+    def test_filter_by_date(self):
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        friday = monday + timedelta(days=calendar.FRIDAY)
+
+        self.assertEqual(self.get_usernames(date=monday.strftime('%d-%m-%Y')),
+                         ['username0', 'username1'])
+        self.assertEqual(
+            self.get_usernames(date=f"{monday.strftime('%d-%m-%Y')},{friday.strftime('%d-%m-%Y')}"),
+            ['username0', 'username1', 'username2']
+        )
+
+    def test_filter_by_weekday_and_time(self):
+        self.assertEqual(self.get_usernames(weekday='0,4', time_from='13:00'), ['username1'])
+        self.assertEqual(self.get_usernames(time_to='09:00'), ['username0', 'username2'])
+        self.assertEqual(self.get_usernames(weekday='4', proffession='Barber'), ['username2'])
+
+    def test_bad_params(self):
+        response = self.client.get(self.url, {'weekday': '7'})
+        self.assertEqual(response.status_code, 400)
+        
+        for time_from, time_to in (('13:00', '09:00'), ('09:00', '09:00')):
+            response = self.client.get(self.url, {'time_from': time_from, 'time_to': time_to})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {'query params': 'time_from must be less than time_to.'})
+
+    def test_query_count_does_not_depend_on_worker_count(self):
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        for i in range(3, 10):
+            user = User.objects.create_user(
+                username=f'username{i}',
+                email=f'testmail{i}@mail.com',
+                password='testpass1'
+            )
+            worker = Worker.objects.create(profile=user)
+            worker.services.create(name=f'service{i}', price=10, currency='USD',
+                                   duration=timedelta(minutes=30))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'weekday': '0'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_cached_response(self):
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        response = self.client.get(self.url, {'weekday': '0', 'proffession': 'Barber'})
+        
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'date': monday.strftime('%d-%m-%Y'), 'proffession': 'barber'})
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(cached['ETag'], response['ETag'])
+    
+    @override_settings(ALLOWED_HOSTS=['testserver', 'other.example.com'])
+    def test_cached_page_links_follow_request(self):
+        response = self.client.get(self.url, {'weekday': '0,4', 'page_size': '2'})
+        
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'weekday': '4,0', 'page_size': '2'},
+                                     secure=True, HTTP_HOST='other.example.com')
+        self.assertEqual(cached.status_code, 200)
+        self.assertTrue(response.data['next'].startswith('http://testserver/'))
+        self.assertTrue(cached.data['next'].startswith('https://other.example.com/'))
+        self.assertIn('weekday=4%2C0', cached.data['next'])
+        self.assertEqual(cached.data['results'], response.data['results'])
+        
+        last_page = self.client.get(cached.data['next'], secure=True, HTTP_HOST='other.example.com')
+        self.assertEqual([worker['profile']['username'] for worker in last_page.data['results']], ['username2'])
+        self.assertIsNone(last_page.data['next'])
+        
+        first_page = self.client.get(last_page.data['previous'], secure=True, HTTP_HOST='other.example.com')
+        self.assertEqual(first_page.data['results'], response.data['results'])
+    
+    def test_version_bump_rebuilds_cached_response(self):
+        self.assertEqual(self.get_usernames(weekday='0'), ['username0', 'username1'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.filter(worker=self.workers[1]).delete()
+        
+        self.assertEqual(self.get_usernames(weekday='0'), ['username0'])
+
+    def test_changes_bump_version(self):
+        for change in (
+            lambda: self.workers[0].services.create(name='service', price=10, currency='USD',
+                                                    duration=timedelta(minutes=30)),
+            lambda: Schedule.objects.filter(worker=self.workers[1]).delete(),
+            lambda: self.workers[2].profile.save(),
+        ):
+            etag = self.client.get(self.url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+    
+    def test_clients_keep_version(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username='client', email='client@mail.com', password='testpass1')
+            user.first_name = 'First'
+            user.save()
+        
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class AppointmentListAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.AppointmentListAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        worker_user = User.objects.create_user(
+            username='username2',
+            email='testmail2@mail.com',
+            password='testpass2'
+        )
+        worker = Worker.objects.create(profile=worker_user)
+        service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        first_appointment = datetime(2022, 7, 4, 8)
+        self.appointment_ids = [
+            Appointment.objects.create(
+                client=self.user,
+                worker=worker,
+                service=service,
+                scheduled_for=first_appointment + timedelta(hours=i)
+            ).id
+            for i in range(7)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pagination(self):
+        url = reverse('client_api:appointments') + '?page_size=3'
+        ids = []
+
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids.extend(appointment['id'] for appointment in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(ids, self.appointment_ids[::-1])
+
+    def test_not_modified(self):
+        url = reverse('client_api:appointments')
+        last_modified = self.client.get(url)['Last-Modified']
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.get(id=self.appointment_ids[0]).delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+
+
+
+class AppointmentBatchCreateAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.AppointmentBatchCreateAPIView`.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        self.workers = []
+
+        for i in range(2):
+            worker_user = User.objects.create_user(
+                username=f'worker{i}',
+                email=f'worker{i}@mail.com',
+                password='testpass2'
+            )
+            worker = Worker.objects.create(profile=worker_user)
+            worker.services.add(service)
+            Schedule.objects.create(
+                location=Location.objects.create(city='City', street='Street', street_number=str(i)),
+                worker=worker,
+                day_of_week=calendar.MONDAY,
+                start_time=time(8),
+                end_time=time(12)
+            )
+            self.workers.append(worker)
+
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.service = service
+        self.url = reverse('client_api:appointment_batch_create')
+        self.client.force_authenticate(self.user)
+
+    def item(self, worker, hour, minute=0):
+        scheduled_for = datetime.combine(self.monday, time(hour, minute))
+        return {
+            'worker': worker.id,
+            'service': self.service.id,
+            'scheduled_for': scheduled_for.strftime('%d-%m-%Y %H:%M:%S')
+        }
+
+    def test_batch_create(self):
+        items = [self.item(worker, hour) for worker in self.workers for hour in (8, 9, 10)]
+
+        # savepoint of the view, workers, services, lock of workers, schedules,
+        # appointments, series, savepoint, insert, release, release of the view
+        with self.assertNumQueries(11):
+            response = self.client.post(self.url, {'appointments': items}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(Appointment.objects.filter(client=self.user).count(), 6)
+
+    def test_batch_is_rejected_as_a_whole(self):
+        Appointment.objects.create(
+            client=self.user,
+            worker=self.workers[1],
+            service=self.service,
+            scheduled_for=datetime.combine(self.monday, time(8))
+        )
+        items = [
+            self.item(self.workers[0], 8),
+            self.item(self.workers[0], 8, 30),
+            self.item(self.workers[0], 11, 30),
+            self.item(self.workers[1], 8, 20),
+            self.item(self.workers[1], 9),
+        ]
+
+        response = self.client.post(self.url, {'appointments': items}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [bool(errors) for errors in response.data['appointments']],
+            [True, True, True, True, False]
+        )
+        self.assertEqual(Appointment.objects.filter(client=self.user).count(), 1)
+
+
+class AppointmentSeriesAPIViewTests(APITestCase):
+    """
+    Provides tests for recurring appointments endpoints.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        worker_user = User.objects.create_user(
+            username='username2',
+            email='testmail2@mail.com',
+            password='testpass2'
+        )
+        self.worker = Worker.objects.create(profile=worker_user)
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        self.worker.services.add(self.service)
+        location = Location.objects.create(
+            city='City',
+            street='Street',
+            street_number='100'
+        )
+        Schedule.objects.create(
+            location=location,
+            worker=self.worker,
+            day_of_week=calendar.MONDAY,
+            start_time=time(8),
+            end_time=time(12)
+        )
+
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.starts_at = datetime.combine(self.monday, time(9))
+        self.client.force_authenticate(self.user)
+
+    def create_series(self, **data):
+        url = reverse('client_api:series_create', kwargs={'worker_id': self.worker.id})
+        data.setdefault('service', self.service.id)
+        data.setdefault('starts_at', self.starts_at.strftime('%d-%m-%Y %H:%M:%S'))
+        data.setdefault('frequency', 'WEEKLY')
+        return self.client.post(url, data, format='json')
+
+    def get_occurrences(self, series_id, weeks):
+        url = reverse('client_api:series_occurrences', kwargs={'series_id': series_id})
+        params = {
+            'lower_date': self.monday.strftime('%d-%m-%Y'),
+            'upper_date': (self.monday + timedelta(weeks=weeks)).strftime('%d-%m-%Y'),
+        }
+        return [occurrence['scheduled_for'] for occurrence in self.client.get(url, params).data]
+
+    def test_create_series(self):
+        response = self.create_series(count=10)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.get_occurrences(response.data['id'], weeks=4)), 5)
+        self.assertEqual(len(self.get_occurrences(response.data['id'], weeks=20)), 10)
+
+        # occurrences are busy for single appointments
+        with self.assertRaises(ValueError):
+            Appointment.is_apoointment_avaliable(
+                self.worker, self.starts_at + timedelta(weeks=3, minutes=20), self.service
+            )
+
+    def test_occurrences_are_checked_at_once(self):
+        Appointment.objects.create(
+            client=self.user,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=self.starts_at + timedelta(weeks=2, minutes=20)
+        )
+
+        response = self.create_series(until=(self.monday + timedelta(weeks=4)).strftime('%d-%m-%Y'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            list(response.data['occurrences']),
+            [(self.starts_at + timedelta(weeks=2)).strftime('%d-%m-%Y %H:%M:%S')]
+        )
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_skip_and_move_occurrence(self):
+        series_id = self.create_series(count=3).data['id']
+        url = reverse('client_api:series_occurrences', kwargs={'series_id': series_id})
+        first = self.starts_at.strftime('%d-%m-%Y %H:%M:%S')
+        second = (self.starts_at + timedelta(weeks=1)).strftime('%d-%m-%Y %H:%M:%S')
+        moved = (self.starts_at + timedelta(weeks=1, minutes=20)).strftime('%d-%m-%Y %H:%M:%S')
+
+        response = self.client.post(url, {'occurrence': first}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(url, {'occurrence': second, 'scheduled_for': moved}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        occurrences = self.get_occurrences(series_id, weeks=3)
+        self.assertEqual(len(occurrences), 2)
+        self.assertEqual(occurrences[0], moved)
+
+    def test_occurrences_bad_range(self):
+        url = reverse('client_api:series_occurrences', kwargs={'series_id': self.create_series(count=3).data['id']})
+
+        for lower_date, upper_date in ((self.monday + timedelta(days=1), self.monday),
+                                       (self.monday, self.monday + timedelta(days=366))):
+            response = self.client.get(url, {'lower_date': lower_date.strftime('%d-%m-%Y'),
+                                             'upper_date': upper_date.strftime('%d-%m-%Y')})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url, {'lower_date': 'x'}).status_code, 400)
+
+
+
+class AppointmentFeedAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `client_api.AppointmentFeedAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        worker_user = User.objects.create_user(
+            username='worker',
+            email='worker@mail.com',
+            password='testpass2'
+        )
+        worker = Worker.objects.create(profile=worker_user)
+        service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        Appointment.objects.create(
+            client=self.user,
+            worker=worker,
+            service=service,
+            scheduled_for=datetime.combine(date.today() + timedelta(days=1), time(9))
+        )
+        self.url = reverse('client_api:appointment_feed')
+    
+    def test_feed_by_token(self):
+        self.client.force_authenticate(self.user)
+        feed_url = self.client.get(reverse('client_api:appointment_feed_url')).data['url']
+        self.client.force_authenticate(None)
+        
+        response = self.client.get(feed_url)
+        content = b''.join(response.streaming_content).decode()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+        self.assertIn('DESCRIPTION:Worker: worker\r\n', content)
+        self.assertEqual(self.client.get(feed_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+    
+    def test_revoke_token(self):
+        self.client.force_authenticate(self.user)
+        feed_url = self.client.get(reverse('client_api:appointment_feed_url')).data['url']
+        new_feed_url = self.client.post(reverse('client_api:appointment_feed_url')).data['url']
+        self.client.force_authenticate(None)
+        
+        self.assertEqual(self.client.get(feed_url).status_code, 401)
+        self.assertEqual(self.client.get(new_feed_url).status_code, 200)
+    
+    def test_feed_requires_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class AsyncAPIViewTests(APITransactionTestCase):
+    """
+    Checks, that async variants of read endpoints respond the same way as sync ones.
+    Their queries run in other threads, so data must be committed.
+    """
+    available_apps = ['django.contrib.contenttypes', 'django.contrib.auth', 'specialist_api', 'client_api']
+    
+    def setUp(self):
+        cache.clear()
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=30)
+        )
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.workers = []
+        
+        for i in range(6):
+            user = User.objects.create_user(
+                username=f'username{i}',
+                email=f'testmail{i}@mail.com',
+                password='testpass1'
+            )
+            worker = Worker.objects.create(profile=user, proffession='barber')
+            worker.services.add(self.service)
+            Schedule.objects.create(
+                location=Location.objects.create(city='City', street='Street', street_number=str(i)),
+                worker=worker,
+                day_of_week=calendar.MONDAY,
+                start_time=time(8 + i % 3, 10 * i),
+                end_time=time(14)
+            )
+            self.workers.append(worker)
+        
+        for i in range(3):
+            Appointment.objects.create(
+                client=self.workers[5].profile,
+                worker=self.workers[i],
+                service=self.service,
+                scheduled_for=datetime.combine(self.monday, time(11, 10 * i))
+            )
+        self.client.force_authenticate(self.workers[5].profile)
+    
+    def assertSameResponses(self, name, params=None, **kwargs):
+        sync_response = self.client.get(reverse(f'client_api:{name}', kwargs=kwargs), params)
+        async_response = self.client.get(reverse(f'client_api:async_{name}', kwargs=kwargs), params)
+        
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Pagination links differ by the path only
+        self.assertEqual(json.loads(async_response.content.decode().replace('/async/', '/')), sync_response.json())
+        return async_response
+    
+    def test_workers(self):
+        response = self.assertSameResponses('workers', {'weekday': '0', 'time_to': '09:00'})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertSameResponses('workers', {'weekday': '7'})
+    
+    def test_available_slots(self):
+        params = {'service': self.service.id, 'lower_date': self.monday.strftime('%d-%m-%Y')}
+        response = self.assertSameResponses('available_slots', params, worker_id=self.workers[0].id)
+        
+        self.assertTrue(response.json()['slots'])
+        self.assertSameResponses('available_slots', {**params, 'service': 0}, worker_id=self.workers[0].id)
+    
+    def test_earliest_slots(self):
+        params = {'service': self.service.id, 'lower_date': self.monday.strftime('%d-%m-%Y'), 'limit': 100}
+        response = self.assertSameResponses('earliest_slots', params)
+        
+        self.assertEqual(len({slot['worker'] for slot in response.json()['slots']}), 6)
+        self.assertSameResponses('earliest_slots', {**params, 'limit': 0})
+        
+        # The sync view ignores `fan_out`
+        self.assertSameResponses('earliest_slots', {**params, 'fan_out': 4})
+        self.assertSameResponses('earliest_slots', {**params, 'fan_out': 4, 'service': 0})
+        
+        for fan_out in (0, AsyncEarliestSlotsAPIView.max_fan_out + 1):
+            response = self.client.get(reverse('client_api:async_earliest_slots'), {**params, 'fan_out': fan_out})
+            self.assertEqual(response.status_code, 400)
+    
+    def test_appointments(self):
+        response = self.assertSameResponses('appointments', {'page_size': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        
+        self.client.force_authenticate(None)
+        self.assertSameResponses('appointments')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Checks budgets of SQL queries of client endpoints, which must not
+    depend on the number of appointments, workers or schedules.
+    """
+    query_budgets = {
+        # count, page of workers, their services and schedules
+        'workers': 4,
+        # worker, service, schedules, appointments and series
+        'available_slots': 5,
+        # service, schedules, then appointments and series for each chunk of days,
+        # which double in length, so there are at most 3 of them in a week
+        'earliest_slots': 8,
+        # client's page
+        'appointments': 1,
+        # worker, savepoint of the view, service, lock of the worker, schedules,
+        # appointments, series, savepoint, insert, release, release of the view
+        'appointment_create': 11,
+        # savepoint of the view, workers, services, lock of workers, schedules,
+        # appointments, series, savepoint, insert, release, release of the view
+        'appointment_batch_create': 11,
+    }
+    
+    def setUp(self):
+        cache.clear()
+    
+    def get_busiest(self, model, field):
+        return (model.objects.annotate(appointment_count=Count(field))
+                .order_by('-appointment_count', 'id').first())
+    
+    def get_endpoint(self, name, get_params=dict, **kwargs):
+        def setup():
+            self.client.force_authenticate(self.get_busiest(User, 'appointment'))
+            url = reverse(f'client_api:{name}', kwargs={key: get() for key, get in kwargs.items()})
+            params = get_params()
+            return lambda: self.assertEqual(self.client.get(url, params).status_code, 200)
+        return setup
+    
+    def get_slot_params(self):
+        worker = self.get_busiest(Worker, 'appointment')
+        return {
+            'service': worker.services.order_by('id').first().id,
+            'lower_date': DATASET_START.strftime('%d-%m-%Y'),
+            'upper_date': (DATASET_START + timedelta(days=6)).strftime('%d-%m-%Y'),
+        }
+    
+    def pop_appointments(self, count):
+        """Deletes first appointments of `count` busiest workers and :returns: their data to book them again."""
+        workers = Worker.objects.annotate(appointment_count=Count('appointment')).order_by('-appointment_count', 'id')
+        items = []
+        for worker in workers[:count]:
+            appointment = Appointment.objects.filter(worker=worker).order_by('scheduled_for').first()
+            appointment.delete()
+            items.append({
+                'worker': worker.id,
+                'service': appointment.service_id,
+                'scheduled_for': appointment.scheduled_for.strftime('%d-%m-%Y %H:%M:%S'),
+            })
+        return items
+    
+    def test_workers(self):
+        self.assertQueryBudget('workers', self.get_endpoint('workers', lambda: {'page_size': 50}))
+    
+    def test_available_slots(self):
+        worker_id = lambda: self.get_busiest(Worker, 'appointment').id
+        self.assertQueryBudget('available_slots',
+                               self.get_endpoint('available_slots', self.get_slot_params, worker_id=worker_id))
+    
+    def test_earliest_slots(self):
+        self.assertQueryBudget('earliest_slots', self.get_endpoint('earliest_slots', self.get_slot_params))
+    
+    def test_appointments(self):
+        self.assertQueryBudget('appointments', self.get_endpoint('appointments', lambda: {'page_size': 50}))
+    
+    def test_appointment_create(self):
+        def setup():
+            item = self.pop_appointments(1)[0]
+            self.client.force_authenticate(User.objects.filter(worker_profile__isnull=True).first())
+            url = reverse('client_api:appointment_create', kwargs={'worker_id': item.pop('worker')})
+            return lambda: self.assertEqual(self.client.post(url, item, format='json').status_code, 201)
+        self.assertQueryBudget('appointment_create', setup)
+    
+    def test_appointment_batch_create(self):
+        def setup():
+            items = self.pop_appointments(2)
+            self.client.force_authenticate(User.objects.filter(worker_profile__isnull=True).first())
+            url = reverse('client_api:appointment_batch_create')
+            return lambda: self.assertEqual(
+                self.client.post(url, {'appointments': items}, format='json').status_code, 201
+            )
+        self.assertQueryBudget('appointment_batch_create', setup)
+
+
+class BookingLockTests(APITransactionTestCase):
+    """
+    Checks, that concurrent bookings of the same time, which aren't covered by
+    the exclusion constraint because of series, don't both succeed.
+    """
+    available_apps = ['django.contrib.contenttypes', 'django.contrib.auth', 'specialist_api', 'client_api']
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='username1', email='testmail1@mail.com',
+                                             password='testpass1')
+        worker_user = User.objects.create_user(username='username2', email='testmail2@mail.com',
+                                               password='testpass2')
+        self.worker = Worker.objects.create(profile=worker_user)
+        self.service = Service.objects.create(name='service_name', price=120, currency='USD',
+                                              duration=timedelta(minutes=40))
+        self.worker.services.add(self.service)
+        Schedule.objects.create(
+            location=Location.objects.create(city='City', street='Street', street_number='100'),
+            worker=self.worker,
+            day_of_week=calendar.MONDAY,
+            start_time=time(8),
+            end_time=time(12)
+        )
+        
+        today = date.today()
+        starts_at = datetime.combine(today + timedelta(days=7 - today.weekday()), time(9))
+        self.series = (reverse('client_api:series_create', kwargs={'worker_id': self.worker.id}),
+                       {'service': self.service.id, 'starts_at': starts_at.strftime('%d-%m-%Y %H:%M:%S'),
+                        'frequency': 'WEEKLY', 'count': 3})
+        self.single = (reverse('client_api:appointment_create', kwargs={'worker_id': self.worker.id}),
+                       {'service': self.service.id, 'scheduled_for': starts_at.strftime('%d-%m-%Y %H:%M:%S')})
+    
+    def post_concurrently(self, *requests):
+        """
+        Sends requests from threads, each of which waits for the others after its
+        availability check, so without a lock all of them pass it before any saves.
+        :returns: sorted status codes.
+        """
+        barrier = threading.Barrier(len(requests))
+        statuses = []
+        
+        def wait_after(check):
+            def wrapper(*args, **kwargs):
+                result = check(*args, **kwargs)
+                try:
+                    barrier.wait(timeout=1)
+                except threading.BrokenBarrierError:
+                    pass
+                return result
+            return wrapper
+        
+        def post(url, data):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                statuses.append(client.post(url, data, format='json').status_code)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=post, args=request) for request in requests]
+        with mock.patch.object(AppointmentBatch, 'get_errors', wait_after(AppointmentBatch.get_errors)), \
+                mock.patch.object(Appointment, 'is_apoointment_avaliable',
+                                  staticmethod(wait_after(Appointment.is_apoointment_avaliable))):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        return sorted(statuses)
+    
+    def test_series_and_series(self):
+        self.assertEqual(self.post_concurrently(self.series, self.series), [201, 400])
+        self.assertEqual(AppointmentSeries.objects.count(), 1)
+    
+    def test_series_and_single(self):
+        self.assertEqual(self.post_concurrently(self.series, self.single), [201, 400])
+        self.assertEqual(AppointmentSeries.objects.count() + Appointment.objects.count(), 1)
@@ -2,7 +2,12 @@ from django.urls import path
 
 from .views import (
     RegisterAPIView, WorkerListAPIView, AppointmentCreateAPIView, 
-    AppointmentListAPIView, AppointmentDetailAPIView
+    AppointmentListAPIView, AppointmentDetailAPIView, AvailableSlotsAPIView,
+    AppointmentBatchCreateAPIView, AppointmentSeriesCreateAPIView,
+    AppointmentSeriesDetailAPIView, AppointmentSeriesOccurrencesAPIView,
+    EarliestSlotsAPIView, AvailabilityHeatmapAPIView, AppointmentFeedAPIView,
+    AppointmentFeedUrlAPIView, AsyncWorkerListAPIView, AsyncAvailableSlotsAPIView,
+    AsyncEarliestSlotsAPIView, AsyncAppointmentListAPIView
 )
 
 
@@ -11,7 +16,24 @@ urlpatterns = [
     path('register/', RegisterAPIView.as_view(), name='register'),
     path('workers/', WorkerListAPIView.as_view(), name='workers'),
     path('appointment/worker/<int:worker_id>/', AppointmentCreateAPIView.as_view(), name='appointment_create'),
+    path('appointment/batch/', AppointmentBatchCreateAPIView.as_view(), name='appointment_batch_create'),
+    path('appointment/worker/<int:worker_id>/slots/', AvailableSlotsAPIView.as_view(), name='available_slots'),
+    path('appointment/worker/<int:worker_id>/heatmap/', AvailabilityHeatmapAPIView.as_view(),
+         name='availability_heatmap'),
+    path('appointment/earliest/', EarliestSlotsAPIView.as_view(), name='earliest_slots'),
     path('appointment/<int:appointment_id>/', AppointmentDetailAPIView.as_view(), name='appointment_detail'),
     path('appointments/', AppointmentListAPIView.as_view(), name='appointments'),
+    path('appointments/feed.ics', AppointmentFeedAPIView.as_view(), name='appointment_feed'),
+    path('appointments/feed/', AppointmentFeedUrlAPIView.as_view(), name='appointment_feed_url'),
+    path('appointment/series/worker/<int:worker_id>/', AppointmentSeriesCreateAPIView.as_view(), name='series_create'),
+    path('appointment/series/<int:series_id>/', AppointmentSeriesDetailAPIView.as_view(), name='series_detail'),
+    path('appointment/series/<int:series_id>/occurrences/', AppointmentSeriesOccurrencesAPIView.as_view(),
+         name='series_occurrences'),
+    # Async variants of read endpoints for ASGI deployments
+    path('async/workers/', AsyncWorkerListAPIView.as_view(), name='async_workers'),
+    path('async/appointment/worker/<int:worker_id>/slots/', AsyncAvailableSlotsAPIView.as_view(),
+         name='async_available_slots'),
+    path('async/appointment/earliest/', AsyncEarliestSlotsAPIView.as_view(), name='async_earliest_slots'),
+    path('async/appointments/', AsyncAppointmentListAPIView.as_view(), name='async_appointments'),
 ]
 
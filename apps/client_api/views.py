@@ -1,28 +1,50 @@
+import asyncio
+import calendar
+import heapq
+from collections import defaultdict
+from itertools import islice
+
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.generics import (
-    CreateAPIView, RetrieveUpdateDestroyAPIView
+    CreateAPIView, RetrieveUpdateDestroyAPIView, RetrieveDestroyAPIView
 )
 from rest_framework.permissions import AllowAny
 
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
-from django.utils.timezone import datetime
+from django.urls import reverse
+from django.utils.timezone import datetime, timedelta
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
 
 from specialist_api.models import (
-    Worker, Appointment, Service
+    Worker, Appointment, Service, Schedule, AppointmentSeries, SeriesException
 )
 from specialist_api.serializers import (
-    WorkerSerializer, AppointmentSerializer
+    WorkerSerializer, AppointmentSerializer, AppointmentBatchSerializer,
+    AppointmentSeriesSerializer, SeriesExceptionSerializer
+)
+from specialist_api.async_views import AsyncAPIViewMixin, run_in_thread
+from specialist_api.availability import WorkerCalendar, iter_dates, iter_earliest_starts
+from specialist_api.bitmaps import SLOT, get_day_stats
+from specialist_api.feeds import AppointmentFeedMixin, get_feed_owner, get_feed_token, revoke_feed_tokens
+from specialist_api.permissions import HasFeedToken
+from specialist_api import response_cache, routers, versions
+from specialist_api.pagination import (
+    AppointmentCursorPagination, WorkerCursorPagination
 )
 from .serializers import RegisterSerializer
 
 
 User = get_user_model()
 DATETIME_FORMAT = '%d-%m-%Y %H:%M:%S'
+DATE_FORMAT = '%d-%m-%Y'
+MONTH_FORMAT = '%m-%Y'
+TIME_FORMAT = '%H:%M'
 
 
 class RegisterAPIView(CreateAPIView):
@@ -38,62 +60,128 @@ class WorkerListAPIView(APIView):
     """
     get:
     Returns a list of all workers, which can be filtered by
-    specific_date, proffession and/or service_name.
+    dates, weekdays, time window and/or proffession. Supports conditional
+    requests with `If-None-Match` and `If-Modified-Since` headers.
+    
+    The list is the same for every caller, so pages are cached under
+    normalized filters and the directory version, which changes with
+    any change of workers, their schedules and services. Pagination
+    links are built from the url of each request, not cached.
     """
     permission_classes = [AllowAny]
     model = Worker
     serializer_class = WorkerSerializer
+    pagination_class = WorkerCursorPagination
     
     def get(self, request, **kwargs):
+        version = versions.get_version((versions.DIRECTORY, versions.DIRECTORY_ID))
+        not_modified = versions.get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+        
         try:
-            queryset = self.filter_queryset(self.get_queryset())
+            filters = self.get_filters()
         except ValueError as e:
-            content = {'date': e.args[0]}
+            content = {'query params': e.args[0]}
             return Response(content, status.HTTP_400_BAD_REQUEST)
-        serializer = self.serializer_class(queryset, many=True)
         
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        key = response_cache.get_key(
+            f'workers:{version[0]}',
+            sorted(filters.items()),
+            request.query_params.get(paginator.cursor_query_param),
+            request.query_params.get(paginator.page_size_query_param),
+        )
+        
+        def build():
+            # Replicas may not have the change, which the version is given for, yet
+            with routers.use_primary_if_changed(version[1]):
+                page = paginator.paginate_queryset(self.filter_queryset(self.get_queryset(), filters),
+                                                   request, view=self)
+                serializer = self.serializer_class(page, many=True)
+                return paginator.get_cacheable_data(serializer.data)
+        
+        response = paginator.get_cached_response(request, response_cache.get_or_build(key, build))
+        return versions.set_version_headers(response, version)
     
     def get_queryset(self):
-        return Worker.objects.all()
-            
-    def filter_queryset(self, queryset):
+        return Worker.objects.with_listing_data()
+    
+    def get_filters(self):
         """
-        Returns new queryset based on given filter params.
+        Returns normalized filter params and :raise: ValueError if they are invalid.
+        Params, which select the same workers, give equal filters.
         
         All possible params:
-            - date (date): a date in format `dd-mm-yyyy`
+            - date (date): a date in format `dd-mm-yyyy`, several dates can be separated by commas
+            - weekday (int): a day of week from 0 (Monday) to 6 (Sunday),
+              several days can be separated by commas
+            - time_from (time): a bottom bound of time window in format `hh:mm`
+            - time_to (time): a top bound of time window in format `hh:mm`
             - proffession (str): a worker's proffession
         """
-        DATE_FORMAT = '%d-%m-%Y'
-        
-        filtered_queryset = queryset
-        filter_date =  self.request.query_params.get('date')
+        filter_dates = self.request.query_params.get('date')
+        filter_weekdays = self.request.query_params.get('weekday')
+        time_from = self.request.query_params.get('time_from')
+        time_to = self.request.query_params.get('time_to')
         proffession = self.request.query_params.get('proffession')
-        weekday = datetime.strptime(filter_date, DATE_FORMAT).weekday() if filter_date else None
         
-        if (weekday is None) and (proffession is None):
-            return queryset
+        weekdays = set()
+        if filter_dates:
+            weekdays.update(datetime.strptime(filter_date, DATE_FORMAT).weekday()
+                            for filter_date in filter_dates.split(','))
+        if filter_weekdays:
+            weekdays.update(self.parse_weekday(weekday) for weekday in filter_weekdays.split(','))
+        
+        time_from = datetime.strptime(time_from, TIME_FORMAT).time() if time_from else None
+        time_to = datetime.strptime(time_to, TIME_FORMAT).time() if time_to else None
+        if time_from is not None and time_to is not None and time_from >= time_to:
+            raise ValueError('time_from must be less than time_to.')
+        
+        return {
+            'weekdays': tuple(sorted(weekdays)),
+            'time_from': time_from,
+            'time_to': time_to,
+            'proffession': proffession.lower() if proffession is not None else None,
+        }
+            
+    def filter_queryset(self, queryset, filters):
+        """Returns new queryset based on given filters from `get_filters`."""
+        filtered_queryset = queryset
+        weekdays = filters['weekdays']
+        time_from = filters['time_from']
+        time_to = filters['time_to']
         
-        if proffession is not None:
-            filtered_queryset = self.filter_by_proffession(filtered_queryset, proffession)
-        if weekday is not None:
-            filtered_queryset = self.filter_by_weekday(filtered_queryset, weekday)
+        if filters['proffession'] is not None:
+            filtered_queryset = self.filter_by_proffession(filtered_queryset, filters['proffession'])
+        if weekdays or (time_from is not None) or (time_to is not None):
+            filtered_queryset = self.filter_by_schedule(filtered_queryset, weekdays, time_from, time_to)
         
         return filtered_queryset
     
-    def filter_by_weekday(self, queryset, weekday):
-        filtered_queryset = []
+    @staticmethod
+    def parse_weekday(value):
+        weekday = int(value)
+        if not (calendar.MONDAY <= weekday <= calendar.SUNDAY):
+            raise ValueError('weekday must be between 0 and 6')
         
-        for worker in queryset:
-            schedule = worker.get_worker_schedule()
-            
-            for record in schedule:
-                if record.day_of_week == weekday:
-                    filtered_queryset.append(worker)
-                    break
+        return weekday
+    
+    def filter_by_schedule(self, queryset, weekdays, time_from=None, time_to=None):
+        """
+        Leaves only workers, who work at any of given weekdays at some
+        time within the window from time_from to time_to.
+        """
+        schedules = Schedule.objects.filter(worker=OuterRef('pk'))
         
-        return filtered_queryset
+        if weekdays:
+            schedules = schedules.filter(day_of_week__in=weekdays)
+        if time_from is not None:
+            schedules = schedules.filter(end_time__gt=time_from)
+        if time_to is not None:
+            schedules = schedules.filter(start_time__lt=time_to)
+        
+        return queryset.filter(Exists(schedules))
     
     def filter_by_proffession(self, queryset, proffession):
         return queryset.filter(proffession__iexact=proffession)
@@ -109,40 +197,450 @@ class AppointmentCreateAPIView(APIView):
     serializer_class = AppointmentSerializer
     
     def post(self, request, worker_id):
+        worker = get_object_or_404(Worker, id=worker_id)
         context = {
-            'worker_profile_id': get_object_or_404(Worker, id=worker_id).profile.id
+            'worker_profile_id': worker.profile_id
         }
         
         data = request.data.copy()
-        data['worker'] = worker_id
-        data['client'] = request.user.id
+        data['worker'] = worker
+        data['client'] = request.user
         data['scheduled_for'] = datetime.strptime(data['scheduled_for'], DATETIME_FORMAT)
         
-        serializer = self.serializer_class(data=data, context=context)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Workers stay locked from the availability check until the appointment is saved
+        with transaction.atomic():
+            serializer = self.serializer_class(data=data, context=context)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class AppointmentBatchCreateAPIView(APIView):
+    """
+    post:
+    Creates many appointments for current authenticated user at once.
+    Either all of them are created or none, in which case errors
+    are returned for each appointment.
+    """
+    permission_classes = [IsAuthenticated]
+    model = Appointment
+    serializer_class = AppointmentBatchSerializer
+    
+    def post(self, request):
+        with transaction.atomic():
+            serializer = self.serializer_class(data=request.data, context={'client': request.user})
+            serializer.is_valid(raise_exception=True)
+            appointments = serializer.save()
+        
+        return Response(AppointmentSerializer(appointments, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class AvailableSlotsAPIView(APIView):
+    """
+    get:
+    Returns all start times, at which given service can be appointed
+    to given worker within given date range.
+    """
+    permission_classes = [AllowAny]
+    model = Appointment
+    default_step = 15
+    max_days = 31
+    
+    def get(self, request, worker_id):
+        worker = get_object_or_404(Worker, id=worker_id)
+        
+        try:
+            params = self.get_params()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        service = get_object_or_404(Service, id=params['service_id'], worker=worker)
+        calendar = WorkerCalendar(worker, params['lower_date'], params['upper_date'])
+        start_times = calendar.get_start_times(service.duration, params['step'], after=datetime.now())
+        
+        content = {
+            'worker': worker.id,
+            'service': service.id,
+            'slots': [start_time.strftime(DATETIME_FORMAT) for start_time in start_times]
+        }
+        return Response(content)
+    
+    def get_params(self):
+        """
+        Returns parsed query params and :raise: ValueError if they are invalid.
+        
+        All possible params:
+            - service (int): an id of the service to appoint
+            - lower_date (date): a bottom bound of date range in format `dd-mm-yyyy`
+            - upper_date (date): a top bound of date range, equals lower_date by default
+            - step (int): minutes between two neighbouring start times
+        """
+        service_id = self.request.query_params.get('service')
+        lower_date = self.request.query_params.get('lower_date')
+        upper_date = self.request.query_params.get('upper_date', lower_date)
+        step = self.request.query_params.get('step', self.default_step)
+        
+        if (service_id is None) or (lower_date is None):
+            raise ValueError('service and lower_date params are required.')
+        
+        lower_date = datetime.strptime(lower_date, DATE_FORMAT).date()
+        upper_date = datetime.strptime(upper_date, DATE_FORMAT).date()
+        step = int(step)
+        
+        if lower_date > upper_date:
+            raise ValueError('lower_date must not be greater than upper_date.')
+        if (upper_date - lower_date).days >= self.max_days:
+            raise ValueError(f'Date range must not be longer than {self.max_days} days.')
+        if step <= 0:
+            raise ValueError('step must be a positive number of minutes.')
+        
+        return {
+            'service_id': int(service_id),
+            'lower_date': lower_date,
+            'upper_date': upper_date,
+            'step': timedelta(minutes=step)
+        }
+
+
+class AvailabilityHeatmapAPIView(APIView):
+    """
+    get:
+    Returns free minutes and a number of start times, at which given service
+    can be appointed to given worker, for every day of given month.
+    """
+    permission_classes = [AllowAny]
+    model = Appointment
+    default_step = 15
+    max_months = 12
+    
+    def get(self, request, worker_id):
+        worker = get_object_or_404(Worker, id=worker_id)
+        
+        try:
+            params = self.get_params()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        service = get_object_or_404(Service, id=params['service_id'], worker=worker)
+        month = params['month']
+        days = list(iter_dates(month, month.replace(day=calendar.monthrange(month.year, month.month)[1])))
+        worker_calendar = WorkerCalendar(worker, days[0], days[-1])
+        
+        now = datetime.now()
+        stats = get_day_stats([worker_calendar.get_bitmap(day, after=now) for day in days],
+                              service.duration, params['step'])
+        
+        content = {
+            'worker': worker.id,
+            'service': service.id,
+            'month': month.strftime(MONTH_FORMAT),
+            'days': [
+                {
+                    'date': day.strftime(DATE_FORMAT),
+                    'free_minutes': free_slots * SLOT // timedelta(minutes=1),
+                    'slots': start_count
+                }
+                for day, (free_slots, start_count) in zip(days, stats)
+            ]
+        }
+        return Response(content)
+    
+    def get_params(self):
+        """
+        Returns parsed query params and :raise: ValueError if they are invalid.
+        
+        All possible params:
+            - service (int): an id of the service to appoint
+            - month (date): a month in format `mm-yyyy`, not further than `max_months`
+              from the current one, which is the default
+            - step (int): minutes between two neighbouring start times
+        """
+        service_id = self.request.query_params.get('service')
+        month = self.request.query_params.get('month')
+        step = int(self.request.query_params.get('step', self.default_step))
+        
+        if service_id is None:
+            raise ValueError('service param is required.')
+        if step <= 0:
+            raise ValueError('step must be a positive number of minutes.')
+        
+        today = datetime.now().date()
+        month = datetime.strptime(month, MONTH_FORMAT).date() if month else today.replace(day=1)
+        if abs((month.year - today.year) * 12 + month.month - today.month) > self.max_months:
+            raise ValueError(f'month must not be further than {self.max_months} months from the current one.')
+        
+        return {
+            'service_id': int(service_id),
+            'month': month,
+            'step': timedelta(minutes=step)
+        }
+
+
+class EarliestSlotsAPIView(APIView):
+    """
+    get:
+    Returns the earliest start times, at which given service can be
+    appointed to any of workers, who provide it, with the worker of each one.
+    """
+    permission_classes = [AllowAny]
+    model = Schedule
+    default_step = 15
+    default_limit = 10
+    max_limit = 100
+    max_days = 31
+    
+    def get(self, request):
+        try:
+            params = self.get_params()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        service = get_object_or_404(Service, id=params['service_id'])
+        schedules = self.get_queryset(service, params['location_id'], params['city'])
+        
+        return Response(self.get_content(service, self.get_slots(schedules, service, params, datetime.now())))
+    
+    def get_slots(self, schedules, service, params, after):
+        """:returns: list of `limit` earliest (start, worker id) tuples of given schedules."""
+        starts = iter_earliest_starts(
+            schedules,
+            service.duration,
+            params['lower_date'],
+            params['upper_date'],
+            params['step'],
+            after=after,
+            time_from=params['time_from'],
+            time_to=params['time_to']
+        )
+        return list(islice(starts, params['limit']))
+    
+    def get_content(self, service, slots):
+        return {
+            'service': service.id,
+            'slots': [{'worker': worker_id, 'start': start_time.strftime(DATETIME_FORMAT)}
+                      for start_time, worker_id in slots]
+        }
+    
+    def get_queryset(self, service, location_id=None, city=None):
+        """:returns: (worker id, day of week, start time, end time) of workers, who provide the service."""
+        queryset = self.model.objects.filter(worker__services=service)
+        
+        if location_id is not None:
+            queryset = queryset.filter(location_id=location_id)
+        if city is not None:
+            queryset = queryset.filter(location__city__iexact=city)
+        
+        return queryset.values_list('worker_id', 'day_of_week', 'start_time', 'end_time')
+    
+    def get_params(self):
+        """
+        Returns parsed query params and :raise: ValueError if they are invalid.
+        
+        All possible params:
+            - service (int): an id of the service to appoint
+            - location (int): an id of the location, where the service is provided
+            - city (str): a city, where the service is provided
+            - lower_date (date): a bottom bound of date range in format `dd-mm-yyyy`, today by default
+            - upper_date (date): a top bound of date range, `max_days` from lower_date by default
+            - time_from (time): a bottom bound of daily time window in format `hh:mm`
+            - time_to (time): a top bound of daily time window in format `hh:mm`
+            - step (int): minutes between two neighbouring start times
+            - limit (int): a number of start times to return
+        """
+        query_params = self.request.query_params
+        service_id = query_params.get('service')
+        location_id = query_params.get('location')
+        lower_date = query_params.get('lower_date')
+        upper_date = query_params.get('upper_date')
+        time_from = query_params.get('time_from')
+        time_to = query_params.get('time_to')
+        step = int(query_params.get('step', self.default_step))
+        limit = int(query_params.get('limit', self.default_limit))
+        
+        if service_id is None:
+            raise ValueError('service param is required.')
+        
+        lower_date = datetime.strptime(lower_date, DATE_FORMAT).date() if lower_date else datetime.now().date()
+        upper_date = (datetime.strptime(upper_date, DATE_FORMAT).date() if upper_date
+                      else lower_date + timedelta(days=self.max_days - 1))
+        
+        if lower_date > upper_date:
+            raise ValueError('lower_date must not be greater than upper_date.')
+        if (upper_date - lower_date).days >= self.max_days:
+            raise ValueError(f'Date range must not be longer than {self.max_days} days.')
+        if step <= 0:
+            raise ValueError('step must be a positive number of minutes.')
+        if not (0 < limit <= self.max_limit):
+            raise ValueError(f'limit must be between 1 and {self.max_limit}.')
+        
+        return {
+            'service_id': int(service_id),
+            'location_id': int(location_id) if location_id else None,
+            'city': query_params.get('city') or None,
+            'lower_date': lower_date,
+            'upper_date': upper_date,
+            'time_from': datetime.strptime(time_from, TIME_FORMAT).time() if time_from else None,
+            'time_to': datetime.strptime(time_to, TIME_FORMAT).time() if time_to else None,
+            'step': timedelta(minutes=step),
+            'limit': limit
+        }
+
+
 class AppointmentListAPIView(APIView):
     """
     get:
     Return a list of all appointments for current authenticated user.
+    Supports conditional requests with `If-None-Match` and `If-Modified-Since` headers.
     """
     permission_classes = [IsAuthenticated]
     model = Appointment
     serializer_class = AppointmentSerializer
+    pagination_class = AppointmentCursorPagination
     
     def get(self, request):
-        appointments = self.get_queryset()
-        serializer = self.serializer_class(appointments, many=True)
-        return Response(serializer.data)
+        version = versions.get_version((versions.CLIENT, request.user.id))
+        not_modified = versions.get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+        
+        paginator = self.pagination_class()
+        with routers.use_primary_if_changed(version[1]):
+            appointments = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+            serializer = self.serializer_class(appointments, many=True)
+            data = serializer.data
+        return versions.set_version_headers(paginator.get_paginated_response(data), version)
     
     def get_queryset(self):
         return self.model.objects.filter(client=self.request.user)
 
 
+class AsyncWorkerListAPIView(AsyncAPIViewMixin, WorkerListAPIView):
+    """
+    get:
+    Async variant of `WorkerListAPIView` for ASGI deployments.
+    """
+
+
+class AsyncAvailableSlotsAPIView(AsyncAPIViewMixin, AvailableSlotsAPIView):
+    """
+    get:
+    Async variant of `AvailableSlotsAPIView` for ASGI deployments.
+    """
+
+
+class AsyncEarliestSlotsAPIView(AsyncAPIViewMixin, EarliestSlotsAPIView):
+    """
+    get:
+    Async variant of `EarliestSlotsAPIView` for ASGI deployments.
+    
+    If `fan_out` param is greater than 1, workers are split into that many groups,
+    which are searched concurrently, and the earliest start times of the groups
+    are merged. Each group takes a thread and a connection of its own, so it only
+    pays off when database round trips are slow compared to the search itself.
+    """
+    default_fan_out = 1
+    max_fan_out = 8
+    
+    async def get(self, request):
+        try:
+            fan_out = self.get_fan_out()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        if fan_out <= 1:
+            return await run_in_thread(super().get, request)
+        
+        try:
+            params = self.get_params()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        service = await run_in_thread(get_object_or_404, Service, id=params['service_id'])
+        schedules = await run_in_thread(list, self.get_queryset(service, params['location_id'], params['city']))
+        
+        groups = defaultdict(list)
+        for schedule in schedules:
+            groups[schedule[0] % fan_out].append(schedule)
+        
+        after = datetime.now()
+        group_slots = await asyncio.gather(*(
+            run_in_thread(self.get_slots, group, service, params, after) for group in groups.values()
+        ))
+        
+        slots = islice(heapq.merge(*group_slots), params['limit'])
+        return Response(self.get_content(service, slots))
+    
+    def get_fan_out(self):
+        """
+        Returns `fan_out` query param, `default_fan_out` if it isn't given,
+        and :raise: ValueError if it is invalid.
+        """
+        fan_out = int(self.request.query_params.get('fan_out', self.default_fan_out))
+        if not (0 < fan_out <= self.max_fan_out):
+            raise ValueError(f'fan_out must be between 1 and {self.max_fan_out}.')
+        
+        return fan_out
+
+
+class AsyncAppointmentListAPIView(AsyncAPIViewMixin, AppointmentListAPIView):
+    """
+    get:
+    Async variant of `AppointmentListAPIView` for ASGI deployments.
+    """
+
+
+class AppointmentFeedAPIView(AppointmentFeedMixin, APIView):
+    """
+    get:
+    Returns appointments and occurrences of recurring appointments of current
+    authenticated user, or of the user from `token` param, as an iCalendar feed.
+    """
+    permission_classes = [IsAuthenticated | HasFeedToken]
+    model = Appointment
+    feed_kind = versions.CLIENT
+    counterpart_field = 'worker__profile__username'
+    counterpart_label = 'Worker'
+    
+    def get(self, request):
+        if request.user.is_authenticated:
+            client_id = request.user.id
+        else:
+            client_id = get_feed_owner(request.query_params['token'], self.feed_kind)
+        
+        return self.get_feed_response(request,
+                                      'My appointments',
+                                      self.model.objects.filter(client_id=client_id),
+                                      AppointmentSeries.objects.filter(client_id=client_id),
+                                      versions.get_version((versions.CLIENT, client_id)))
+
+
+class AppointmentFeedUrlAPIView(APIView):
+    """
+    get:
+    Returns an iCalendar feed url for current authenticated user, which
+    works without logging in, so it can be given to calendar apps.
+    
+    post:
+    Revokes all the feed urls of current authenticated user and returns a new one.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        url = reverse('client_api:appointment_feed')
+        token = get_feed_token(versions.CLIENT, request.user.id)
+        return Response({'url': request.build_absolute_uri(f'{url}?token={token}')})
+    
+    def post(self, request):
+        revoke_feed_tokens(versions.CLIENT, request.user.id)
+        return self.get(request)
+
+
 class AppointmentDetailAPIView(RetrieveUpdateDestroyAPIView):
     """
     retrieve:
@@ -185,9 +683,10 @@ class AppointmentDetailAPIView(RetrieveUpdateDestroyAPIView):
             return Response(content, status.HTTP_400_BAD_REQUEST)
         
         partial = kwargs.pop('partial', False)
-        serializer = self.get_serializer(instance, data=data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        with transaction.atomic():
+            serializer = self.get_serializer(instance, data=data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
 
         return Response(serializer.data)
     
@@ -197,3 +696,138 @@ class AppointmentDetailAPIView(RetrieveUpdateDestroyAPIView):
     def get_object(self):
         appointment_id = self.kwargs.get(self.lookup_url_kwarg)
         return get_object_or_404(self.get_queryset(), id=appointment_id)
+
+
+class AppointmentSeriesCreateAPIView(APIView):
+    """
+    post:
+    Creates a new recurring appointment for current authenticated user
+    to given worker. All the occurrences are checked against worker's
+    schedule and existing appointments.
+    """
+    permission_classes = [IsAuthenticated]
+    model = AppointmentSeries
+    serializer_class = AppointmentSeriesSerializer
+    
+    def post(self, request, worker_id):
+        get_object_or_404(Worker, id=worker_id)
+        
+        data = request.data.copy()
+        data['worker'] = worker_id
+        data['client'] = request.user.id
+        
+        try:
+            data['starts_at'] = datetime.strptime(data['starts_at'], DATETIME_FORMAT)
+            if data.get('until'):
+                data['until'] = datetime.strptime(data['until'], DATE_FORMAT).date()
+        except (KeyError, ValueError) as e:
+            return Response(e.args, status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            serializer = self.serializer_class(data=data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AppointmentSeriesDetailAPIView(RetrieveDestroyAPIView):
+    """
+    retrieve:
+    Return a recurring appointment details.
+    
+    destroy:
+    Delete a recurring appointment with all its occurrences.
+    """
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg = 'series_id'
+    model = AppointmentSeries
+    serializer_class = AppointmentSeriesSerializer
+    
+    def get_queryset(self):
+        return self.model.objects.filter(client=self.request.user)
+    
+    def get_object(self):
+        series_id = self.kwargs.get(self.lookup_url_kwarg)
+        return get_object_or_404(self.get_queryset(), id=series_id)
+
+
+class AppointmentSeriesOccurrencesAPIView(APIView):
+    """
+    get:
+    Returns occurrences of a recurring appointment within given date range.
+    
+    post:
+    Skips an occurrence, or moves it to `scheduled_for` if it is given.
+    """
+    permission_classes = [IsAuthenticated]
+    model = AppointmentSeries
+    serializer_class = SeriesExceptionSerializer
+    max_days = 366
+    
+    def get(self, request, series_id):
+        series = get_object_or_404(self.get_queryset(), id=series_id)
+        
+        try:
+            lower_date, upper_date = self.get_params()
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
+        
+        occurrences = series.get_occurrences(lower_date, upper_date + timedelta(days=1))
+        content = [
+            {
+                'occurrence': occurrence_start.strftime(DATETIME_FORMAT),
+                'scheduled_for': start.strftime(DATETIME_FORMAT),
+                'end_time': end.strftime(DATETIME_FORMAT)
+            }
+            for occurrence_start, start, end in occurrences
+        ]
+        return Response(content)
+    
+    def post(self, request, series_id):
+        series = get_object_or_404(self.get_queryset(), id=series_id)
+        
+        data = request.data.copy()
+        data['series'] = series.id
+        try:
+            data['occurrence_start'] = datetime.strptime(data['occurrence'], DATETIME_FORMAT)
+            if data.get('scheduled_for'):
+                data['scheduled_for'] = datetime.strptime(data['scheduled_for'], DATETIME_FORMAT)
+        except (KeyError, ValueError) as e:
+            return Response(e.args, status.HTTP_400_BAD_REQUEST)
+        
+        instance = SeriesException.objects.filter(
+            series=series, occurrence_start=data['occurrence_start']
+        ).first()
+        serializer = self.serializer_class(instance, data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def get_params(self):
+        """
+        Returns (lower_date, upper_date) datetimes of query params and :raise: ValueError
+        if they are invalid. Both dates are required in format `dd-mm-yyyy`, and
+        the range must not be longer than `max_days`.
+        """
+        try:
+            lower_date = datetime.strptime(self.request.query_params['lower_date'], DATE_FORMAT)
+            upper_date = datetime.strptime(self.request.query_params['upper_date'], DATE_FORMAT)
+        except (KeyError, ValueError):
+            raise ValueError('lower_date and upper_date must be given in format dd-mm-yyyy.')
+        
+        if lower_date > upper_date:
+            raise ValueError('lower_date must not be greater than upper_date.')
+        if (upper_date - lower_date).days >= self.max_days:
+            raise ValueError(f'Date range must not be longer than {self.max_days} days.')
+        
+        return lower_date, upper_date
+    
+    def get_queryset(self):
+        return (self.model.objects
+                    .filter(client=self.request.user)
+                    .select_related('service')
+                    .prefetch_related('exceptions'))
+
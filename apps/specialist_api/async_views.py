@@ -0,0 +1,85 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
+
+
+def _with_connections(func):
+    """Wraps the function to close obsolete connections of the current thread around the call."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Runs sync function, which may query the database, in a thread of the shared pool
+    and :returns: its result.
+
+    Django 4.0 has no async ORM, and sync views under ASGI are run one by one
+    in the single thread-sensitive thread. Functions run here don't wait for it,
+    so queries of concurrent requests overlap. Each thread uses its own connections,
+    which are closed as usual with respect to `CONN_MAX_AGE`.
+    """
+    return await sync_to_async(_with_connections(func), thread_sensitive=False)(*args, **kwargs)
+
+
+class AsyncAPIViewMixin:
+    """
+    Makes an `APIView` a native async view.
+
+    Handlers may be coroutines, which run blocking parts with `run_in_thread`.
+    Sync handlers are run in the pool together with authentication and permission
+    checks, so a request takes a thread only while it queries the database.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            return await self.adispatch(request, *args, **kwargs)
+
+        view.cls = view.view_class = cls
+        view.initkwargs = view.view_initkwargs = initkwargs
+        # Same as DRF does, authentication classes handle CSRF themselves
+        view.csrf_exempt = True
+        return view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """Async counterpart of `APIView.dispatch`."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            handler = self.get_handler(request)
+            if asyncio.iscoroutinefunction(handler):
+                await run_in_thread(self.initial, request, *args, **kwargs)
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await run_in_thread(self.handle_sync, handler, request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def get_handler(self, request):
+        method = request.method.lower()
+        if method in self.http_method_names:
+            return getattr(self, method, self.http_method_not_allowed)
+        return self.http_method_not_allowed
+
+    def handle_sync(self, handler, request, *args, **kwargs):
+        self.initial(request, *args, **kwargs)
+        return handler(request, *args, **kwargs)
+
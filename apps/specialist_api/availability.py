@@ -0,0 +1,282 @@
+import heapq
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+
+from .bitmaps import SLOTS_PER_DAY, DayBitmap, get_mask, to_slot
+from .models import Schedule, Appointment, AppointmentSeries
+from .routers import use_primary
+
+
+# Also bounds how long a day, loaded right before a concurrent
+# change has been committed, can stay in the cache
+CACHE_TIMEOUT = 15 * 60
+HITS_KEY = 'availability:hits'
+MISSES_KEY = 'availability:misses'
+
+
+def iter_dates(lower_date, upper_date):
+    """Yields every date from lower_date to upper_date inclusively."""
+    current = lower_date
+    while current <= upper_date:
+        yield current
+        current += timedelta(days=1)
+
+
+def subtract_intervals(intervals, busy):
+    """
+    Subtracts busy intervals from given intervals.
+    Both arguments must be sorted lists of (start, end) tuples.
+    :returns: sorted list of (start, end) tuples, not covered by busy intervals.
+    """
+    free = []
+
+    for start, end in intervals:
+        for busy_start, busy_end in busy:
+            if busy_end <= start:
+                continue
+            if busy_start >= end:
+                break
+            if busy_start > start:
+                free.append((start, busy_start))
+            start = max(start, busy_end)
+            if start >= end:
+                break
+
+        if start < end:
+            free.append((start, end))
+
+    return free
+
+
+def iter_start_times(window, free, duration, step):
+    """
+    Yields every start time inside of the schedule window, placed on a `step`
+    grid counted from the window start, at which `duration` fits into
+    one of free intervals of the window.
+    """
+    window_start, window_end = window
+
+    for free_start, free_end in free:
+        current = window_start + -(-(free_start - window_start) // step) * step
+        while current + duration <= free_end:
+            yield current
+            current += step
+
+
+def get_busy(worker_ids, lower_date, upper_date):
+    """
+    Loads appointments and series occurrences of given workers from
+    lower_date to upper_date inclusively.
+    :returns: dict of (worker id, date) and sorted list of (start, end) datetimes.
+    """
+    busy = defaultdict(list)
+
+    lower = datetime.combine(lower_date, datetime.min.time())
+    upper = datetime.combine(upper_date + timedelta(days=1), datetime.min.time())
+    appointments = (
+        Appointment.objects
+        .filter(worker_id__in=worker_ids, scheduled_for__lt=upper, ends_at__gt=lower)
+        .values_list('worker_id', 'scheduled_for', 'ends_at')
+    )
+    series_busy = AppointmentSeries.get_busy(worker_ids, lower, upper)
+
+    intervals = [*appointments, *((worker_id, start, end)
+                                  for worker_id, worker_busy in series_busy.items()
+                                  for start, end in worker_busy)]
+    for worker_id, scheduled_for, ends_at in sorted(intervals):
+        busy[worker_id, scheduled_for.date()].append((scheduled_for, ends_at))
+
+    return busy
+
+
+def _iter_worker_starts(worker_id, windows, busy, lower_date, upper_date, duration, step,
+                        after=None, time_from=None, time_to=None):
+    """Yields (start, worker id) tuples of a single worker in chronological order."""
+    for day in iter_dates(lower_date, upper_date):
+        start_times = set()
+        lower = datetime.combine(day, time_from) if time_from else datetime.min
+        upper = datetime.combine(day, time_to) if time_to else datetime.max
+
+        for start_time, end_time in windows[day.weekday()]:
+            window = (datetime.combine(day, start_time), datetime.combine(day, end_time))
+            free = [(max(start, lower), min(end, upper))
+                    for start, end in subtract_intervals([window], busy[worker_id, day])
+                    if max(start, lower) < min(end, upper)]
+            start_times.update(iter_start_times(window, free, duration, step))
+
+        for start_time in sorted(start_times):
+            if after is None or start_time > after:
+                yield start_time, worker_id
+
+
+def iter_earliest_starts(schedules, duration, lower_date, upper_date, step,
+                         after=None, time_from=None, time_to=None):
+    """
+    Lazily yields (start, worker id) tuples of all workers in chronological order,
+    at which a service of given duration can be appointed.
+
+    `schedules` is an iterable of (worker id, day of week, start time, end time) tuples.
+    Per-worker streams are merged with a heap. Busy intervals are loaded for chunks
+    of days, which double in length, so nothing is loaded or computed past
+    the moment the caller stops iterating.
+    """
+    windows = defaultdict(lambda: defaultdict(list))
+    for worker_id, day_of_week, start_time, end_time in schedules:
+        windows[worker_id][day_of_week].append((start_time, end_time))
+
+    worker_ids = sorted(windows)
+    if not worker_ids:
+        return
+
+    chunk_lower = lower_date
+    chunk_days = 1
+    while chunk_lower <= upper_date:
+        chunk_upper = min(chunk_lower + timedelta(days=chunk_days - 1), upper_date)
+        busy = get_busy(worker_ids, chunk_lower, chunk_upper)
+
+        yield from heapq.merge(*(
+            _iter_worker_starts(worker_id, windows[worker_id], busy, chunk_lower, chunk_upper,
+                                duration, step, after, time_from, time_to)
+            for worker_id in worker_ids
+        ))
+
+        chunk_lower = chunk_upper + timedelta(days=1)
+        chunk_days *= 2
+
+
+def _get_version_key(worker_id):
+    return f'availability:version:{worker_id}'
+
+
+def _get_day_key(worker_id, version, day):
+    return f'availability:{worker_id}:{version}:{day.isoformat()}'
+
+
+def _get_worker_version(worker_id):
+    return cache.get_or_set(_get_version_key(worker_id), uuid.uuid4().hex, timeout=None)
+
+
+def _count(key, delta):
+    if delta:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+def invalidate_worker(worker_id):
+    """Drops all cached days of the worker by giving them a new version."""
+    cache.set(_get_version_key(worker_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_day(worker_id, day):
+    """Drops cached free intervals of the worker at given date."""
+    cache.delete(_get_day_key(worker_id, _get_worker_version(worker_id), day))
+
+
+def get_cache_stats():
+    """:returns: dict with numbers of cache hits and misses of worker days."""
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+class WorkerCalendar:
+    """
+    Schedule windows and free intervals of a single worker for a date range.
+
+    Every day is kept in the cache under (worker, date) key as a list of
+    (window, free intervals of the window) tuples. Days, which are missing
+    in the cache, are loaded with a fixed number of queries.
+    """
+    def __init__(self, worker, lower_date, upper_date):
+        self.worker = worker
+        self.lower_date = lower_date
+        self.upper_date = upper_date
+
+        version = _get_worker_version(worker.id)
+        keys = {_get_day_key(worker.id, version, day): day for day in iter_dates(lower_date, upper_date)}
+        self.days = {keys[key]: value for key, value in cache.get_many(keys).items()}
+        missing = [day for day in keys.values() if day not in self.days]
+
+        _count(HITS_KEY, len(self.days))
+        _count(MISSES_KEY, len(missing))
+
+        if missing:
+            # Days stay in the cache longer than replicas may lag behind
+            with use_primary():
+                loaded = self.load_days(min(missing), max(missing))
+            self.days.update(loaded)
+            cache.set_many({_get_day_key(worker.id, version, day): value
+                            for day, value in loaded.items()}, CACHE_TIMEOUT)
+
+    def load_days(self, lower_date, upper_date):
+        """:returns: dict of date and list of (window, free intervals) tuples."""
+        schedules = defaultdict(list)
+        busy = get_busy([self.worker.id], lower_date, upper_date)
+
+        for day_of_week, start_time, end_time in (
+                Schedule.objects
+                .filter(worker=self.worker)
+                .order_by('start_time')
+                .values_list('day_of_week', 'start_time', 'end_time')):
+            schedules[day_of_week].append((start_time, end_time))
+
+        days = {}
+        for day in iter_dates(lower_date, upper_date):
+            days[day] = []
+            for start_time, end_time in schedules[day.weekday()]:
+                window = (datetime.combine(day, start_time), datetime.combine(day, end_time))
+                days[day].append((window, subtract_intervals([window], busy[self.worker.id, day])))
+
+        return days
+
+    def get_windows(self, day):
+        """:returns: sorted list of (start, end) datetimes the worker works at given day."""
+        return [window for window, _ in self.days[day]]
+
+    def get_free(self, day):
+        """:returns: sorted list of (start, end) datetimes the worker is free at given day."""
+        return sorted(interval for _, free in self.days[day] for interval in free)
+
+    def get_bitmap(self, day, after=None):
+        """
+        :returns: :class: `specialist_api.bitmaps.DayBitmap` of given day.
+        Time, which isn't later than `after`, is marked as busy.
+        """
+        if after is not None and after.date() > day:
+            # The whole day has passed, the mask must not grow with the time since it
+            bitmap = DayBitmap.from_intervals(day, [(start.time(), end.time()) for start, end in self.get_windows(day)])
+            bitmap.busy = get_mask(0, SLOTS_PER_DAY)
+            return bitmap
+
+        bitmap = DayBitmap.from_free(day, self.days[day])
+        if after is not None:
+            bitmap.busy |= get_mask(0, min(to_slot(after, day) + 1, SLOTS_PER_DAY))
+        return bitmap
+
+    def get_day_start_times(self, day, duration, step):
+        """:returns: sorted list of datetimes, at which given duration fits at given day."""
+        start_times = set()
+
+        for window, free in self.days[day]:
+            start_times.update(iter_start_times(window, free, duration, step))
+
+        return sorted(start_times)
+
+    def get_start_times(self, duration, step, after=None):
+        """
+        :returns: list of datetimes, at which a service of given duration
+        can be appointed. Start times, which aren't later than `after`, are skipped.
+        """
+        start_times = []
+
+        for day in iter_dates(self.lower_date, self.upper_date):
+            start_times.extend(
+                start_time for start_time in self.get_day_start_times(day, duration, step)
+                if after is None or start_time > after
+            )
+
+        return start_times
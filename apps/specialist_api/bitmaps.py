@@ -0,0 +1,210 @@
+from datetime import datetime, time, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SLOT = timedelta(minutes=1)
+SLOTS_PER_DAY = timedelta(days=1) // SLOT
+
+
+def to_slot(value, day, round_up=False):
+    """
+    :returns: index of the slot, given datetime or time falls into,
+    counted from the midnight of given day. If `round_up` is set,
+    a value inside of a slot gives the index of the next one.
+    """
+    if isinstance(value, time):
+        value = datetime.combine(day, value)
+
+    offset = value - datetime.combine(day, time.min)
+    if round_up:
+        return -(-offset // SLOT)
+    return offset // SLOT
+
+
+def get_mask(lower, upper):
+    """:returns: int with bits from lower to upper (exclusive) slots set."""
+    if upper <= lower:
+        return 0
+    return ((1 << (upper - lower)) - 1) << max(lower, 0) >> max(-lower, 0)
+
+
+def get_run_mask(mask, length):
+    """
+    :returns: int with bits set at every slot, which starts
+    a run of at least `length` set bits of the mask.
+    """
+    result = mask
+    covered = 1
+
+    # Doubling: after each step a bit is set if `covered` bits from it are set
+    while covered < length:
+        shift = min(covered, length - covered)
+        result &= result >> shift
+        covered += shift
+
+    return result
+
+
+def get_grid_mask(lower, upper, step):
+    """:returns: int with bits set at every `step` slot from lower to upper (exclusive)."""
+    mask = 0
+    for index in range(lower, upper, step):
+        mask |= 1 << index
+    return mask
+
+
+def count_bits(mask):
+    return bin(mask).count('1')
+
+
+def iter_bits(mask):
+    """Yields indexes of set bits of the mask in ascending order."""
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+class DayBitmap:
+    """
+    Compiled calendar of a single worker (or location) for a single day.
+
+    Every bit stands for one `SLOT` counted from the midnight. Schedule windows
+    are kept as separate masks, so a span fits into the schedule only when it
+    doesn't cross a border of two adjacent windows, same as with intervals.
+    Busy slots may go past the midnight, as Python ints aren't bounded.
+    """
+    def __init__(self, day, windows=(), busy=0):
+        self.day = day
+        self.windows = list(windows)
+        self.busy = busy
+
+    @classmethod
+    def from_intervals(cls, day, windows=(), busy=()):
+        """
+        Builds a bitmap from (start, end) times of schedule windows and
+        (start, end) datetimes of busy intervals. Windows are rounded inwards
+        and busy intervals outwards, so the bitmap never claims more free time.
+        """
+        bitmap = cls(day)
+
+        for start, end in windows:
+            bitmap.windows.append(get_mask(to_slot(start, day, round_up=True), to_slot(end, day)))
+        for start, end in busy:
+            bitmap.busy |= get_mask(to_slot(start, day), to_slot(end, day, round_up=True))
+
+        return bitmap
+
+    @classmethod
+    def from_free(cls, day, entries):
+        """
+        Builds a bitmap from (window, free intervals of the window) tuples,
+        where windows and intervals are (start, end) datetimes.
+        """
+        bitmap = cls.from_intervals(day, [(start.time(), end.time()) for (start, end), _ in entries])
+        free = 0
+
+        for _, intervals in entries:
+            for start, end in intervals:
+                free |= get_mask(to_slot(start, day, round_up=True), to_slot(end, day))
+        for window in bitmap.windows:
+            bitmap.busy |= window & ~free
+
+        return bitmap
+
+    def get_span(self, start, end):
+        """:returns: mask of slots, covered by given datetimes, rounded outwards."""
+        return get_mask(to_slot(start, self.day), to_slot(end, self.day, round_up=True))
+
+    def is_in_schedule(self, start, end):
+        """:returns: True if the span is inside of one of schedule windows, else False."""
+        span = self.get_span(start, end)
+        return any(window & span == span for window in self.windows)
+
+    def is_free(self, start, end):
+        """:returns: True if the span doesn't intersect busy slots, else False."""
+        return not self.busy & self.get_span(start, end)
+
+    def fits(self, start, end):
+        return self.is_in_schedule(start, end) and self.is_free(start, end)
+
+    def get_free_mask(self):
+        """:returns: mask of slots, which are inside of any window and aren't busy."""
+        free = 0
+        for window in self.windows:
+            free |= window & ~self.busy
+        return free
+
+    def get_start_mask(self, duration, step=None):
+        """
+        :returns: mask of slots, at which given duration fits into a free part of one window.
+        If `step` is given, only slots on the `step` grid from the window start are left.
+        """
+        length = -(-duration // SLOT)
+        starts = 0
+
+        for window in self.windows:
+            window_starts = get_run_mask(window & ~self.busy, length)
+            if step is not None and window:
+                lower = (window & -window).bit_length() - 1
+                window_starts &= get_grid_mask(lower, window.bit_length(), step // SLOT)
+            starts |= window_starts
+
+        return starts
+
+    def get_start_times(self, duration):
+        """:returns: sorted list of datetimes, at which given duration fits."""
+        midnight = datetime.combine(self.day, time.min)
+        return [midnight + index * SLOT for index in iter_bits(self.get_start_mask(duration))]
+
+
+def _to_array(mask):
+    bits = numpy.frombuffer(mask.to_bytes(SLOTS_PER_DAY // 8 + 1, 'little'), dtype=numpy.uint8)
+    return numpy.unpackbits(bits, bitorder='little')[:SLOTS_PER_DAY].astype(bool)
+
+
+def get_day_stats(bitmaps, duration, step):
+    """
+    Aggregates many day bitmaps at once.
+    Uses NumPy to process all schedule windows in one pass if it is installed.
+    :returns: list of (free slots, number of start times on the `step` grid) tuples,
+    one for each of given bitmaps.
+    """
+    if numpy is None:
+        return [(count_bits(bitmap.get_free_mask()), count_bits(bitmap.get_start_mask(duration, step)))
+                for bitmap in bitmaps]
+
+    owners = [i for i, bitmap in enumerate(bitmaps) for _ in bitmap.windows]
+    if not owners:
+        return [(0, 0)] * len(bitmaps)
+
+    length = -(-duration // SLOT)
+    owners = numpy.array(owners)
+    windows = numpy.array([_to_array(window) for bitmap in bitmaps for window in bitmap.windows])
+    busy = numpy.array([_to_array(bitmap.busy & ((1 << SLOTS_PER_DAY) - 1)) for bitmap in bitmaps])
+    free = windows & ~busy[owners]
+
+    # A start fits if the sum of free slots over the next `length` ones equals `length`
+    sums = numpy.zeros((len(free), SLOTS_PER_DAY + 1), dtype=numpy.int32)
+    numpy.cumsum(free, axis=1, out=sums[:, 1:])
+    fits = numpy.zeros_like(free)
+    if length <= SLOTS_PER_DAY:
+        fits[:, :SLOTS_PER_DAY - length + 1] = (sums[:, length:] - sums[:, :-length]) == length
+
+    # Keep starts on the `step` grid, counted from the first slot of each window
+    window_starts = windows.argmax(axis=1)
+    offsets = numpy.arange(SLOTS_PER_DAY)[None, :] - window_starts[:, None]
+    fits &= (offsets % (step // SLOT)) == 0
+
+    free_days = numpy.zeros((len(bitmaps), SLOTS_PER_DAY), dtype=bool)
+    start_days = numpy.zeros((len(bitmaps), SLOTS_PER_DAY), dtype=bool)
+    numpy.logical_or.at(free_days, owners, free)
+    numpy.logical_or.at(start_days, owners, fits)
+
+    return list(zip(free_days.sum(axis=1).tolist(), start_days.sum(axis=1).tolist()))
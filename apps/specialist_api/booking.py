@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Worker, WorkerService, Schedule, Appointment, AppointmentSeries
+)
+
+
+# The first key of advisory locks, the second one is a worker id
+BOOKING_LOCK = 1001
+
+
+def lock_workers(worker_ids):
+    """
+    Blocks bookings of given workers by other transactions till the end of the
+    current one. Series occurrences aren't stored, so the exclusion constraint
+    of appointments can't stop two concurrent bookings of the same time, and
+    availability must be checked and saved under this lock.
+    :raise: TransactionManagementError outside of a transaction.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if not connection.in_atomic_block:
+        raise TransactionManagementError('Workers can be locked only inside of a transaction.')
+
+    # Locks are taken in the order of ids, so two batches can't deadlock
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, worker_id) '
+                       'FROM unnest(%s) AS worker_id ORDER BY worker_id',
+                       [BOOKING_LOCK, sorted(set(worker_ids))])
+
+
+class AppointmentBatch:
+    """
+    Validates many appointments of one client at once against workers'
+    schedules, existing appointments and each other, with a fixed number
+    of queries regardless of the batch size.
+
+    Items are dicts with `worker` and `service` ids and `scheduled_for` datetime.
+    Workers are locked with `lock_workers` while checked, so the batch
+    must be validated and saved in one transaction.
+    """
+    def __init__(self, client, items):
+        self.client = client
+        self.items = items
+        self.durations = {}
+
+    def get_errors(self):
+        """:returns: list of error messages for each item, empty for valid ones."""
+        worker_ids = {item['worker'] for item in self.items}
+        errors = [[] for _ in self.items]
+        lock_workers(worker_ids)
+
+        workers = dict(
+            Worker.objects
+            .filter(id__in=worker_ids)
+            .values_list('id', 'profile_id')
+        )
+        self.durations = {
+            (worker_id, service_id): duration
+            for worker_id, service_id, duration in (
+                WorkerService.objects
+                .filter(worker_id__in=worker_ids,
+                        service_id__in={item['service'] for item in self.items})
+                .values_list('worker_id', 'service_id', 'service__duration')
+            )
+        }
+
+        now = timezone.now()
+        bookable = []
+        for i, item in enumerate(self.items):
+            if item['worker'] not in workers:
+                errors[i].append('Given worker does not exist.')
+            elif (item['worker'], item['service']) not in self.durations:
+                errors[i].append("This worker doesn't provide given service")
+            elif workers[item['worker']] == self.client.id:
+                errors[i].append("You can't make an appointment to yourself!")
+            elif item['scheduled_for'] <= now:
+                errors[i].append('Date and Time must be in future.')
+            else:
+                bookable.append(i)
+
+        if bookable:
+            self._check_schedules(bookable, errors)
+            self._check_appointments([i for i in bookable if not errors[i]], errors)
+
+        return errors
+
+    def get_span(self, i):
+        """:returns: (start, end) datetimes of the item with given index."""
+        item = self.items[i]
+        duration = self.durations[(item['worker'], item['service'])]
+        return item['scheduled_for'], item['scheduled_for'] + duration
+
+    def build(self):
+        """:returns: list of unsaved appointments. Must be called after `get_errors`."""
+        appointments = []
+
+        for i, item in enumerate(self.items):
+            scheduled_for, ends_at = self.get_span(i)
+            appointments.append(Appointment(
+                client=self.client,
+                worker_id=item['worker'],
+                service_id=item['service'],
+                scheduled_for=scheduled_for,
+                ends_at=ends_at
+            ))
+
+        return appointments
+
+    def _check_schedules(self, indexes, errors):
+        schedules = defaultdict(list)
+
+        for worker_id, day_of_week, start_time, end_time in (
+                Schedule.objects
+                .filter(worker_id__in={self.items[i]['worker'] for i in indexes})
+                .values_list('worker_id', 'day_of_week', 'start_time', 'end_time')):
+            schedules[(worker_id, day_of_week)].append((start_time, end_time))
+
+        for i in indexes:
+            start, end = self.get_span(i)
+            day = start.date()
+            windows = schedules[(self.items[i]['worker'], start.weekday())]
+
+            if not any(datetime.combine(day, start_time) <= start and
+                       end <= datetime.combine(day, end_time)
+                       for start_time, end_time in windows):
+                errors[i].append(Appointment.NOT_IN_SCHEDULE_ERROR)
+
+    def _check_appointments(self, indexes, errors):
+        spans = defaultdict(list)
+        for i in indexes:
+            spans[self.items[i]['worker']].append((*self.get_span(i), i))
+
+        # One query for all the workers, each bounded by the span of its own items
+        bounds = Q()
+        for worker_id, worker_spans in spans.items():
+            bounds |= Q(worker_id=worker_id,
+                        scheduled_for__lt=max(end for _, end, _ in worker_spans),
+                        ends_at__gt=min(start for start, _, _ in worker_spans))
+
+        for worker_id, start, end in (
+                Appointment.objects
+                .filter(bounds)
+                .values_list('worker_id', 'scheduled_for', 'ends_at')):
+            spans[worker_id].append((start, end, None))
+
+        series_busy = AppointmentSeries.get_busy(
+            spans.keys(),
+            min(start for worker_spans in spans.values() for start, _, _ in worker_spans),
+            max(end for worker_spans in spans.values() for _, end, _ in worker_spans)
+        )
+        for worker_id, intervals in series_busy.items():
+            spans[worker_id].extend((start, end, None) for start, end in intervals)
+
+        # Sorted by start, a span overlaps an earlier one if it starts before
+        # the latest end so far, and a later one if the next span starts before its end
+        for worker_spans in spans.values():
+            worker_spans.sort(key=lambda span: span[:2])
+            latest_end = None
+
+            for n, (start, end, i) in enumerate(worker_spans):
+                overlaps_previous = latest_end is not None and start < latest_end
+                overlaps_next = n + 1 < len(worker_spans) and worker_spans[n + 1][0] < end
+
+                if i is not None and (overlaps_previous or overlaps_next):
+                    errors[i].append(Appointment.NOT_FREE_ERROR)
+                latest_end = end if latest_end is None else max(latest_end, end)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+# Backends, which keep entries in memory of a process
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Fails deployment with a cache, which isn't shared between processes, as
+    version stamps and cached availability would go stale in other processes.
+    """
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS:
+        return []
+
+    return [Error(
+        'The default cache is local to a process, so cached data goes stale in other processes.',
+        hint='Set "cache_url" of a Redis server in secrets.json.',
+        id='specialist_api.E001',
+    )]
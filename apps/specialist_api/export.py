@@ -0,0 +1,58 @@
+import csv
+import json
+from itertools import chain
+
+from rest_framework import serializers
+
+
+# `series` is set for occurrences of recurring appointments, which have no `id`
+APPOINTMENT_FIELDS = ['id', 'worker', 'client', 'scheduled_for', 'service', 'end_time', 'service_name', 'series']
+
+# Same representation as in :class: `specialist_api.serializers.WorkerAppointmentSerializer`
+_REPRESENTATIONS = {
+    'scheduled_for': serializers.DateTimeField().to_representation,
+    'end_time': serializers.TimeField().to_representation,
+}
+
+
+class Echo:
+    """
+    Pseudo-buffer for `csv.writer`, which returns written
+    value instead of keeping it.
+    """
+    def write(self, value):
+        return value
+
+
+def _represent(row):
+    return [_REPRESENTATIONS[field](row[field]) if field in _REPRESENTATIONS else row[field]
+            for field in APPOINTMENT_FIELDS]
+
+
+def _iter_chunks(lines, lines_per_chunk):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_ndjson(rows, lines_per_chunk=500):
+    """Yields chunks of newline-delimited JSON objects, one for each of given dict rows."""
+    return _iter_chunks(
+        (json.dumps(dict(zip(APPOINTMENT_FIELDS, _represent(row)))) + '\n' for row in rows),
+        lines_per_chunk
+    )
+
+
+def iter_csv(rows, lines_per_chunk=500):
+    """Yields chunks of CSV lines with a header line first, one line for each of given dict rows."""
+    writer = csv.writer(Echo())
+    header = writer.writerow(APPOINTMENT_FIELDS)
+    return _iter_chunks(
+        chain([header], (writer.writerow(_represent(row)) for row in rows)),
+        lines_per_chunk
+    )
@@ -0,0 +1,170 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+from .versions import WORKER, get_not_modified_response, set_version_headers
+
+
+FEED_SALT = 'specialist_api.feeds'
+LINE_LENGTH = 75
+
+
+def _get_owner_users(kind, object_id):
+    """:returns: queryset of the user, who owns the feed of given object, a worker's profile or a client."""
+    if kind == WORKER:
+        return get_user_model().objects.filter(worker_profile__id=object_id)
+    return get_user_model().objects.filter(id=object_id)
+
+
+def get_feed_token(kind, object_id):
+    """:returns: signed token, which gives access to the feed of given object without logging in."""
+    token_version = _get_owner_users(kind, object_id).values_list('feed_token_version', flat=True).first()
+    return signing.dumps([kind, object_id, token_version], salt=FEED_SALT)
+
+
+def get_feed_owner(token, kind):
+    """
+    :returns: id of the object, which feed of given kind is opened by the token,
+    or None if the token is invalid or has been revoked with `revoke_feed_tokens`.
+    """
+    try:
+        token_kind, object_id, token_version = signing.loads(token, salt=FEED_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if token_kind != kind:
+        return None
+
+    if not _get_owner_users(kind, object_id).filter(feed_token_version=token_version).exists():
+        return None
+    return object_id
+
+
+def revoke_feed_tokens(kind, object_id):
+    """Makes all the issued tokens of the feed of given object invalid."""
+    _get_owner_users(kind, object_id).update(feed_token_version=F('feed_token_version') + 1)
+
+
+def escape_text(value):
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\n', '\\n'))
+
+
+def fold_line(line):
+    """:returns: content line, folded into lines of at most 75 octets, with CRLF at the end."""
+    encoded = line.encode()
+    parts = []
+
+    while len(encoded) > LINE_LENGTH:
+        cut = LINE_LENGTH if not parts else LINE_LENGTH - 1
+        # Don't split a multibyte character
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    parts.append(encoded.decode())
+
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    # Naive datetimes are written as floating local time, as USE_TZ is off
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def iter_calendar(name, events):
+    """
+    Yields lines of an iCalendar document with given name.
+    Events are dicts with `uid`, `start`, `end`, `summary` and `description`.
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield fold_line('BEGIN:VCALENDAR')
+    yield fold_line('VERSION:2.0')
+    yield fold_line('PRODID:-//appointments//feed//EN')
+    yield fold_line('CALSCALE:GREGORIAN')
+    yield fold_line(f'X-WR-CALNAME:{escape_text(name)}')
+
+    for event in events:
+        yield ''.join([
+            fold_line('BEGIN:VEVENT'),
+            fold_line(f'UID:{event["uid"]}'),
+            fold_line(f'DTSTAMP:{stamp}'),
+            fold_line(f'DTSTART:{format_datetime(event["start"])}'),
+            fold_line(f'DTEND:{format_datetime(event["end"])}'),
+            fold_line(f'SUMMARY:{escape_text(event["summary"])}'),
+            fold_line(f'DESCRIPTION:{escape_text(event["description"])}'),
+            fold_line('END:VEVENT'),
+        ])
+
+    yield fold_line('END:VCALENDAR')
+
+
+class AppointmentFeedMixin:
+    """
+    Streams appointments and occurrences of series as an iCalendar feed,
+    versioned with ETag and Last-Modified, so that polling calendar apps get
+    304 for unchanged feeds. `counterpart_field` is a lookup of the name,
+    shown in event descriptions.
+    """
+    history_days = 90
+    chunk_size = 2000
+    counterpart_field = None
+    counterpart_label = None
+    
+    def get_feed_response(self, request, name, queryset, series, version):
+        not_modified = get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+        
+        lower = datetime.now() - timedelta(days=self.history_days)
+        rows = (queryset
+                    .filter(scheduled_for__gte=lower)
+                    .order_by('scheduled_for', 'id')
+                    .values('id', 'scheduled_for', 'ends_at', 'service__name', self.counterpart_field)
+                    .iterator(chunk_size=self.chunk_size))
+        host = request.get_host()
+        events = (
+            {
+                'uid': f'appointment-{row["id"]}@{host}',
+                'start': row['scheduled_for'],
+                'end': row['ends_at'],
+                'summary': row['service__name'],
+                'description': f'{self.counterpart_label}: {row[self.counterpart_field]}',
+            }
+            for row in rows
+        )
+        events = heapq.merge(events, self.get_occurrence_events(series, lower, host),
+                             key=lambda event: event['start'])
+        
+        response = StreamingHttpResponse(iter_calendar(name, events), content_type='text/calendar; charset=utf-8')
+        return set_version_headers(response, version)
+    
+    def get_occurrence_events(self, series, lower, host):
+        """
+        :returns: sorted list of events of occurrences of given series, which end after `lower`.
+        Occurrences aren't stored, so their uids are made of the series and the original start.
+        """
+        series = (series
+                      .filter(last_starts_at__gt=lower - timedelta(days=1))
+                      .select_related('service')
+                      .prefetch_related('exceptions')
+                      .annotate(counterpart=F(self.counterpart_field)))
+        events = [
+            {
+                'uid': f'series-{item.id}-{format_datetime(occurrence_start)}@{host}',
+                'start': start,
+                'end': end,
+                'summary': item.service.name,
+                'description': f'{self.counterpart_label}: {item.counterpart}',
+            }
+            for item in series
+            # Moved occurrences may end after the last start, so there is no upper bound
+            for occurrence_start, start, end in item.get_occurrences(lower, datetime.max)
+        ]
+        return sorted(events, key=lambda event: event['start'])
@@ -0,0 +1,113 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+
+ENDPOINTS = {
+    'workers': ('client_api:workers', 'client_api:async_workers'),
+    'slots': ('client_api:available_slots', 'client_api:async_available_slots'),
+    'earliest': ('client_api:earliest_slots', 'client_api:async_earliest_slots'),
+    'appointments': ('client_api:appointments', 'client_api:async_appointments'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compares throughput of sync and async variants of a read endpoint, '
+            'served by the ASGI application in-process at given concurrency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoint', choices=sorted(ENDPOINTS))
+        parser.add_argument('--query', default='', help='Query string, e.g. `service=1&lower_date=01-01-2030`.')
+        parser.add_argument('--worker', type=int, help='Worker id for the `slots` endpoint.')
+        parser.add_argument('--token', help='JWT access token for the `appointments` endpoint.')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # Imported here, so the command doesn't set up the application for `help`
+        from appointments_project.asgi import application
+
+        if options['requests'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError('requests and concurrency must be positive.')
+        if options['endpoint'] == 'slots' and options['worker'] is None:
+            raise CommandError('--worker is required for the `slots` endpoint.')
+
+        kwargs = {'worker_id': options['worker']} if options['endpoint'] == 'slots' else {}
+        headers = [(b'host', b'localhost')]
+        if options['token']:
+            headers.append((b'authorization', f"Bearer {options['token']}".encode()))
+
+        self.stdout.write(f"{'mode':<6} {'ok':>6} {'failed':>6} {'req/s':>9} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+        for mode, name in zip(('sync', 'async'), ENDPOINTS[options['endpoint']]):
+            scope = get_scope(reverse(name, kwargs=kwargs), options['query'], headers)
+            statuses, latencies, elapsed = asyncio.run(
+                run(application, scope, options['requests'], options['concurrency'])
+            )
+            ok = sum(200 <= status_code < 400 for status_code in statuses)
+            percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+
+            self.stdout.write(f'{mode:<6} {ok:>6} {len(statuses) - ok:>6} {len(statuses) / elapsed:>9.1f} '
+                              f'{percentiles[49] * 1000:>8.1f} {percentiles[94] * 1000:>8.1f} '
+                              f'{percentiles[98] * 1000:>8.1f}')
+
+
+def get_scope(path, query, headers):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+
+
+async def request(application, scope):
+    """Sends one request to the ASGI application and :returns: (status code, latency in seconds)."""
+    started = time.perf_counter()
+    status_code = None
+    disconnected = asyncio.Event()
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+
+    await application(dict(scope), receive, send)
+    disconnected.set()
+    return status_code, time.perf_counter() - started
+
+
+async def run(application, scope, count, concurrency):
+    """Sends `count` requests, at most `concurrency` at once, and :returns: statuses, latencies and elapsed time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await request(application, scope)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+
+    return [status_code for status_code, _ in results], [latency for _, latency in results], elapsed
@@ -0,0 +1,246 @@
+import json
+import platform
+import statistics
+import subprocess
+import time as timer
+import tracemalloc
+from datetime import datetime, timedelta
+from io import StringIO
+
+from rest_framework.test import APIClient
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Max
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from specialist_api.models import Appointment, Schedule, Worker
+
+
+User = get_user_model()
+
+ENDPOINTS = ['worker_list', 'appointment_create', 'appointment_list']
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks endpoints against generated datasets of increasing size in a separate '
+            'test database. Records latency percentiles, SQL queries, rows fetched and peak '
+            'memory per request, and writes a JSON report, which can be compared with '
+            'a report of another commit with `--compare`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Numbers of appointments of datasets.')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--requests', type=int, default=100, help='Number of timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--memory-requests', type=int, default=5,
+                            help='Number of extra requests, traced to find peak memory.')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the cache between requests instead of clearing it before each one.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Path of the JSON report.')
+        parser.add_argument('--compare', help='Path of a previous JSON report to compare with.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database after the run.')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['memory_requests'], *options['sizes']) <= 0:
+            raise CommandError('requests, memory requests and sizes must be positive.')
+        if options['warmup'] < 0:
+            raise CommandError('warmup must not be negative.')
+
+        self.options = options
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        report = {'environment': get_environment(), 'options': get_report_options(options), 'results': []}
+
+        setup_test_environment()
+        old_name = self.connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                                           keepdb=options['keepdb'])
+        try:
+            # Reads of a replica would hit another database
+            with override_settings(DATABASE_REPLICAS=[]):
+                for size in options['sizes']:
+                    self.load_dataset(size)
+                    for endpoint in options['endpoints']:
+                        result = {'endpoint': endpoint, 'size': size, **self.run(getattr(self, endpoint)())}
+                        report['results'].append(result)
+                        self.write_result(result)
+        finally:
+            self.connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.write_comparison(json.load(f), report)
+
+    def load_dataset(self, size):
+        models = [model for model in apps.get_models()
+                  if model._meta.app_label in ('client_api', 'specialist_api')]
+        sql = self.connection.ops.sql_flush(no_style(), [model._meta.db_table for model in models],
+                                            reset_sequences=True, allow_cascade=True)
+        self.connection.ops.execute_sql_flush(sql)
+        cache.clear()
+
+        started = timer.monotonic()
+        call_command('generate_data', users=max(100, size // 10), workers=max(20, size // 500),
+                     services=30, appointments=size, seed=self.options['seed'], stdout=StringIO())
+        self.stdout.write(f'Dataset of {size} appointments is loaded in {timer.monotonic() - started:.1f}s')
+
+        # The busiest worker is the worst case of per worker endpoints
+        self.worker = (Worker.objects.annotate(appointment_count=Count('appointment'))
+                       .select_related('profile').order_by('-appointment_count', 'id').first())
+        self.user = User.objects.exclude(worker_profile__isnull=False).order_by('id').first()
+
+    def worker_list(self):
+        url = reverse('client_api:workers')
+        return lambda client, i: client.get(url), self.user
+
+    def appointment_list(self):
+        url = reverse('specialist_api:appointment_list', kwargs={'worker_id': self.worker.id})
+        return lambda client, i: client.get(url), self.worker.profile
+
+    def appointment_create(self):
+        url = reverse('client_api:appointment_create', kwargs={'worker_id': self.worker.id})
+        service = self.worker.services.order_by('duration', 'id').first()
+        count = self.options['warmup'] + self.options['requests'] + self.options['memory_requests']
+        start_times = get_free_start_times(self.worker, service.duration, count)
+
+        def request(client, i):
+            data = {'service': service.id, 'scheduled_for': start_times[i].strftime('%d-%m-%Y %H:%M:%S')}
+            return client.post(url, data, format='json')
+        return request, self.user
+
+    def run(self, scenario):
+        """Sends requests of the scenario and :returns: dict of measurements."""
+        request, user = scenario
+        client = APIClient()
+        client.force_authenticate(user)
+        queries, rows = [], []
+
+        def count(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            queries[-1] += 1
+            if sql.lstrip()[:6].upper() == 'SELECT':
+                rows[-1] += max(context['cursor'].rowcount, 0)
+            return result
+
+        def send(i):
+            if not self.options['warm_cache']:
+                cache.clear()
+            queries.append(0)
+            rows.append(0)
+            with self.connection.execute_wrapper(count):
+                started = timer.perf_counter()
+                response = request(client, i)
+                elapsed = timer.perf_counter() - started
+            if response.status_code >= 400:
+                raise CommandError(f'Request failed with {response.status_code}: {response.data}')
+            return elapsed
+
+        warmup, timed = self.options['warmup'], self.options['requests']
+
+        for i in range(warmup):
+            send(i)
+        latencies = [send(i) for i in range(warmup, warmup + timed)]
+        measured = slice(warmup, warmup + timed)
+
+        # Tracing slows code down, so memory is measured by separate requests
+        peak_memory = 0
+        tracemalloc.start()
+        try:
+            for i in range(warmup + timed, warmup + timed + self.options['memory_requests']):
+                tracemalloc.reset_peak()
+                send(i)
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'requests': timed,
+            'latency_ms': {
+                'p50': round(percentiles[49] * 1000, 3),
+                'p95': round(percentiles[94] * 1000, 3),
+                'p99': round(percentiles[98] * 1000, 3),
+                'mean': round(statistics.mean(latencies) * 1000, 3),
+            },
+            'queries': max(queries[measured]),
+            'rows': max(rows[measured]),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    def write_result(self, result):
+        latency = result['latency_ms']
+        self.stdout.write(f"{result['endpoint']:<20} {result['size']:>8} p50 {latency['p50']:>8.1f}ms "
+                          f"p95 {latency['p95']:>8.1f}ms p99 {latency['p99']:>8.1f}ms "
+                          f"queries {result['queries']:>3} rows {result['rows']:>6} "
+                          f"memory {result['peak_memory_kb']:>8.1f}KB")
+
+    def write_comparison(self, old_report, new_report):
+        """Writes ratios of new measurements to old ones, for endpoints and sizes present in both reports."""
+        old_results = {(result['endpoint'], result['size']): result for result in old_report['results']}
+        self.stdout.write(f"Compared with {old_report['environment'].get('commit') or 'previous report'}:")
+
+        for result in new_report['results']:
+            old = old_results.get((result['endpoint'], result['size']))
+            if old is None:
+                continue
+            changes = [f'{name} {get_ratio(result["latency_ms"][name], old["latency_ms"][name])}'
+                       for name in ('p50', 'p95', 'p99')]
+            changes += [f'{name} {old[name]} -> {result[name]}' for name in ('queries', 'rows')]
+            changes.append(f"memory {get_ratio(result['peak_memory_kb'], old['peak_memory_kb'])}")
+            self.stdout.write(f"{result['endpoint']:<20} {result['size']:>8} {', '.join(changes)}")
+
+
+def get_free_start_times(worker, duration, count):
+    """:returns: `count` start times of the worker's schedules after all of their appointments."""
+    last = Appointment.objects.filter(worker=worker).aggregate(last=Max('ends_at'))['last']
+    day = (last or datetime.now()).date() + timedelta(days=1)
+    windows = {schedule.day_of_week: (schedule.start_time, schedule.end_time)
+               for schedule in Schedule.objects.filter(worker=worker)}
+    start_times = []
+
+    while len(start_times) < count:
+        if day.weekday() in windows:
+            start_time, end_time = windows[day.weekday()]
+            scheduled_for = datetime.combine(day, start_time)
+            while scheduled_for + duration <= datetime.combine(day, end_time) and len(start_times) < count:
+                start_times.append(scheduled_for)
+                scheduled_for += duration
+        day += timedelta(days=1)
+    return start_times
+
+
+def get_ratio(new, old):
+    return f'x{new / old:.2f}' if old else 'n/a'
+
+
+def get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+    }
+
+
+def get_report_options(options):
+    names = ('sizes', 'endpoints', 'requests', 'warmup', 'memory_requests', 'warm_cache', 'seed')
+    return {name: options[name] for name in names}
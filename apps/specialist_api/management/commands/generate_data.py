@@ -0,0 +1,308 @@
+import io
+import math
+import random
+import time as timer
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from specialist_api.models import (
+    Location, Service, Worker, WorkerService, Schedule, Appointment
+)
+
+
+User = get_user_model()
+
+CITIES = [('Kyiv', 40), ('Lviv', 15), ('Kharkiv', 15), ('Odesa', 15), ('Dnipro', 15)]
+STREETS = ['Khreshchatyk', 'Shevchenka', 'Franka', 'Sadova', 'Hrushevskoho', 'Lesi Ukrainky', 'Soborna']
+PROFFESSIONS = [('barber', 30), ('hairdresser', 25), ('manicurist', 20), ('masseur', 10),
+                ('cosmetologist', 10), ('stylist', 5)]
+SERVICE_NAMES = ['Haircut', 'Beard trim', 'Coloring', 'Manicure', 'Pedicure', 'Massage',
+                 'Facial', 'Styling', 'Shave', 'Peeling']
+DURATIONS = [(30, 35), (45, 25), (60, 25), (90, 10), (120, 5)]
+CURRENCIES = [(Service.UKRANIAN_HRYVNIA, 80), (Service.UNITED_STATES_DOLLAR, 12), (Service.EURO, 8)]
+# Workers of a location take turns, so their schedules never overlap
+SHIFTS = [(8, 14), (14, 20)]
+# Relative weekday chances of a working day from Monday to Sunday
+WEEKDAY_WEIGHTS = [10, 10, 10, 10, 10, 8, 3]
+SLOT = timedelta(minutes=15)
+# Rough number of appointments, which fill a half of a worker's week
+HALF_WEEK_CAPACITY = 12
+
+
+def get_slot_weight(slot_time):
+    """:returns: relative chance of an appointment to start at given time, with peaks at lunch and after work."""
+    hour = slot_time.hour + slot_time.minute / 60
+    return (1
+            + 1.5 * math.exp(-(hour - 10.5) ** 2 / 2)
+            + 3 * math.exp(-(hour - 13) ** 2 / 1.5)
+            + 4 * math.exp(-(hour - 18) ** 2 / 2))
+
+
+def get_zipf_weights(count, exponent, rng):
+    """:returns: shuffled weights, which make a few items much more popular than the rest."""
+    weights = [1 / (rank + 1) ** exponent for rank in range(count)]
+    rng.shuffle(weights)
+    return weights
+
+
+def pick(rng, items, weights, k):
+    return rng.choices(items, cum_weights=list(accumulate(weights)), k=k)
+
+
+def escape_copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class Command(BaseCommand):
+    help = ('Generates a synthetic dataset for load testing: users, workers, locations, services, '
+            'weekly schedules and appointments, with hot workers and peak hours. '
+            'The same seed and arguments give the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of clients.')
+        parser.add_argument('--workers', type=int, default=100)
+        parser.add_argument('--locations', type=int, help='Half of the number of workers by default.')
+        parser.add_argument('--services', type=int, default=30)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--start', help='First date of appointments in format `dd-mm-yyyy`, today by default.')
+        parser.add_argument('--weeks', type=int,
+                            help='Number of weeks appointments are spread over, '
+                                 'by default enough to fill about a half of schedules.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--method', choices=['copy', 'bulk_create'], default='copy',
+                            help='`copy` is the fastest one, but needs PostgreSQL.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        locations = options['locations'] or -(-workers // len(SHIFTS))
+
+        weeks = options['weeks'] or max(1, math.ceil(options['appointments'] / (workers * HALF_WEEK_CAPACITY)))
+
+        if min(options['users'], workers, options['services'], weeks, options['chunk_size']) <= 0:
+            raise CommandError('users, workers, services, weeks and chunk size must be positive.')
+        if options['appointments'] < 0:
+            raise CommandError('appointments must not be negative.')
+        if not (0 < locations and workers <= locations * len(SHIFTS)):
+            raise CommandError(f'There must be from 1 to {len(SHIFTS)} workers per location.')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.connection = connections[options['database']]
+        start = (datetime.strptime(options['start'], '%d-%m-%Y').date() if options['start']
+                 else date.today())
+
+        with transaction.atomic(using=options['database']):
+            self.generate_users(options['users'] + workers)
+            self.generate_locations(locations)
+            self.generate_services(options['services'])
+            self.generate_workers(workers, locations)
+            self.generate_appointments(options['appointments'], start, weeks * 7)
+            self.reset_sequences()
+
+        self.stdout.write('Caches of running servers are not invalidated, restart them or clear the cache.')
+
+    def insert(self, model, field_names, rows):
+        """Inserts rows, which are tuples of values of given fields, in chunks. :returns: number of rows."""
+        started = timer.monotonic()
+        chunk_size = self.options['chunk_size']
+        count = 0
+
+        for offset in range(0, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            if self.options['method'] == 'copy':
+                self.copy(model, field_names, chunk)
+            else:
+                model.objects.using(self.options['database']).bulk_create(
+                    [model(**dict(zip(field_names, row))) for row in chunk]
+                )
+            count += len(chunk)
+
+        self.stdout.write(f'{model._meta.db_table}: {count} rows in {timer.monotonic() - started:.1f}s')
+        return count
+
+    def copy(self, model, field_names, rows):
+        columns = ', '.join(self.connection.ops.quote_name(model._meta.get_field(name).column)
+                            for name in field_names)
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(escape_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {self.connection.ops.quote_name(model._meta.db_table)} '
+                               f'({columns}) FROM STDIN', buffer)
+
+    def get_first_id(self, model):
+        # Ids are given explicitly, so rows can refer to each other without reading them back
+        return (model.objects.using(self.options['database']).aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    def generate_users(self, count):
+        first_id = self.get_first_id(User)
+        # Hashing is slow, so all users share the same password: `password`
+        password = make_password('password')
+        joined = datetime.now().replace(microsecond=0)
+        first_names = ['Olena', 'Andrii', 'Iryna', 'Taras', 'Oksana', 'Dmytro', 'Natalia', 'Serhii']
+        last_names = ['Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Melnyk']
+
+        rows = [
+            (user_id, password, False, f'user{user_id}', self.rng.choice(first_names),
+             self.rng.choice(last_names), f'user{user_id}@example.com', False, True, joined, 0, 0)
+            for user_id in range(first_id, first_id + count)
+        ]
+        self.insert(User, ['id', 'password', 'is_superuser', 'username', 'first_name', 'last_name',
+                           'email', 'is_staff', 'is_active', 'date_joined', 'role', 'feed_token_version'],
+                    rows)
+
+        self.worker_profile_ids = [row[0] for row in rows[-self.options['workers']:]]
+        self.client_ids = [row[0] for row in rows[:-self.options['workers']]]
+
+    def generate_locations(self, count):
+        first_id = self.get_first_id(Location)
+        cities = pick(self.rng, [city for city, _ in CITIES], [weight for _, weight in CITIES], count)
+
+        rows = [(location_id, city, self.rng.choice(STREETS), str(self.rng.randint(1, 200)))
+                for location_id, city in zip(range(first_id, first_id + count), cities)]
+        self.insert(Location, ['id', 'city', 'street', 'street_number'], rows)
+        self.location_ids = [row[0] for row in rows]
+
+    def generate_services(self, count):
+        first_id = self.get_first_id(Service)
+        durations = pick(self.rng, [minutes for minutes, _ in DURATIONS],
+                         [weight for _, weight in DURATIONS], count)
+        currencies = pick(self.rng, [currency for currency, _ in CURRENCIES],
+                          [weight for _, weight in CURRENCIES], count)
+
+        rows = [
+            (service_id, f'{SERVICE_NAMES[i % len(SERVICE_NAMES)]} {service_id}',
+             minutes * self.rng.randint(5, 15) // 10 * 10, currency, timedelta(minutes=minutes))
+            for i, (service_id, minutes, currency) in enumerate(zip(range(first_id, first_id + count),
+                                                                    durations, currencies))
+        ]
+        self.insert(Service, ['id', 'name', 'price', 'currency', 'duration'], rows)
+        self.durations = {row[0]: row[4] for row in rows}
+
+    def generate_workers(self, count, locations):
+        first_id = self.get_first_id(Worker)
+        worker_ids = list(range(first_id, first_id + count))
+        proffessions = pick(self.rng, [name for name, _ in PROFFESSIONS],
+                            [weight for _, weight in PROFFESSIONS], count)
+        self.insert(Worker, ['id', 'profile_id', 'proffession'],
+                    list(zip(worker_ids, self.worker_profile_ids, proffessions)))
+
+        # A few services are provided by most of workers
+        service_ids = list(self.durations)
+        service_weights = get_zipf_weights(len(service_ids), 1, self.rng)
+        self.services = {}
+        for worker_id in worker_ids:
+            provided = set(pick(self.rng, service_ids, service_weights, self.rng.randint(1, 5)))
+            self.services[worker_id] = sorted(provided)
+
+        first_worker_service_id = self.get_first_id(WorkerService)
+        rows = [(worker_id, service_id) for worker_id in worker_ids for service_id in self.services[worker_id]]
+        self.insert(WorkerService, ['id', 'worker_id', 'service_id'],
+                    [(first_worker_service_id + i, *row) for i, row in enumerate(rows)])
+
+        # Worker `i` works at location `i % locations` during shift `i // locations`
+        self.windows = {}
+        rows = []
+        for i, worker_id in enumerate(worker_ids):
+            shift_start, shift_end = SHIFTS[i // locations]
+            start_time = time(shift_start, self.rng.choice([0, 30]))
+            end_time = time(shift_end - self.rng.choice([0, 1]))
+            days = set()
+            while len(days) < self.rng.randint(4, 6):
+                days.add(pick(self.rng, range(7), WEEKDAY_WEIGHTS, 1)[0])
+
+            for day_of_week in sorted(days):
+                rows.append((self.location_ids[i % locations], worker_id, day_of_week, start_time, end_time))
+            self.windows[worker_id] = {day_of_week: (start_time, end_time) for day_of_week in days}
+
+        first_schedule_id = self.get_first_id(Schedule)
+        self.insert(Schedule, ['id', 'location_id', 'worker_id', 'day_of_week', 'start_time', 'end_time'],
+                    [(first_schedule_id + i, *row) for i, row in enumerate(rows)])
+
+    def generate_appointments(self, count, start, days):
+        """
+        Picks workers by popularity, then a working day and a start time, weighted by
+        hour of the day, which is free for the whole service. Attempts, which hit
+        a busy time, are retried with another pick, up to 10 times of `count` in total.
+        """
+        worker_ids = list(self.windows)
+        worker_weights = get_zipf_weights(len(worker_ids), 0.8, self.rng)
+        client_weights = get_zipf_weights(len(self.client_ids), 0.8, self.rng)
+        working_days = {
+            worker_id: [start + timedelta(days=i) for i in range(days)
+                        if (start + timedelta(days=i)).weekday() in windows]
+            for worker_id, windows in self.windows.items()
+        }
+        # Busy slots of each (worker, date)
+        busy = {}
+        slot_weights = {}
+        rows = []
+        attempts = 0
+
+        while len(rows) < count and attempts < 10 * count:
+            batch = min(count - len(rows), self.options['chunk_size'])
+            attempts += batch
+            clients = pick(self.rng, self.client_ids, client_weights, batch)
+
+            for worker_id, client_id in zip(pick(self.rng, worker_ids, worker_weights, batch), clients):
+                if not working_days[worker_id]:
+                    continue
+                day = self.rng.choice(working_days[worker_id])
+                service_id = self.rng.choice(self.services[worker_id])
+                duration = self.durations[service_id]
+                start_time, end_time = self.windows[worker_id][day.weekday()]
+
+                window_start = datetime.combine(day, start_time)
+                length = -(-duration // SLOT)
+                slots = int((datetime.combine(day, end_time) - window_start) / SLOT) - length + 1
+                if slots <= 0:
+                    continue
+                if (start_time, slots) not in slot_weights:
+                    slot_weights[start_time, slots] = list(accumulate(
+                        get_slot_weight((window_start + i * SLOT).time()) for i in range(slots)
+                    ))
+                first = self.rng.choices(range(slots), cum_weights=slot_weights[start_time, slots])[0]
+
+                day_busy = busy.setdefault((worker_id, day), set())
+                taken = range(first, first + length)
+                if any(slot in day_busy for slot in taken):
+                    continue
+                day_busy.update(taken)
+
+                scheduled_for = window_start + first * SLOT
+                rows.append((client_id, worker_id, service_id, scheduled_for, scheduled_for + duration))
+
+        first_id = self.get_first_id(Appointment)
+        self.insert(Appointment, ['id', 'client_id', 'worker_id', 'service_id', 'scheduled_for', 'ends_at'],
+                    [(first_id + i, *row) for i, row in enumerate(rows)])
+        if len(rows) < count:
+            self.stdout.write(f'Only {len(rows)} of {count} appointments fit into schedules.')
+
+    def reset_sequences(self):
+        sql = self.connection.ops.sequence_reset_sql(no_style(), [
+            User, Location, Service, Worker, WorkerService, Schedule, Appointment
+        ])
+        with self.connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.db import models
+from django.db.models import Prefetch
+
+
+class WorkerQuerySet(models.QuerySet):
+
+    def with_listing_data(self):
+        """
+        :returns: queryset, which fetches profiles, schedules and services
+        of all the workers with a fixed number of queries.
+        """
+        Schedule = apps.get_model('specialist_api', 'Schedule')
+
+        return self.select_related('profile').prefetch_related(
+            Prefetch('schedule_set', queryset=Schedule.objects.order_by('day_of_week', 'start_time')),
+            'services'
+        )
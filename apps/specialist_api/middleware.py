@@ -0,0 +1,53 @@
+import asyncio
+
+from django.conf import settings
+
+from . import routers
+
+
+PIN_COOKIE = 'primary_db'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keeps reads of a client on the primary database, while replicas may lag behind its writes.
+
+    Unsafe requests read from the primary from the start, so validation
+    sees the latest data. Once a request has written, a cookie pins the next
+    requests of the client to the primary for `REPLICATION_LAG` seconds.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Async views aren't wrapped into a thread, if each middleware is async under ASGI
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        tokens = routers.enter_request(self.is_pinned(request))
+        try:
+            return self.process_response(self.get_response(request))
+        finally:
+            routers.exit_request(tokens)
+
+    async def __acall__(self, request):
+        tokens = routers.enter_request(self.is_pinned(request))
+        try:
+            return self.process_response(await self.get_response(request))
+        finally:
+            routers.exit_request(tokens)
+
+    def is_pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def process_response(self, response):
+        if routers.has_written():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICATION_LAG,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 4.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def fill_ends_at(apps, schema_editor):
+    Appointment = apps.get_model('specialist_api', 'Appointment')
+    Service = apps.get_model('specialist_api', 'Service')
+
+    for service in Service.objects.all():
+        (Appointment.objects
+            .filter(service=service)
+            .update(ends_at=models.F('scheduled_for') + service.duration))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specialist_api', '0021_alter_service_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_ends_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'ends_at', 'scheduled_for'], name='appointment_worker_span_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 14:05
+
+import django.contrib.postgres.constraints
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+import specialist_api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specialist_api', '0022_appointment_ends_at'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('worker', '='), (specialist_api.models.TsTzRange('scheduled_for', 'ends_at'), '&&')], name='appointment_no_overlap'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specialist_api', '0023_appointment_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'scheduled_for', 'id'], name='appointment_worker_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['client', 'scheduled_for', 'id'], name='appointment_client_sched_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specialist_api', '0024_appointment_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_worker_sched_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'scheduled_for', 'id'], include=('client', 'service', 'ends_at'), name='appointment_worker_sched_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0 on 2026-10-18 16:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_api', '0003_alter_customuser_is_superuser'),
+        ('specialist_api', '0025_appointment_worker_sched_idx_include'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('frequency', models.CharField(choices=[('WEEKLY', 'Weekly'), ('BIWEEKLY', 'Biweekly'), ('MONTHLY', 'Monthly')], max_length=8)),
+                ('count', models.PositiveIntegerField(blank=True, null=True)),
+                ('until', models.DateField(blank=True, null=True)),
+                ('last_starts_at', models.DateTimeField(editable=False)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='client_api.customuser')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='specialist_api.service')),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='specialist_api.worker')),
+            ],
+            options={
+                'db_table': 'appointment_series',
+            },
+        ),
+        migrations.CreateModel(
+            name='SeriesException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurrence_start', models.DateTimeField()),
+                ('scheduled_for', models.DateTimeField(blank=True, null=True)),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='specialist_api.appointmentseries')),
+            ],
+            options={
+                'db_table': 'series_exception',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='seriesexception',
+            constraint=models.UniqueConstraint(fields=('series', 'occurrence_start'), name='series_exception_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentseries',
+            index=models.Index(fields=['worker', 'last_starts_at', 'starts_at'], name='series_worker_span_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0 on 2026-10-18 17:20
+
+import django.contrib.postgres.constraints
+from django.db import migrations, models
+import specialist_api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specialist_api', '0026_appointmentseries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['location', 'day_of_week', 'start_time', 'end_time'], name='schedule_location_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='schedule',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('location', '='), ('day_of_week', '='), (specialist_api.models.TsRangeOfTimes('start_time', 'end_time'), '&&')], name='schedule_location_no_overlap'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 import calendar
-from datetime import time, date
+from datetime import time, date, timedelta
 
-from django.db import models
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
+from django.db import models, transaction
 from django.utils.timezone import datetime
 from django.utils.translation import gettext_lazy as _
 
@@ -9,11 +11,60 @@ from appointments_project import settings
 from wagtail_admin.forms import (
     ScheduleAdminForm, AppointmentAdminForm, ServiceAdminForm
 )
+from .bitmaps import DayBitmap
+from .managers import WorkerQuerySet
+from . import recurrence
 
 
 User = settings.AUTH_USER_MODEL
 
 
+class TsTzRange(models.Func):
+    """
+    Builds a `tstzrange` from given lower and upper bounds.
+    """
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class TsRangeOfTimes(models.Func):
+    """
+    Builds a `tsrange` from given lower and upper times, placed on the same
+    fixed date, as PostgreSQL has no range type of times.
+    """
+    function = 'TSRANGE'
+    template = "%(function)s(DATE '2000-01-01' + %(expressions)s)"
+    arg_joiner = ", DATE '2000-01-01' + "
+    output_field = DateTimeRangeField()
+
+
+def get_violated_constraint(error):
+    """:returns: name of the constraint, which violation raised given IntegrityError, if known."""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None)
+
+
+class LoadedValuesModel(models.Model):
+    """
+    Remembers field values loaded from the database, so that signal
+    handlers can tell what an instance has been before it was changed.
+    """
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def get_loaded_value(self, field_name, default=None):
+        """:returns: value of the field, loaded from the database, or default if it wasn't loaded."""
+        value = getattr(self, '_loaded_values', {}).get(field_name, default)
+        return default if value is models.DEFERRED else value
+
+
 class Location(models.Model):
     """
     Stores a single location entry.
@@ -31,7 +82,7 @@ class Location(models.Model):
         return f'{self.city}, {self.street}, {self.street_number}, {self.appartment_address}'
 
 
-class Service(models.Model):
+class Service(LoadedValuesModel):
     """
     Stores a single service entry.
     """
@@ -54,6 +105,8 @@ class Service(models.Model):
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
     duration = models.DurationField()
     
+    OVERLAP_ERROR = 'Appointments of the service would overlap following appointments of the same workers.'
+    
     base_form_class = ServiceAdminForm
     
     class Meta:
@@ -61,6 +114,34 @@ class Service(models.Model):
     
     def __str__(self):
         return f'{self.name}'
+    
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            return
+        
+        # Keeps stored end time of appointments in sync with the duration.
+        # If they would overlap, the service is rolled back with the error
+        (self.appointment_set
+             .exclude(ends_at=models.F('scheduled_for') + self.duration)
+             .update(ends_at=models.F('scheduled_for') + self.duration))
+    
+    def get_overlapping_appointments(self, duration):
+        """
+        :returns: queryset of appointments of the service, which would overlap
+        following appointments of the same worker if the service lasted given duration.
+        """
+        # Appointments don't overlap now, so only ones, which start
+        # inside of a lengthened appointment, may overlap it
+        following = Appointment.objects.filter(
+            worker=models.OuterRef('worker'),
+            scheduled_for__gt=models.OuterRef('scheduled_for'),
+            scheduled_for__lt=models.ExpressionWrapper(models.OuterRef('scheduled_for') + duration,
+                                                       output_field=models.DateTimeField())
+        )
+        return self.appointment_set.filter(models.Exists(following))
 
 
 class Worker(models.Model):
@@ -75,6 +156,8 @@ class Worker(models.Model):
     appointments = models.ManyToManyField(User, through='Appointment', blank=True)
     proffession = models.CharField(max_length=128)
     
+    objects = WorkerQuerySet.as_manager()
+    
     class Meta:
         db_table = 'worker'
     
@@ -102,7 +185,7 @@ class WorkerService(models.Model):
         db_table = 'worker_service'
 
 
-class Schedule(models.Model):
+class Schedule(LoadedValuesModel):
     """
     Stores a single day schedule, which related to :model: `specialsit_api.Worker` and
     :model: `specialist_api.Location`, where worker provides their services.
@@ -122,10 +205,26 @@ class Schedule(models.Model):
     _start_time = models.TimeField(verbose_name='start time', name='start_time')
     _end_time = models.TimeField(verbose_name='end time', name='end_time')
     
+    NOT_FREE_ERROR = 'The given location is not free at that time.'
+    
     base_form_class = ScheduleAdminForm
 
     class Meta:
         db_table = 'schedule'
+        indexes = [
+            models.Index(fields=['location', 'day_of_week', 'start_time', 'end_time'],
+                         name='schedule_location_day_idx'),
+        ]
+        constraints = [
+            ExclusionConstraint(
+                name='schedule_location_no_overlap',
+                expressions=[
+                    ('location', RangeOperators.EQUAL),
+                    ('day_of_week', RangeOperators.EQUAL),
+                    (TsRangeOfTimes('start_time', 'end_time'), RangeOperators.OVERLAPS),
+                ],
+            ),
+        ]
     
     def __str__(self):
         return f'{self.location}: {self.worker} | {self.day_of_week} | {self.start_time} - {self.end_time}'
@@ -162,22 +261,43 @@ class Schedule(models.Model):
         return True
     
     @staticmethod
-    def is_location_free(location, day_of_week: int, start_time:time, end_time:time):
+    def get_overlap_filter(location, day_of_week: int, start_time:time, end_time:time):
+        """:returns: Q of schedules, which take given location at the same time."""
+        return models.Q(
+            location=location,
+            day_of_week=day_of_week,
+            start_time__lt=end_time,
+            end_time__gt=start_time
+        )
+    
+    @staticmethod
+    def is_location_free(location, day_of_week: int, start_time:time, end_time:time, exclude=None):
         """
         Method says is given location is free at given day_of_week at given
-        start and end time.
+        start and end time. A schedule with `exclude` id is not taken into account.
         :returns: True if location is free, else False.
         """
-        schedule_for_day = Schedule.objects.filter(
-            location=location,
-            day_of_week=day_of_week,
-            start_time__lte=end_time,
-            end_time__gte=start_time
+        schedules = Schedule.objects.filter(
+            Schedule.get_overlap_filter(location, day_of_week, start_time, end_time)
         )
-        return not bool(schedule_for_day)
+        if exclude is not None:
+            schedules = schedules.exclude(id=exclude)
+        
+        # Any date stands for the day of week, as schedules repeat weekly
+        bitmap = DayBitmap.from_intervals(date.min, busy=schedules.values_list('start_time', 'end_time'))
+        return bitmap.is_free(start_time, end_time)
+    
+    @staticmethod
+    def is_overlap_error(error):
+        """
+        Method says is given IntegrityError raised because of
+        the schedule taking a location, taken by another one.
+        :returns: True if `schedule_location_no_overlap` constraint is violated, else False.
+        """
+        return get_violated_constraint(error) == 'schedule_location_no_overlap'
 
 
-class Appointment(models.Model):
+class Appointment(LoadedValuesModel):
     """
     Stores a single appointment for :model: `specialist_api.CustomUser`,
     related to :model: `specialist_api.Worker` and :model: `specialist_api.Service`.
@@ -186,46 +306,86 @@ class Appointment(models.Model):
     worker = models.ForeignKey(Worker, on_delete=models.CASCADE, db_index=True)
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     scheduled_for = models.DateTimeField()
+    ends_at = models.DateTimeField(editable=False)
+    
+    NOT_IN_SCHEDULE_ERROR = "Given date and/or time not in worker's schedule."
+    NOT_FREE_ERROR = 'Given date and/or time not free.'
     
     base_form_class = AppointmentAdminForm
     
     class Meta:
         db_table = 'appointment'
         ordering = ['-scheduled_for']
+        indexes = [
+            # `ends_at` goes before `scheduled_for`, so the overlap lookup
+            # scans only appointments, which end after the given start
+            models.Index(fields=['worker', 'ends_at', 'scheduled_for'], name='appointment_worker_span_idx'),
+            # Match the ordering of :class: `specialist_api.pagination.AppointmentCursorPagination`,
+            # the worker's one covers all the columns to allow index-only scans for calendar pages
+            models.Index(fields=['worker', 'scheduled_for', 'id'], name='appointment_worker_sched_idx',
+                         include=['client', 'service', 'ends_at']),
+            models.Index(fields=['client', 'scheduled_for', 'id'], name='appointment_client_sched_idx'),
+        ]
+        constraints = [
+            ExclusionConstraint(
+                name='appointment_no_overlap',
+                expressions=[
+                    ('worker', RangeOperators.EQUAL),
+                    (TsTzRange('scheduled_for', 'ends_at'), RangeOperators.OVERLAPS),
+                ],
+            ),
+        ]
     
     def __str__(self):
         return f'{self.client} appointed to {self.worker} on {self.scheduled_for} for {self.service} service duration.'
     
+    def save(self, *args, **kwargs):
+        self.ends_at = self.scheduled_for + self.service.duration
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'ends_at'}
+        
+        super().save(*args, **kwargs)
+    
     def get_service_endtime(self):
-        service_end = (datetime.combine(date.min, self.scheduled_for.time())
-                       + self.service.duration)
-        return service_end.time()
+        return self.ends_at.time()
+    
+    @staticmethod
+    def is_overlap_error(error):
+        """
+        Method says is given IntegrityError raised because of
+        the appointment overlapping another one of the same worker.
+        :returns: True if `appointment_no_overlap` constraint is violated, else False.
+        """
+        return get_violated_constraint(error) == 'appointment_no_overlap'
     
     @staticmethod
-    def _has_free_place(worker, scheduled_for, service):
+    def _has_free_place(worker, scheduled_for, service, exclude=None):
         """
         Method says is the worker has free space in their schedule
         to provide given service, depending on existing appointments.
+        An appointment with `exclude` id is not taken into account.
         :returns: True if there is free space, else False.
         """
-        appointments = Appointment.objects.filter(worker=worker, scheduled_for__date=scheduled_for.date())
+        ends_at = scheduled_for + service.duration
+        appointments = Appointment.objects.filter(
+            worker=worker,
+            scheduled_for__lt=ends_at,
+            ends_at__gt=scheduled_for
+        )
+        if exclude is not None:
+            appointments = appointments.exclude(id=exclude)
         
-        for appointment in appointments:
-            current_service_start = appointment.scheduled_for.time()
-            current_service_end = appointment.get_service_endtime()
-            given_service_end = (datetime.combine(date.min, scheduled_for.time())
-                                 + service.duration).time()
-            
-            # Checking if given appointment placed inside other existing appointment
-            if (current_service_start <= scheduled_for.time() <= current_service_end or
-                    current_service_start <= given_service_end <= current_service_end):
-                return False
-            # Checking if existing appointment placed inside given appointment
-            if (scheduled_for.time() <= current_service_start and
-                    given_service_end > current_service_start):
-                return False
-
-        return True
+        # Both lookups narrow busy intervals down to ones near the given span,
+        # and series are expanded only if appointments leave it free
+        day = scheduled_for.date()
+        bitmap = DayBitmap.from_intervals(day, busy=appointments.values_list('scheduled_for', 'ends_at'))
+        if not bitmap.is_free(scheduled_for, ends_at):
+            return False
+        
+        busy = AppointmentSeries.get_busy([worker.id], scheduled_for, ends_at).get(worker.id, [])
+        return DayBitmap.from_intervals(day, busy=busy).is_free(scheduled_for, ends_at)
     
     @staticmethod
     def _is_in_schedule(worker, scheduled_for, service):
@@ -236,26 +396,161 @@ class Appointment(models.Model):
         
         This method doesn't check existing appointments.
         """
-        schedules = Schedule.objects.filter(worker=worker, day_of_week=scheduled_for.weekday())
-        service_end = datetime.combine(date.min, scheduled_for.time()) + service.duration
-        
-        for schedule in schedules:
-            if (schedule.start_time <= scheduled_for.time() <= schedule.end_time and
-                    service_end.time() <= schedule.end_time):
-                return True
-    
-        return False
+        windows = Schedule.objects.filter(
+            worker=worker,
+            day_of_week=scheduled_for.weekday()
+        ).values_list('start_time', 'end_time')
+        bitmap = DayBitmap.from_intervals(scheduled_for.date(), windows=windows)
+        return bitmap.is_in_schedule(scheduled_for, scheduled_for + service.duration)
     
     @staticmethod
-    def is_apoointment_avaliable(worker, scheduled_for, service):
+    def is_apoointment_avaliable(worker, scheduled_for, service, exclude=None):
         """
         Method says is the worker can provide given service at fiven date and time.
+        An appointment with `exclude` id is not taken into account, so it
+        can be used to check an appointment being rescheduled.
         :returns: True if appointment is avaliable, else False.
         """
         if not Appointment._is_in_schedule(worker, scheduled_for, service):
-            raise ValueError("Given date and/or time not in worker's schedule.")
+            raise ValueError(Appointment.NOT_IN_SCHEDULE_ERROR)
 
-        if not Appointment._has_free_place(worker, scheduled_for, service):
-            raise ValueError('Given date and/or time not free.')
+        if not Appointment._has_free_place(worker, scheduled_for, service, exclude):
+            raise ValueError(Appointment.NOT_FREE_ERROR)
         
         return True
+
+
+class AppointmentSeries(models.Model):
+    """
+    Stores a recurring appointment of :model: `specialist_api.CustomUser` to
+    :model: `specialist_api.Worker`. Occurrences are not stored, they are
+    expanded on demand, and only skipped or moved ones are stored as
+    :model: `specialist_api.SeriesException`.
+    """
+    FREQUENCY_CHOICES = [
+        (recurrence.WEEKLY, _('Weekly')),
+        (recurrence.BIWEEKLY, _('Biweekly')),
+        (recurrence.MONTHLY, _('Monthly')),
+    ]
+    MAX_OCCURRENCES = 260
+    
+    client = models.ForeignKey(User, on_delete=models.CASCADE)
+    worker = models.ForeignKey(Worker, on_delete=models.CASCADE)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    starts_at = models.DateTimeField()
+    frequency = models.CharField(max_length=8, choices=FREQUENCY_CHOICES)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    until = models.DateField(null=True, blank=True)
+    last_starts_at = models.DateTimeField(editable=False)
+    
+    class Meta:
+        db_table = 'appointment_series'
+        indexes = [
+            models.Index(fields=['worker', 'last_starts_at', 'starts_at'], name='series_worker_span_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.client} appointed to {self.worker} {self.frequency.lower()} from {self.starts_at}'
+    
+    def save(self, *args, **kwargs):
+        self.last_starts_at = self.get_starts()[-1]
+        super().save(*args, **kwargs)
+    
+    def get_starts(self):
+        """
+        :returns: starts of all the occurrences, not taking exceptions into account.
+        :raise: ValueError if the series is endless or too long.
+        """
+        if (self.count is None) and (self.until is None):
+            raise ValueError('Either count or until must be given.')
+        
+        starts = []
+        for start in recurrence.iter_starts(self.starts_at, self.frequency, self.count, self.until):
+            if len(starts) == self.MAX_OCCURRENCES:
+                raise ValueError(f'Series must not have more than {self.MAX_OCCURRENCES} occurrences.')
+            starts.append(start)
+        
+        if not starts:
+            raise ValueError('Series must have at least one occurrence.')
+        
+        return starts
+    
+    def get_occurrences(self, lower, upper):
+        """
+        Expands occurrences, which overlap [lower, upper) range, with exceptions applied.
+        Expects `service` and `exceptions` to be fetched with the series.
+        :returns: sorted list of (occurrence_start, start, end) tuples, where
+        occurrence_start is the start of the occurrence before it has been moved.
+        """
+        duration = self.service.duration
+        exceptions = {exception.occurrence_start: exception for exception in self.exceptions.all()}
+        occurrences = []
+        
+        for start in recurrence.iter_starts(self.starts_at, self.frequency, self.count,
+                                            self.until, lower=lower - duration):
+            if start >= upper:
+                break
+            if start + duration > lower and start not in exceptions:
+                occurrences.append((start, start, start + duration))
+        
+        for exception in exceptions.values():
+            start = exception.scheduled_for
+            if start is not None and start < upper and start + duration > lower:
+                occurrences.append((exception.occurrence_start, start, start + duration))
+        
+        return sorted(occurrences, key=lambda occurrence: occurrence[1])
+    
+    def has_occurrence(self, occurrence_start):
+        """:returns: True if the series has an occurrence starting at given datetime, else False."""
+        next_start = next(recurrence.iter_starts(self.starts_at, self.frequency, self.count,
+                                                 self.until, lower=occurrence_start), None)
+        return next_start == occurrence_start
+    
+    @staticmethod
+    def get_busy(worker_ids, lower, upper):
+        """
+        Expands occurrences of all the series of given workers within [lower, upper)
+        with two queries at most.
+        :returns: dict of worker id and sorted list of (start, end) tuples of occurrences.
+        """
+        busy = {}
+        # Services are shorter than a day, so older series can't reach the lower bound
+        series = (
+            AppointmentSeries.objects
+            .filter(worker_id__in=worker_ids,
+                    starts_at__lt=upper,
+                    last_starts_at__gt=lower - timedelta(days=1))
+            .select_related('service')
+            .prefetch_related('exceptions')
+        )
+        
+        for item in series:
+            busy.setdefault(item.worker_id, []).extend(
+                (start, end) for _, start, end in item.get_occurrences(lower, upper)
+            )
+        for intervals in busy.values():
+            intervals.sort()
+        
+        return busy
+
+
+class SeriesException(models.Model):
+    """
+    Stores a skipped or moved occurrence of :model: `specialist_api.AppointmentSeries`.
+    The occurrence is skipped if `scheduled_for` is empty.
+    """
+    series = models.ForeignKey(AppointmentSeries, on_delete=models.CASCADE, related_name='exceptions')
+    occurrence_start = models.DateTimeField()
+    scheduled_for = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'series_exception'
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'occurrence_start'], name='series_exception_unique'),
+        ]
+    
+    def __str__(self):
+        if self.scheduled_for is None:
+            return f'{self.series}: {self.occurrence_start} skipped'
+        return f'{self.series}: {self.occurrence_start} moved to {self.scheduled_for}'
+
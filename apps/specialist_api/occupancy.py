@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Location, Schedule
+
+
+class WeekSchedule:
+    """
+    Validates a whole week's schedule of one worker, which replaces the current
+    one, against schedules of other workers and against itself. Occupancy of all
+    the locations is checked with a single query regardless of the schedule size.
+
+    Items are dicts with `location` id, `day_of_week`, `start_time` and `end_time`.
+    """
+    def __init__(self, worker, items):
+        self.worker = worker
+        self.items = items
+
+    def get_errors(self):
+        """:returns: list of error messages for each item, empty for valid ones."""
+        errors = [[] for _ in self.items]
+        location_ids = set(
+            Location.objects
+            .filter(id__in={item['location'] for item in self.items})
+            .values_list('id', flat=True)
+        )
+
+        checked = []
+        for i, item in enumerate(self.items):
+            if item['location'] not in location_ids:
+                errors[i].append('Given location does not exist.')
+            elif item['start_time'] >= item['end_time']:
+                errors[i].append('start_time must be earlier than end_time.')
+            else:
+                checked.append(i)
+
+        if checked:
+            self._check_locations(checked, errors)
+
+        return errors
+
+    def build(self):
+        """:returns: list of unsaved schedules. Must be called after `get_errors`."""
+        return [
+            Schedule(
+                worker=self.worker,
+                location_id=item['location'],
+                day_of_week=item['day_of_week'],
+                start_time=item['start_time'],
+                end_time=item['end_time']
+            )
+            for item in self.items
+        ]
+
+    def _check_locations(self, indexes, errors):
+        windows = defaultdict(list)
+        overlaps = Q()
+
+        for i in indexes:
+            item = self.items[i]
+            windows[(item['location'], item['day_of_week'])].append((item['start_time'], item['end_time'], i))
+            overlaps |= Schedule.get_overlap_filter(item['location'], item['day_of_week'],
+                                                    item['start_time'], item['end_time'])
+
+        # Current schedules of the worker are going to be replaced
+        for location_id, day_of_week, start_time, end_time in (
+                Schedule.objects
+                .filter(overlaps)
+                .exclude(worker=self.worker)
+                .values_list('location_id', 'day_of_week', 'start_time', 'end_time')):
+            windows[(location_id, day_of_week)].append((start_time, end_time, None))
+
+        # Same sweep as in :class: `specialist_api.booking.AppointmentBatch`
+        for location_windows in windows.values():
+            location_windows.sort(key=lambda window: window[:2])
+            latest_end = None
+
+            for n, (start, end, i) in enumerate(location_windows):
+                overlaps_previous = latest_end is not None and start < latest_end
+                overlaps_next = n + 1 < len(location_windows) and location_windows[n + 1][0] < end
+
+                if i is not None and (overlaps_previous or overlaps_next):
+                    errors[i].append(Schedule.NOT_FREE_ERROR)
+                latest_end = end if latest_end is None else max(latest_end, end)
@@ -0,0 +1,68 @@
+from urllib.parse import parse_qs, urlparse
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class AppointmentCursorPagination(CursorPagination):
+    """
+    Paginates appointments by (scheduled_for, id), the newest ones go first
+    unless `ordering=scheduled_for` is given.
+    """
+    ordering = ('-scheduled_for', '-id')
+    ordering_query_param = 'ordering'
+    ordering_choices = {
+        'scheduled_for': ('scheduled_for', 'id'),
+        '-scheduled_for': ('-scheduled_for', '-id'),
+    }
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    
+    def get_ordering(self, request, queryset, view):
+        # Unknown values are ignored, the same way DRF's OrderingFilter does
+        ordering = request.query_params.get(self.ordering_query_param)
+        return self.ordering_choices.get(ordering, self.ordering)
+
+
+class WorkerCursorPagination(CursorPagination):
+    """
+    Paginates workers by id. Pages can be cached and shared by requests:
+    `get_cacheable_data` keeps cursors of links only, and
+    `get_cached_response` builds links of them from the url of each request.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    
+    def get_cacheable_data(self, data):
+        """:returns: paginated data of the page, which doesn't depend on the scheme, host or params of the request."""
+        return {
+            'next': self.get_link_cursor(self.get_next_link()),
+            'previous': self.get_link_cursor(self.get_previous_link()),
+            'results': data,
+        }
+    
+    def get_cached_response(self, request, data):
+        """:returns: paginated response of data from `get_cacheable_data` with links for given request."""
+        url = request.build_absolute_uri()
+        return Response({
+            'next': self.get_cursor_link(url, data['next']),
+            'previous': self.get_cursor_link(url, data['previous']),
+            'results': data['results'],
+        })
+    
+    def get_link_cursor(self, link):
+        if link is None:
+            return None
+        # A link to the first page has no cursor, it is kept as an empty one
+        return parse_qs(urlparse(link).query).get(self.cursor_query_param, [''])[0]
+    
+    def get_cursor_link(self, url, cursor):
+        if cursor is None:
+            return None
+        if not cursor:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -2,6 +2,7 @@ from rest_framework.permissions import BasePermission
 
 from django.shortcuts import get_object_or_404
 
+from .feeds import get_feed_owner
 from .models import Worker
 
 
@@ -16,7 +17,28 @@ class IsWorkerOrAdmin(BasePermission):
             return True
         
         worker = get_object_or_404(Worker, id=view.kwargs['worker_id'])
-        if worker.profile == request.user:
+        if worker.profile_id == request.user.id:
             return True
 
         return False
+
+
+class IsSuperuser(BasePermission):
+    """
+    Provides permission for the user if he is an admin.
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_superuser
+
+
+class HasFeedToken(BasePermission):
+    """
+    Provides permission for the request with a valid `token` param of
+    the view's `feed_kind`, given to the worker from the url if there is one.
+    """
+    def has_permission(self, request, view):
+        owner_id = get_feed_owner(request.query_params.get('token', ''), view.feed_kind)
+        if owner_id is None:
+            return False
+        
+        return 'worker_id' not in view.kwargs or owner_id == view.kwargs['worker_id']
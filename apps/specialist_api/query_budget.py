@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+# Numbers of appointments in datasets, budgets are checked against
+DATASET_SIZES = (20, 400)
+# Appointments of datasets start far in the future, so they can be booked again regardless of the clock
+DATASET_START = date(2050, 1, 3)
+
+# Quoted strings and numbers, which are not parts of names
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """:returns: given SQL with literals replaced by `?`, so queries, which differ only in parameters, are equal."""
+    return LITERAL_RE.sub('?', sql)
+
+
+def get_duplicates(queries):
+    """
+    :returns: list of (normalized SQL, count) tuples of queries, which
+    run more than once with any parameters, the most frequent first.
+    """
+    counts = Counter(normalize_sql(query['sql']) for query in queries)
+    return [(sql, count) for sql, count in counts.most_common() if count > 1]
+
+
+def get_failure_message(name, budget, queries):
+    lines = [f'{name} made {len(queries)} queries, the budget is {budget}.']
+
+    duplicates = get_duplicates(queries)
+    if duplicates:
+        lines.append('Duplicated queries:')
+        lines.extend(f'  {count}x {sql}' for sql, count in duplicates)
+
+    lines.append('All queries:')
+    lines.extend(f"  {i}. {query['sql']}" for i, query in enumerate(queries, start=1))
+    return '\n'.join(lines)
+
+
+def generate_dataset(size, seed=0):
+    """Generates a dataset of `size` appointments, with numbers of workers and clients growing along."""
+    cache.clear()
+    call_command('generate_data', users=max(10, size // 2), workers=max(2, size // 20), services=5,
+                 appointments=size, start=DATASET_START.strftime('%d-%m-%Y'), seed=seed, stdout=StringIO())
+
+
+class QueryBudgetMixin:
+    """
+    Provides assertions of maximum numbers of SQL queries for test cases.
+
+    Budgets are declared by name in `query_budgets`, for endpoints and
+    model methods alike. `assertQueryBudget` checks a budget against
+    datasets of each of `DATASET_SIZES`, so code, which makes queries
+    per row (N+1), fails on the bigger ones. A failure lists duplicated
+    queries first, as they are usually the cause.
+    """
+    query_budgets = {}
+
+    @contextmanager
+    def assertMaxQueries(self, budget, name='Block', using=DEFAULT_DB_ALIAS):
+        """Fails if the block makes more than `budget` queries."""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+
+        if len(context) > budget:
+            self.fail(get_failure_message(name, budget, context.captured_queries))
+
+    def assertQueryBudget(self, name, setup, sizes=DATASET_SIZES):
+        """
+        For each of dataset sizes generates a dataset, calls `setup`, which
+        :returns: a function to measure, and fails if it makes more queries
+        than the budget of given name. Datasets are rolled back afterwards.
+        """
+        budget = self.query_budgets[name]
+
+        for size in sizes:
+            with self.subTest(name, size=size), transaction.atomic():
+                generate_dataset(size)
+                run = setup()
+                with self.assertMaxQueries(budget, name):
+                    run()
+                transaction.set_rollback(True)
@@ -0,0 +1,58 @@
+import calendar
+from datetime import timedelta
+
+
+WEEKLY = 'WEEKLY'
+BIWEEKLY = 'BIWEEKLY'
+MONTHLY = 'MONTHLY'
+
+PERIODS = {
+    WEEKLY: timedelta(weeks=1),
+    BIWEEKLY: timedelta(weeks=2),
+}
+
+
+def add_months(value, months):
+    """:returns: given datetime moved by given number of months, clamped to the last day of the month."""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def get_first_index(starts_at, frequency, lower):
+    """:returns: index of the first occurrence, which may start not earlier than lower."""
+    if lower is None or lower <= starts_at:
+        return 0
+
+    if frequency == MONTHLY:
+        return max((lower.year - starts_at.year) * 12 + lower.month - starts_at.month - 1, 0)
+
+    return -(-(lower - starts_at) // PERIODS[frequency])
+
+
+def get_start(starts_at, frequency, index):
+    """:returns: start of the occurrence with given index."""
+    if frequency == MONTHLY:
+        return add_months(starts_at, index)
+
+    return starts_at + index * PERIODS[frequency]
+
+
+def iter_starts(starts_at, frequency, count=None, until=None, lower=None):
+    """
+    Lazily yields starts of occurrences of a series, beginning from the first
+    one, which starts not earlier than `lower`, without walking through
+    the earlier ones. The series ends after `count` occurrences or at `until` date.
+
+    Monthly series must start on one of the first 28 days of a month,
+    so that every month has an occurrence.
+    """
+    index = get_first_index(starts_at, frequency, lower)
+
+    while count is None or index < count:
+        start = get_start(starts_at, frequency, index)
+        if until is not None and start.date() > until:
+            return
+        if lower is None or start >= lower:
+            yield start
+        index += 1
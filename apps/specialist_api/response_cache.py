@@ -0,0 +1,50 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+RESPONSE_TIMEOUT = 5 * 60
+# How long a single build may hold the lock and others may wait for it
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.02
+
+_MISSING = object()
+
+
+def get_key(prefix, *parts):
+    """:returns: cache key of given prefix, unique for given parts, which must have a stable repr."""
+    return f'{prefix}:{hashlib.md5(repr(parts).encode()).hexdigest()}'
+
+
+def get_or_build(key, build, timeout=RESPONSE_TIMEOUT):
+    """
+    :returns: value of the key from the cache, built with `build` on a miss.
+
+    Concurrent misses of the same key are coalesced (single-flight): the caller,
+    who takes the lock, builds the value, while others wait for it to appear
+    in the cache. If it doesn't appear in time, they build it themselves.
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + WAIT_TIMEOUT
+
+    while time.monotonic() < deadline:
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+    return build()
@@ -0,0 +1,91 @@
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Context variables are copied into threads by `sync_to_async`, and changes
+# made there come back, so a request keeps its state in async views too
+_pinned = ContextVar('pinned_to_primary', default=False)
+_written = ContextVar('written_to_primary', default=False)
+
+
+def enter_request(pinned=False):
+    """Starts a clean state for a request and :returns: tokens to restore the previous one with."""
+    return _pinned.set(pinned), _written.set(False)
+
+
+def exit_request(tokens):
+    pinned, written = tokens
+    _written.reset(written)
+    _pinned.reset(pinned)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    """:returns: True if the current request (or context) has written to the primary, else False."""
+    return _written.get()
+
+
+def pin_to_primary():
+    """Sends all further reads of the current request (or context) to the primary."""
+    _pinned.set(True)
+
+
+@contextmanager
+def use_primary():
+    """Sends reads inside of the block to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def use_primary_if_changed(timestamp):
+    """
+    :returns: `use_primary` context if something has changed at given timestamp
+    within `REPLICATION_LAG` seconds, so replicas may not have the change yet,
+    else a context, which does nothing.
+    """
+    if time.time() < timestamp + settings.REPLICATION_LAG:
+        return use_primary()
+    return nullcontext()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a random one of `DATABASE_REPLICAS` and writes to the primary.
+
+    Reads go to the primary as well once the current request has written
+    anything (read-your-writes), inside of `use_primary` blocks and
+    inside of transactions of the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _written.set(True)
+
+        # Objects, read from a replica, are saved to the primary,
+        # others are left to the database they came from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data, so objects of any of them may be related
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -1,11 +1,18 @@
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
+from rest_framework.settings import api_settings
 
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from . import availability, routers, versions
+from .booking import AppointmentBatch, lock_workers
+from .occupancy import WeekSchedule
 from .models import (
-    Location, Service, Worker, Schedule, Appointment
+    Location, Service, Worker, Schedule, Appointment,
+    AppointmentSeries, SeriesException
 )
+from . import recurrence
 from client_api.serializers import UserSerializer
 
 
@@ -31,32 +38,120 @@ class ScheduleSerializer(ModelSerializer):
     
     def validate(self, data):
         try:
-            self.model.validate_timevalue(data['start_time'])
-            self.model.validate_timevalue(data['end_time'])
+            Schedule.validate_timevalue(data['start_time'])
+            Schedule.validate_timevalue(data['end_time'])
         except ValueError as e:
             raise serializers.ValidationError(e)
         
-        if (self.model.is_location_free(data['location'],
-                                        data['day_of_week'],
-                                        data['start_time'],
-                                        data['end_time'])):
-            raise serializers.ValidationError('The given location is not free at that time.')
+        if not Schedule.is_location_free(data['location'],
+                                         data['day_of_week'],
+                                         data['start_time'],
+                                         data['end_time'],
+                                         exclude=getattr(self.instance, 'id', None)):
+            raise serializers.ValidationError(Schedule.NOT_FREE_ERROR)
+        
+        return data
+    
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as e:
+            if not Schedule.is_overlap_error(e):
+                raise
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [Schedule.NOT_FREE_ERROR]
+            })
+
+
+class WeekScheduleItemSerializer(serializers.Serializer):
+    """
+    A plain location id is used instead of a related field, so that
+    items don't query the database one by one.
+    """
+    location = serializers.IntegerField()
+    day_of_week = serializers.ChoiceField(choices=Schedule.DAYS_OF_WEEK_CHOICES)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    
+    def validate(self, data):
+        try:
+            Schedule.validate_timevalue(data['start_time'])
+            Schedule.validate_timevalue(data['end_time'])
+        except ValueError as e:
+            raise serializers.ValidationError(e)
         
         return data
 
 
+class WeekScheduleSerializer(serializers.Serializer):
+    """
+    Validates a whole week's schedule and replaces the schedule
+    of `worker` from the context with it.
+    """
+    max_length = 50
+    schedules = WeekScheduleItemSerializer(many=True)
+    
+    def validate_schedules(self, items):
+        if len(items) > self.max_length:
+            raise serializers.ValidationError(f'Ensure there are no more than {self.max_length} schedules.')
+        
+        week = WeekSchedule(self.context['worker'], items)
+        errors = week.get_errors()
+        if any(errors):
+            raise serializers.ValidationError([
+                {api_settings.NON_FIELD_ERRORS_KEY: item_errors} if item_errors else {}
+                for item_errors in errors
+            ])
+        
+        return week.build()
+    
+    def create(self, validated_data):
+        worker = self.context['worker']
+        try:
+            with transaction.atomic():
+                Schedule.objects.filter(worker=worker).delete()
+                schedules = Schedule.objects.bulk_create(validated_data['schedules'])
+                # bulk_create doesn't send post_save signals, and delete() doesn't
+                # send post_delete ones if the worker had no schedules
+                transaction.on_commit(lambda: (
+                    availability.invalidate_worker(worker.id),
+                    versions.bump(versions.WORKER, {worker.id}),
+                    versions.bump(versions.DIRECTORY, [versions.DIRECTORY_ID])
+                ))
+                return schedules
+        except IntegrityError as e:
+            if not Schedule.is_overlap_error(e):
+                raise
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [Schedule.NOT_FREE_ERROR]
+            })
+
+
 class WorkerSerializer(ModelSerializer):
-    schedules = ScheduleSerializer(source='get_worker_schedule', many=True)
-    services = ServiceSerializer(source='get_worker_services', many=True)
-    profile = UserSerializer()
+    schedules = ScheduleSerializer(source='schedule_set', many=True, read_only=True)
+    services = ServiceSerializer(many=True, read_only=True)
+    profile = UserSerializer(read_only=True)
     
     class Meta:
         model = Worker
         fields = ['profile', 'services', 'schedules', 'proffession']
 
 
+class InstanceOrPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Accepts an instance, which a view has already loaded, as well
+    as a primary key, so the instance is not queried once again.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, self.get_queryset().model):
+            return data
+        return super().to_internal_value(data)
+
+
 class AppointmentSerializer(ModelSerializer):
     id = serializers.IntegerField(read_only=True)
+    serializer_related_field = InstanceOrPrimaryKeyRelatedField
     
     class Meta:
         model = Appointment
@@ -77,12 +172,178 @@ class AppointmentSerializer(ModelSerializer):
         if data_copy['client'].id == worker_profile_id:
             raise serializers.ValidationError("You can't make an appointment to yourself!")
         
+        # Series occurrences aren't covered by the exclusion constraint,
+        # so the check and the insert must not interleave with other bookings
+        lock_workers([data_copy['worker'].id])
         try:
-            Appointment.is_apoointment_avaliable(data_copy['worker'],
-                                                 data_copy['scheduled_for'],
-                                                 data_copy['service'])
+            # A lagging replica would let the appointment through to the constraint
+            with routers.use_primary():
+                Appointment.is_apoointment_avaliable(data_copy['worker'],
+                                                     data_copy['scheduled_for'],
+                                                     data_copy['service'],
+                                                     exclude=getattr(self.instance, 'id', None))
         except ValueError as e:
             raise serializers.ValidationError(e.args)
         
         return data_copy
-    
\ No newline at end of file
+    
+    def save(self, **kwargs):
+        # Concurrent requests can pass validation at the same time,
+        # so the final word belongs to the database exclusion constraint
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as e:
+            if not Appointment.is_overlap_error(e):
+                raise
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [Appointment.NOT_FREE_ERROR]
+            })
+
+
+class WorkerAppointmentSerializer(AppointmentSerializer):
+    """
+    Serializes appointments from the worker's point of view. Expects
+    `end_time` to be annotated and `service` to be selected with the queryset.
+    """
+    end_time = serializers.TimeField(read_only=True)
+    service_name = serializers.CharField(source='service.name', read_only=True)
+    
+    class Meta(AppointmentSerializer.Meta):
+        fields = AppointmentSerializer.Meta.fields + ['end_time', 'service_name']
+
+
+class AppointmentBatchItemSerializer(serializers.Serializer):
+    """
+    Plain ids are used instead of related fields, so that
+    items don't query the database one by one.
+    """
+    worker = serializers.IntegerField()
+    service = serializers.IntegerField()
+    scheduled_for = serializers.DateTimeField(input_formats=['%d-%m-%Y %H:%M:%S'])
+
+
+class AppointmentBatchSerializer(serializers.Serializer):
+    """
+    Validates and creates many appointments for `client` from the context.
+    Either all of the appointments are created or none of them.
+    """
+    max_length = 100
+    appointments = AppointmentBatchItemSerializer(many=True, allow_empty=False)
+    
+    def validate_appointments(self, items):
+        if len(items) > self.max_length:
+            raise serializers.ValidationError(f'Ensure there are no more than {self.max_length} appointments.')
+        
+        batch = AppointmentBatch(self.context['client'], items)
+        errors = batch.get_errors()
+        if any(errors):
+            raise serializers.ValidationError([
+                {api_settings.NON_FIELD_ERRORS_KEY: item_errors} if item_errors else {}
+                for item_errors in errors
+            ])
+        
+        return batch.build()
+    
+    def create(self, validated_data):
+        appointments = validated_data['appointments']
+        try:
+            with transaction.atomic():
+                appointments = Appointment.objects.bulk_create(appointments)
+                # bulk_create doesn't send post_save signals
+                days = {(appointment.worker_id, appointment.scheduled_for.date())
+                        for appointment in appointments}
+                transaction.on_commit(lambda: [availability.invalidate_day(*day) for day in days])
+                transaction.on_commit(lambda: (
+                    versions.bump(versions.WORKER, {worker_id for worker_id, _ in days}),
+                    versions.bump(versions.CLIENT, {self.context['client'].id})
+                ))
+                return appointments
+        except IntegrityError as e:
+            if not Appointment.is_overlap_error(e):
+                raise
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [Appointment.NOT_FREE_ERROR]
+            })
+
+
+class AppointmentSeriesSerializer(ModelSerializer):
+    id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = AppointmentSeries
+        fields = ['id', 'worker', 'client', 'service', 'starts_at', 'frequency', 'count', 'until']
+    
+    def validate(self, data):
+        if data['frequency'] == recurrence.MONTHLY and data['starts_at'].day > 28:
+            raise serializers.ValidationError('Monthly series must start on one of the first 28 days of a month.')
+        
+        try:
+            starts = AppointmentSeries(**data).get_starts()
+        except ValueError as e:
+            raise serializers.ValidationError(e.args)
+        
+        # All the occurrences are checked at once, as a batch of appointments
+        items = [
+            {'worker': data['worker'].id, 'service': data['service'].id, 'scheduled_for': start}
+            for start in starts
+        ]
+        errors = AppointmentBatch(data['client'], items).get_errors()
+        if any(errors):
+            raise serializers.ValidationError({
+                'occurrences': {
+                    start.strftime('%d-%m-%Y %H:%M:%S'): item_errors
+                    for start, item_errors in zip(starts, errors) if item_errors
+                }
+            })
+        
+        return data
+
+
+class SeriesExceptionSerializer(ModelSerializer):
+    """
+    Skips an occurrence of a series, or moves it if `scheduled_for` is given.
+    """
+    
+    class Meta:
+        model = SeriesException
+        fields = ['series', 'occurrence_start', 'scheduled_for']
+        validators = []
+    
+    def validate(self, data):
+        series = data['series']
+        scheduled_for = data.get('scheduled_for')
+        
+        if not series.has_occurrence(data['occurrence_start']):
+            raise serializers.ValidationError('Series has no occurrence at given date and time.')
+        
+        if scheduled_for is not None:
+            if scheduled_for <= timezone.now():
+                raise serializers.ValidationError('Date and Time must be in future.')
+            if not (series.starts_at <= scheduled_for <= series.last_starts_at):
+                raise serializers.ValidationError('Moved occurrence must stay within the series.')
+        
+        return data
+    
+    def save(self, **kwargs):
+        scheduled_for = self.validated_data.get('scheduled_for')
+        
+        # The occurrence is skipped first, so that it doesn't
+        # conflict with its own new place while that is checked
+        with transaction.atomic():
+            exception = super().save(scheduled_for=None, **kwargs)
+            if scheduled_for is None:
+                return exception
+            
+            series = exception.series
+            lock_workers([series.worker_id])
+            try:
+                Appointment.is_apoointment_avaliable(series.worker, scheduled_for, series.service)
+            except ValueError as e:
+                raise serializers.ValidationError(e.args)
+            
+            exception.scheduled_for = scheduled_for
+            exception.save(update_fields=['scheduled_for'])
+        
+        return exception
+
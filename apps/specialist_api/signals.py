@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_migrate
+from django.dispatch import receiver
+
+from . import availability, versions
+from .models import (
+    Service, Worker, WorkerService, Schedule, Appointment,
+    AppointmentSeries, SeriesException
+)
+
+
+def _on_commit_invalidate_days(days):
+    transaction.on_commit(lambda: [availability.invalidate_day(*day) for day in days])
+
+
+def _on_commit_invalidate_workers(worker_ids):
+    transaction.on_commit(lambda: [availability.invalidate_worker(worker_id) for worker_id in worker_ids])
+
+
+def _on_commit_bump_versions(worker_ids=(), client_ids=(), directory=False):
+    def bump():
+        versions.bump(versions.WORKER, worker_ids)
+        versions.bump(versions.CLIENT, client_ids)
+        if directory:
+            versions.bump(versions.DIRECTORY, [versions.DIRECTORY_ID])
+
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_days(sender, instance, **kwargs):
+    days = {(instance.worker_id, instance.scheduled_for.date())}
+
+    loaded_scheduled_for = instance.get_loaded_value('scheduled_for')
+    if loaded_scheduled_for is not None:
+        days.add((instance.get_loaded_value('worker_id'), loaded_scheduled_for.date()))
+
+    _on_commit_invalidate_days(days)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def bump_appointment_versions(sender, instance, **kwargs):
+    _on_commit_bump_versions(
+        worker_ids={instance.worker_id, instance.get_loaded_value('worker_id', instance.worker_id)},
+        client_ids={instance.client_id, instance.get_loaded_value('client_id', instance.client_id)}
+    )
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_schedule_worker(sender, instance, **kwargs):
+    worker_ids = {instance.worker_id, instance.get_loaded_value('worker_id', instance.worker_id)}
+
+    _on_commit_invalidate_workers(worker_ids)
+    _on_commit_bump_versions(worker_ids=worker_ids, directory=True)
+
+
+@receiver(post_save, sender=Worker)
+@receiver(post_delete, sender=Worker)
+@receiver(post_save, sender=WorkerService)
+@receiver(post_delete, sender=WorkerService)
+def bump_worker_versions(sender, instance, **kwargs):
+    worker_id = instance.id if sender is Worker else instance.worker_id
+    _on_commit_bump_versions(worker_ids={worker_id}, directory=True)
+
+
+@receiver(m2m_changed, sender=WorkerService)
+def bump_worker_services_versions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    # `services.add()` and alike don't send post_save of the through model
+    if reverse:
+        worker_ids = pk_set or set(instance.worker_set.values_list('id', flat=True))
+    else:
+        worker_ids = {instance.id}
+    _on_commit_bump_versions(worker_ids=worker_ids, directory=True)
+
+
+@receiver(post_save, sender=get_user_model())
+def bump_profile_versions(sender, instance, created, update_fields=None, **kwargs):
+    # Profiles of workers are shown in the directory, logins aren't
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Clients aren't shown, and a new user can't have a worker profile yet
+    if created or not Worker.objects.filter(profile_id=instance.pk).exists():
+        return
+    _on_commit_bump_versions(directory=True)
+
+
+@receiver(post_save, sender=AppointmentSeries)
+@receiver(post_delete, sender=AppointmentSeries)
+def invalidate_series_worker(sender, instance, **kwargs):
+    _on_commit_invalidate_workers({instance.worker_id})
+    # Occurrences are shown in feeds
+    _on_commit_bump_versions(worker_ids={instance.worker_id}, client_ids={instance.client_id})
+
+
+@receiver(post_save, sender=SeriesException)
+@receiver(post_delete, sender=SeriesException)
+def invalidate_series_exception_worker(sender, instance, **kwargs):
+    series = instance.series
+    _on_commit_invalidate_workers({series.worker_id})
+    _on_commit_bump_versions(worker_ids={series.worker_id}, client_ids={series.client_id})
+
+
+@receiver(post_save, sender=Service)
+def invalidate_service_workers(sender, instance, created, **kwargs):
+    loaded_duration = instance.get_loaded_value('duration')
+    if created or loaded_duration == instance.duration:
+        return
+
+    worker_ids = {
+        *Appointment.objects.filter(service=instance).values_list('worker_id', flat=True).distinct(),
+        *AppointmentSeries.objects.filter(service=instance).values_list('worker_id', flat=True).distinct(),
+    }
+    _on_commit_invalidate_workers(worker_ids)
+
+
+@receiver(post_save, sender=Service)
+def bump_service_appointment_versions(sender, instance, created, **kwargs):
+    # Services are shown in the directory
+    _on_commit_bump_versions(directory=True)
+
+    # Service name and duration are shown in appointment lists and feeds
+    if created or (instance.get_loaded_value('name') == instance.name and
+                   instance.get_loaded_value('duration') == instance.duration):
+        return
+
+    participants = {
+        *Appointment.objects.filter(service=instance).values_list('worker_id', 'client_id').distinct(),
+        *AppointmentSeries.objects.filter(service=instance).values_list('worker_id', 'client_id').distinct(),
+    }
+    _on_commit_bump_versions(worker_ids={worker_id for worker_id, _ in participants},
+                             client_ids={client_id for _, client_id in participants})
+
+
+@receiver(post_delete, sender=Service)
+def bump_deleted_service_versions(sender, instance, **kwargs):
+    _on_commit_bump_versions(directory=True)
+
+
+@receiver(pre_migrate)
+def create_btree_gist_extension(sender, using, **kwargs):
+    # Migrations create the extension, which exclusion constraints need, but test
+    # databases with `MIGRATE: False` (e.g. the replica of router tests) are synced without them
+    connection = connections[using]
+    if sender.name != 'specialist_api' or connection.settings_dict['TEST'].get('MIGRATE', True):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
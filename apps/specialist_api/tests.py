@@ -1,12 +1,43 @@
+import asyncio
 import calendar
-from datetime import timedelta, time, datetime
+import csv
+import json
+import random
+import threading
+from datetime import timedelta, time, datetime, date
+from io import StringIO
+from unittest import mock, skipIf
 
-from django.test import TestCase, override_settings
+from asgiref.sync import async_to_sync
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.forms import modelform_factory
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+
+from psycopg2 import OperationalError, extensions
 
+from appointments_project.pooled_postgresql.pool import ConnectionPool
+from wagtail_admin.forms import ServiceAdminForm
+from . import bitmaps, checks, recurrence, response_cache, routers
+from .feeds import fold_line
+from .availability import iter_start_times, subtract_intervals
+from .bitmaps import DayBitmap, get_day_stats
 from .models import (
-    Worker, Location, Schedule, Service, Appointment
+    Worker, Location, Schedule, Service, Appointment, AppointmentSeries, SeriesException
 )
+from .middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from .query_budget import QueryBudgetMixin
+from .serializers import AppointmentSerializer
 
 
 User = get_user_model()
@@ -96,6 +127,36 @@ class ScheduleModelTests(TestCase):
             )
         )
 
+    
+    def test_touching_schedules_are_free(self):
+        self.assertTrue(
+            Schedule.is_location_free(
+                location=self.location,
+                day_of_week=self.day_of_week,
+                start_time=time(self.end_hours, self.end_minutes),
+                end_time=time(self.end_hours + 2)
+            )
+        )
+    
+    def test_is_location_free_excludes_schedule(self):
+        schedule = Schedule.objects.get()
+        
+        self.assertTrue(
+            Schedule.is_location_free(self.location, self.day_of_week, time(self.start_hours + 1),
+                                      time(self.start_hours + 2), exclude=schedule.id)
+        )
+    
+    def test_overlapping_schedules_are_rejected_by_database(self):
+        with self.assertRaises(IntegrityError) as context:
+            Schedule.objects.create(
+                worker=self.worker,
+                location=self.location,
+                day_of_week=self.day_of_week,
+                start_time=time(self.start_hours + 1),
+                end_time=time(self.end_hours + 1)
+            )
+        
+        self.assertTrue(Schedule.is_overlap_error(context.exception))
 
 class AppointmentModelTests(TestCase):
     """
@@ -183,3 +244,1090 @@ class AppointmentModelTests(TestCase):
                 service=self.service,
                 scheduled_for=time_inside_schedule
             )
+    
+    def test_ends_at(self):
+        scheduled_for = datetime(2022, 7, 4, self.start_time.hour)
+        appointment = Appointment.objects.create(
+            client=self.client,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=scheduled_for
+        )
+        self.assertEqual(appointment.ends_at, scheduled_for + self.service.duration)
+        
+        self.service.duration = timedelta(minutes=60)
+        self.service.save()
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.ends_at, scheduled_for + timedelta(minutes=60))
+    
+    def test_lengthen_service_of_back_to_back_appointments(self):
+        scheduled_for = datetime(2022, 7, 4, self.start_time.hour)
+        appointments = [
+            Appointment.objects.create(client=self.client, worker=self.worker, service=self.service,
+                                       scheduled_for=scheduled_for + i * self.service.duration)
+            for i in range(2)
+        ]
+        form_class = modelform_factory(Service, form=ServiceAdminForm,
+                                       fields=['name', 'price', 'currency', 'duration'])
+        data = {'name': self.service.name, 'price': self.service.price, 'currency': self.service.currency}
+        
+        self.assertEqual(list(self.service.get_overlapping_appointments(timedelta(minutes=60))), [appointments[0]])
+        self.assertFalse(self.service.get_overlapping_appointments(self.service.duration).exists())
+        
+        form = form_class({**data, 'duration': '01:00'}, instance=self.service)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['duration'], [Service.OVERLAP_ERROR])
+        self.assertTrue(form_class({**data, 'duration': '00:30'}, instance=self.service).is_valid())
+        
+        self.service.duration = timedelta(minutes=60)
+        with self.assertRaises(IntegrityError):
+            self.service.save()
+        self.assertEqual(Service.objects.get(id=self.service.id).duration, timedelta(minutes=40))
+    
+    def test_has_free_place(self):
+        scheduled_for = datetime(2022, 7, 4, self.start_time.hour)
+        appointment = Appointment.objects.create(
+            client=self.client,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=scheduled_for
+        )
+        
+        with self.assertNumQueries(1):
+            self.assertFalse(
+                Appointment._has_free_place(self.worker, scheduled_for + timedelta(minutes=20), self.service)
+            )
+        self.assertTrue(
+            Appointment._has_free_place(self.worker, appointment.ends_at, self.service)
+        )
+        self.assertTrue(
+            Appointment._has_free_place(self.worker, scheduled_for - self.service.duration, self.service)
+        )
+        self.assertTrue(
+            Appointment._has_free_place(self.worker, scheduled_for + timedelta(minutes=20),
+                                        self.service, exclude=appointment.id)
+        )
+    
+    def test_overlapping_appointments_are_rejected_by_database(self):
+        scheduled_for = datetime(2022, 7, 4, self.start_time.hour)
+        Appointment.objects.create(
+            client=self.client,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=scheduled_for
+        )
+        
+        with self.assertRaises(IntegrityError):
+            Appointment.objects.create(
+                client=self.client,
+                worker=self.worker,
+                service=self.service,
+                scheduled_for=scheduled_for + timedelta(minutes=20)
+            )
+    
+    def test_concurrent_booking_maps_to_validation_error(self):
+        today = date.today()
+        monday = today + timedelta(days=7 - today.weekday())
+        scheduled_for = datetime.combine(monday, self.start_time)
+        data = {
+            'worker': self.worker.id,
+            'client': self.client.id,
+            'service': self.service.id,
+            'scheduled_for': scheduled_for
+        }
+        serializer = AppointmentSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        
+        # another request books the same time after validation has passed
+        Appointment.objects.create(
+            client=self.client,
+            worker=self.worker,
+            service=self.service,
+            scheduled_for=scheduled_for
+        )
+        
+        with self.assertRaises(ValidationError) as cm:
+            serializer.save()
+        self.assertEqual(cm.exception.detail['non_field_errors'], [Appointment.NOT_FREE_ERROR])
+
+
+def get_random_day(rnd, day):
+    """:returns: random sorted windows and busy intervals of a day on a 5 minutes grid."""
+    def get_moment(lower, upper):
+        return datetime.combine(day, time.min) + timedelta(minutes=5 * rnd.randrange(lower, upper))
+
+    windows = []
+    start = get_moment(12, 48)
+    for _ in range(rnd.randrange(1, 4)):
+        end = start + timedelta(minutes=5 * rnd.randrange(6, 60))
+        if end.date() != day or end.hour == 0:
+            break
+        windows.append((start, end))
+        start = end + timedelta(minutes=5 * rnd.randrange(0, 12))
+    
+    busy = []
+    start = get_moment(12, 60)
+    for _ in range(rnd.randrange(0, 10)):
+        end = start + timedelta(minutes=5 * rnd.randrange(1, 24))
+        busy.append((start, end))
+        start = end + timedelta(minutes=5 * rnd.randrange(0, 24))
+    
+    return windows, busy
+
+
+class DayBitmapTests(SimpleTestCase):
+    """
+    Checks :class: `specialist_api.bitmaps.DayBitmap` against interval arithmetic.
+    """
+    def setUp(self):
+        self.rnd = random.Random(12)
+        self.day = date(2030, 1, 7)
+
+    def get_bitmap(self, windows, busy):
+        return DayBitmap.from_intervals(self.day, [(s.time(), e.time()) for s, e in windows], busy)
+
+    def test_fits(self):
+        for _ in range(200):
+            windows, busy = get_random_day(self.rnd, self.day)
+            bitmap = self.get_bitmap(windows, busy)
+            
+            for _ in range(20):
+                start = datetime.combine(self.day, time(self.rnd.randrange(0, 24), 5 * self.rnd.randrange(0, 12)))
+                end = start + timedelta(minutes=5 * self.rnd.randrange(1, 30))
+                
+                in_schedule = any(s <= start and end <= e for s, e in windows)
+                free = not any(s < end and start < e for s, e in busy)
+                self.assertEqual(bitmap.is_in_schedule(start, end), in_schedule)
+                self.assertEqual(bitmap.is_free(start, end), free)
+
+    def test_start_times(self):
+        for _ in range(200):
+            windows, busy = get_random_day(self.rnd, self.day)
+            duration = timedelta(minutes=5 * self.rnd.randrange(1, 24))
+            
+            expected = sorted({
+                start_time for window in windows
+                for start_time in iter_start_times(window, subtract_intervals([window], busy), duration, bitmaps.SLOT)
+            })
+            self.assertEqual(self.get_bitmap(windows, busy).get_start_times(duration), expected)
+
+    def check_day_stats(self):
+        days = [get_random_day(self.rnd, self.day) for _ in range(100)]
+        duration = timedelta(minutes=35)
+        step = timedelta(minutes=10)
+        
+        expected = []
+        for windows, busy in days:
+            free = set()
+            start_times = set()
+            for window in windows:
+                window_free = subtract_intervals([window], busy)
+                free.update(start + i * bitmaps.SLOT for start, end in window_free
+                            for i in range((end - start) // bitmaps.SLOT))
+                start_times.update(iter_start_times(window, window_free, duration, step))
+            expected.append((len(free), len(start_times)))
+        
+        self.assertEqual(get_day_stats([self.get_bitmap(*day) for day in days], duration, step), expected)
+
+    @skipIf(bitmaps.numpy is None, 'NumPy is not installed')
+    def test_day_stats_vectorized(self):
+        self.check_day_stats()
+
+    def test_day_stats_without_numpy(self):
+        with mock.patch.object(bitmaps, 'numpy', None):
+            self.check_day_stats()
+
+    def test_rounding(self):
+        bitmap = DayBitmap.from_intervals(
+            self.day,
+            windows=[(time(8, 0, 30), time(9, 59, 30))],
+            busy=[(datetime.combine(self.day, time(9, 0, 30)), datetime.combine(self.day, time(9, 10, 30)))]
+        )
+        
+        self.assertFalse(bitmap.is_in_schedule(datetime.combine(self.day, time(8)), datetime.combine(self.day, time(9))))
+        self.assertFalse(bitmap.is_free(datetime.combine(self.day, time(9, 10)), datetime.combine(self.day, time(9, 30))))
+        self.assertTrue(bitmap.fits(datetime.combine(self.day, time(9, 11)), datetime.combine(self.day, time(9, 59))))
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """
+    Provides tests for `specialist_api.checks.check_shared_cache`.
+    """
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache(self):
+        errors = checks.check_shared_cache(None)
+        
+        self.assertEqual([error.id for error in errors], ['specialist_api.E001'])
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://127.0.0.1:6379/0'}})
+    def test_shared_cache(self):
+        self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """
+    Provides tests for `specialist_api.response_cache`.
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def build():
+            builds.append(1)
+            started.set()
+            release.wait(1)
+            return 'value'
+
+        def get():
+            results.append(response_cache.get_or_build('key', build))
+
+        threads = [threading.Thread(target=get) for _ in range(5)]
+        threads[0].start()
+        started.wait(1)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_failed_build_releases_lock(self):
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            response_cache.get_or_build('key', fail)
+        self.assertEqual(response_cache.get_or_build('key', lambda: 'value'), 'value')
+
+
+def is_in_schedule_before_bitmaps(worker, scheduled_for, service):
+    """`Appointment._is_in_schedule` as it was before bitmaps."""
+    schedules = Schedule.objects.filter(worker=worker, day_of_week=scheduled_for.weekday())
+    service_end = datetime.combine(date.min, scheduled_for.time()) + service.duration
+    
+    for schedule in schedules:
+        if (schedule.start_time <= scheduled_for.time() <= schedule.end_time and
+                service_end.time() <= schedule.end_time):
+            return True
+    
+    return False
+
+
+def has_free_place_by_intervals(worker, scheduled_for, service):
+    """Checks the span against every appointment of the worker with plain interval overlap."""
+    ends_at = scheduled_for + service.duration
+    return not any(start < ends_at and scheduled_for < end
+                   for start, end in Appointment.objects.filter(worker=worker).values_list('scheduled_for', 'ends_at'))
+
+
+class AvailabilityDifferentialTests(TestCase):
+    """
+    Checks, that availability checks, delegated to bitmaps, agree with
+    the code before bitmaps and plain interval overlap on random days.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='username', email='testmail@mail.com', password='testpass1')
+        self.worker = Worker.objects.create(profile=self.user)
+        self.location = Location.objects.create(city='City', street='Street', street_number='100')
+        self.service = Service.objects.create(name='service', price=100, currency='USD',
+                                              duration=timedelta(minutes=35))
+        self.monday = date(2030, 1, 7)
+    
+    def create_day(self, rnd):
+        windows, busy = get_random_day(rnd, self.monday)
+        for start, end in windows:
+            Schedule.objects.create(worker=self.worker, location=self.location, day_of_week=calendar.MONDAY,
+                                    start_time=start.time(), end_time=end.time())
+        for i, (start, end) in enumerate(busy):
+            service = Service.objects.create(name=f'busy{i}', price=100, currency='USD', duration=end - start)
+            Appointment.objects.create(client=self.user, worker=self.worker, service=service, scheduled_for=start)
+        return windows
+    
+    def test_appointment_checks(self):
+        outcomes = set()
+        
+        for seed in range(6):
+            with self.subTest(seed=seed), transaction.atomic():
+                windows = self.create_day(random.Random(seed))
+                
+                for minute in range(0, 24 * 60, 5):
+                    scheduled_for = datetime.combine(self.monday, time.min) + timedelta(minutes=minute)
+                    in_schedule = Appointment._is_in_schedule(self.worker, scheduled_for, self.service)
+                    free = Appointment._has_free_place(self.worker, scheduled_for, self.service)
+                    outcomes.add((in_schedule, free))
+                    
+                    self.assertEqual(free, has_free_place_by_intervals(self.worker, scheduled_for, self.service))
+                    
+                    # The old code wrapped the end of a service past midnight around
+                    ends_at = scheduled_for + self.service.duration
+                    if ends_at.date() == self.monday:
+                        self.assertEqual(in_schedule,
+                                         is_in_schedule_before_bitmaps(self.worker, scheduled_for, self.service))
+                        self.assertEqual(
+                            Schedule.is_location_free(self.location, calendar.MONDAY,
+                                                      scheduled_for.time(), ends_at.time()),
+                            not any(start < ends_at and scheduled_for < end for start, end in windows)
+                        )
+                
+                transaction.set_rollback(True)
+        
+        # Random days must cover every combination, or the comparison proves little
+        self.assertEqual(outcomes, {(True, True), (True, False), (False, True), (False, False)})
+
+
+class AppointmentListAPIVIewTests(APITestCase):
+    """
+    Provides tests for :view: `specialist_api.AppointmentListAPIVIew`.
+    """
+    def setUp(self):
+        cache.clear()
+        client = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        worker_user = User.objects.create_user(
+            username='username2',
+            email='testmail2@mail.com',
+            password='testpass2'
+        )
+        worker = Worker.objects.create(profile=worker_user)
+        service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        
+        # two appointments a day from 4th till 8th of July 2022
+        for day in range(4, 9):
+            for hour in (0, 23):
+                Appointment.objects.create(
+                    client=client,
+                    worker=worker,
+                    service=service,
+                    scheduled_for=datetime(2022, 7, day, hour, 10)
+                )
+        
+        self.client.force_authenticate(worker_user)
+        self.url = reverse('specialist_api:appointment_list', kwargs={'worker_id': worker.id})
+        self.export_url = reverse('specialist_api:appointment_export', kwargs={'worker_id': worker.id})
+    
+    def get_scheduled_for(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [appointment['scheduled_for'] for appointment in response.data['results']]
+    
+    def test_filter_by_dates(self):
+        self.assertEqual(self.get_scheduled_for(specific_date='05-07-2022'),
+                         ['2022-07-05T23:10:00', '2022-07-05T00:10:00'])
+        self.assertEqual(len(self.get_scheduled_for(lower_date='05-07-2022')), 8)
+        self.assertEqual(len(self.get_scheduled_for(upper_date='05-07-2022')), 4)
+        self.assertEqual(len(self.get_scheduled_for(lower_date='05-07-2022', upper_date='06-07-2022')), 4)
+    
+    def test_next_appointments(self):
+        self.assertEqual(
+            self.get_scheduled_for(lower_date='06-07-2022', ordering='scheduled_for', page_size=3),
+            ['2022-07-06T00:10:00', '2022-07-06T23:10:00', '2022-07-07T00:10:00']
+        )
+    
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        
+        # the worker, checked by the permission
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'lower_date': '05-07-2022'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        appointment = Appointment.objects.first()
+        appointment.scheduled_for += timedelta(minutes=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def get_export(self, **params):
+        response = self.client.get(self.export_url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_export_ndjson(self):
+        rows = [json.loads(line) for line in self.get_export(lower_date='07-07-2022').splitlines()]
+        
+        self.assertEqual([row['scheduled_for'] for row in rows],
+                         ['2022-07-07T00:10:00', '2022-07-07T23:10:00',
+                          '2022-07-08T00:10:00', '2022-07-08T23:10:00'])
+        self.assertEqual(rows[0]['end_time'], '00:50:00')
+        self.assertEqual(rows[0]['service_name'], 'service_name')
+    
+    def test_export_csv(self):
+        rows = list(csv.DictReader(self.get_export(file_format='csv', upper_date='05-07-2022').splitlines()))
+        
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]['scheduled_for'], '2022-07-05T23:10:00')
+    
+    def test_export_series(self):
+        appointment = Appointment.objects.get(scheduled_for=datetime(2022, 7, 7, 0, 10))
+        series = AppointmentSeries.objects.create(
+            client=appointment.client,
+            worker=appointment.worker,
+            service=appointment.service,
+            starts_at=datetime(2022, 7, 5, 12),
+            frequency='WEEKLY',
+            count=2
+        )
+        rows = [json.loads(line) for line in self.get_export(lower_date='06-07-2022').splitlines()]
+        
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[-1]['scheduled_for'], '2022-07-12T12:00:00')
+        self.assertEqual(rows[-1]['series'], series.id)
+        self.assertIsNone(rows[-1]['id'])
+        self.assertEqual(rows[-1]['end_time'], '12:40:00')
+        self.assertEqual([row['series'] for row in rows[:-1]], [None] * 6)
+        
+        rows = list(csv.DictReader(self.get_export(file_format='csv', specific_date='05-07-2022').splitlines()))
+        self.assertEqual([row['scheduled_for'] for row in rows],
+                         ['2022-07-05T00:10:00', '2022-07-05T12:00:00', '2022-07-05T23:10:00'])
+    
+    def test_export_bad_format(self):
+        response = self.client.get(self.export_url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_end_time(self):
+        response = self.client.get(self.url, {'specific_date': '05-07-2022'})
+        appointment = response.data['results'][0]
+        
+        self.assertEqual(appointment['end_time'], '23:50:00')
+        self.assertEqual(appointment['service_name'], 'service_name')
+    
+    def test_query_count_does_not_depend_on_page_size(self):
+        # worker lookups of the permission and the queryset and the page itself
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'page_size': 1})
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'page_size': 10})
+
+
+class WorkerScheduleAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `specialist_api.WorkerScheduleAPIView`.
+    """
+    def setUp(self):
+        self.locations = [
+            Location.objects.create(city='City', street='Street', street_number=str(i))
+            for i in range(2)
+        ]
+        self.workers = []
+        for i in range(2):
+            user = User.objects.create_user(
+                username=f'username{i}',
+                email=f'testmail{i}@mail.com',
+                password='testpass1'
+            )
+            self.workers.append(Worker.objects.create(profile=user))
+        
+        Schedule.objects.create(worker=self.workers[0], location=self.locations[0],
+                                day_of_week=calendar.MONDAY, start_time=time(8), end_time=time(12))
+        Schedule.objects.create(worker=self.workers[1], location=self.locations[0],
+                                day_of_week=calendar.MONDAY, start_time=time(12), end_time=time(16))
+        
+        self.url = reverse('specialist_api:worker_schedule', kwargs={'worker_id': self.workers[0].id})
+        self.client.force_authenticate(self.workers[0].profile)
+    
+    def put_schedules(self, *schedules):
+        data = {
+            'schedules': [
+                {'location': location.id, 'day_of_week': day_of_week,
+                 'start_time': start_time.strftime('%H:%M'), 'end_time': end_time.strftime('%H:%M')}
+                for location, day_of_week, start_time, end_time in schedules
+            ]
+        }
+        return self.client.put(self.url, data, format='json')
+    
+    def test_replace_week(self):
+        response = self.put_schedules(
+            (self.locations[0], calendar.MONDAY, time(9), time(12)),
+            (self.locations[0], calendar.TUESDAY, time(8), time(18)),
+            (self.locations[1], calendar.MONDAY, time(13), time(17)),
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(Schedule.objects.filter(worker=self.workers[0]).count(), 3)
+    
+    def test_taken_location(self):
+        response = self.put_schedules(
+            (self.locations[0], calendar.MONDAY, time(9), time(13)),
+            (self.locations[0], calendar.TUESDAY, time(9), time(13)),
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['schedules'][0]['non_field_errors'], [Schedule.NOT_FREE_ERROR])
+        self.assertEqual(response.data['schedules'][1], {})
+        self.assertEqual(Schedule.objects.filter(worker=self.workers[0]).count(), 1)
+    
+    def test_overlapping_items(self):
+        response = self.put_schedules(
+            (self.locations[1], calendar.FRIDAY, time(9), time(13)),
+            (self.locations[1], calendar.FRIDAY, time(12), time(14)),
+            (self.locations[1], calendar.FRIDAY, time(14), time(15)),
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([bool(errors) for errors in response.data['schedules']], [True, True, False])
+    
+    def test_bad_items(self):
+        response = self.put_schedules(
+            (self.locations[1], calendar.FRIDAY, time(13), time(9)),
+        )
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_other_worker(self):
+        self.client.force_authenticate(self.workers[1].profile)
+        
+        response = self.put_schedules()
+        
+        self.assertEqual(response.status_code, 403)
+    
+    def test_first_week_updates_worker_list(self):
+        user = User.objects.create_user(username='username2', email='testmail2@mail.com', password='testpass1')
+        worker = Worker.objects.create(profile=user)
+        self.url = reverse('specialist_api:worker_schedule', kwargs={'worker_id': worker.id})
+        self.client.force_authenticate(user)
+        
+        list_url = reverse('client_api:workers')
+        etag = self.client.get(list_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.put_schedules((self.locations[1], calendar.TUESDAY, time(8), time(12))).status_code,
+                             200)
+        
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        results = self.client.get(list_url).data['results']
+        schedules = {item['profile']['username']: item['schedules'] for item in results}
+        self.assertEqual(len(schedules[user.username]), 1)
+
+
+class AppointmentFeedAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `specialist_api.AppointmentFeedAPIView`.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            username='username1',
+            email='testmail1@mail.com',
+            password='testpass1'
+        )
+        self.workers = []
+        for i in range(2):
+            user = User.objects.create_user(
+                username=f'worker{i}',
+                email=f'worker{i}@mail.com',
+                password='testpass2'
+            )
+            self.workers.append(Worker.objects.create(profile=user))
+        self.service = Service.objects.create(
+            name='Haircut, short',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=40)
+        )
+        
+        self.tomorrow = date.today() + timedelta(days=1)
+        for hour in (9, 11):
+            Appointment.objects.create(
+                client=self.client_user,
+                worker=self.workers[0],
+                service=self.service,
+                scheduled_for=datetime.combine(self.tomorrow, time(hour))
+            )
+        
+        self.client.force_authenticate(self.workers[0].profile)
+        response = self.client.get(reverse('specialist_api:appointment_feed_url',
+                                           kwargs={'worker_id': self.workers[0].id}))
+        self.client.force_authenticate(None)
+        self.feed_url = response.data['url']
+    
+    def get_feed(self, url=None, **headers):
+        return self.client.get(url or self.feed_url, **headers)
+    
+    def test_feed(self):
+        response = self.get_feed()
+        content = b''.join(response.streaming_content).decode()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn(f'DTSTART:{self.tomorrow.strftime("%Y%m%d")}T090000\r\n', content)
+        self.assertIn('SUMMARY:Haircut\\, short\r\n', content)
+        self.assertIn('DESCRIPTION:Client: username1\r\n', content)
+    
+    def test_conditional_get(self):
+        response = self.get_feed()
+        
+        self.assertEqual(self.get_feed(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get_feed(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                client=self.client_user,
+                worker=self.workers[0],
+                service=self.service,
+                scheduled_for=datetime.combine(self.tomorrow, time(13))
+            )
+        changed = self.get_feed(HTTP_IF_NONE_MATCH=response['ETag'])
+        
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+    
+    def test_series_occurrences(self):
+        series = AppointmentSeries.objects.create(
+            client=self.client_user,
+            worker=self.workers[0],
+            service=self.service,
+            starts_at=datetime.combine(self.tomorrow, time(15)),
+            frequency='WEEKLY',
+            count=3
+        )
+        response = self.get_feed()
+        content = b''.join(response.streaming_content).decode()
+        starts = [line for line in content.split('\r\n') if line.startswith('DTSTART:')]
+        
+        self.assertEqual(content.count('BEGIN:VEVENT'), 5)
+        self.assertEqual(content.count(f'UID:series-{series.id}-'), 3)
+        self.assertEqual(starts, sorted(starts))
+    
+    def test_series_changes_feed_version(self):
+        etag = self.get_feed()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            series = AppointmentSeries.objects.create(
+                client=self.client_user,
+                worker=self.workers[0],
+                service=self.service,
+                starts_at=datetime.combine(self.tomorrow, time(15)),
+                frequency='WEEKLY',
+                count=3
+            )
+        created = self.get_feed(HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(created.status_code, 200)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            SeriesException.objects.create(series=series, occurrence_start=series.starts_at)
+        skipped = self.get_feed(HTTP_IF_NONE_MATCH=created['ETag'])
+        
+        self.assertEqual(skipped.status_code, 200)
+        self.assertNotIn(f'UID:series-{series.id}-{series.starts_at.strftime("%Y%m%dT%H%M%S")}',
+                         b''.join(skipped.streaming_content).decode())
+    
+    def test_revoke_token(self):
+        self.client.force_authenticate(self.workers[0].profile)
+        response = self.client.post(reverse('specialist_api:appointment_feed_url',
+                                            kwargs={'worker_id': self.workers[0].id}))
+        self.client.force_authenticate(None)
+        
+        self.assertEqual(self.get_feed().status_code, 401)
+        self.assertEqual(self.get_feed(response.data['url']).status_code, 200)
+    
+    def test_token_of_other_worker(self):
+        url = self.feed_url.replace(f'/{self.workers[0].id}/', f'/{self.workers[1].id}/')
+        
+        self.assertEqual(self.get_feed(url).status_code, 401)
+        self.assertEqual(self.get_feed(self.feed_url.split('?')[0]).status_code, 401)
+        self.assertEqual(self.get_feed(self.feed_url + 'x').status_code, 401)
+    
+    def test_fold_line(self):
+        line = 'DESCRIPTION:' + 'ы' * 100
+        folded = fold_line(line)
+        
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded[:-2].split('\r\n')))
+        self.assertEqual(folded[:-2].replace('\r\n ', ''), line)
+
+
+@skipIf('replica' not in settings.DATABASES, 'Run with appointments_project.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(APITransactionTestCase):
+    """
+    Provides tests for `specialist_api.routers.ReplicaRouter` against a second database,
+    which stands for a replica. Nothing is replicated to it, so data, written
+    to the primary, can only be read if the read is routed to the primary.
+    """
+    # The runner checks connections of skipped tests as well
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+    available_apps = ['django.contrib.contenttypes', 'django.contrib.auth', 'specialist_api', 'client_api']
+    
+    def setUp(self):
+        cache.clear()
+        tokens = routers.enter_request()
+        
+        self.service = Service.objects.create(
+            name='service_name',
+            price=120,
+            currency='USD',
+            duration=timedelta(minutes=30)
+        )
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@mail.com',
+            password='testpass1'
+        )
+        self.worker = Worker.objects.create(profile=User.objects.create_user(
+            username='worker',
+            email='worker@mail.com',
+            password='testpass1'
+        ))
+        self.worker.services.add(self.service)
+        Schedule.objects.create(
+            location=Location.objects.create(city='City', street='Street', street_number='1'),
+            worker=self.worker,
+            day_of_week=calendar.MONDAY,
+            start_time=time(8),
+            end_time=time(18)
+        )
+        
+        routers.exit_request(tokens)
+        self.addCleanup(routers.exit_request, routers.enter_request())
+    
+    def test_reads_go_to_primary_after_write(self):
+        self.assertFalse(Service.objects.exists())
+        
+        Location.objects.create(city='City', street='Street', street_number='2')
+        self.assertTrue(routers.has_written())
+        self.assertEqual(Service.objects.get(), self.service)
+    
+    def test_use_primary(self):
+        with routers.use_primary():
+            self.assertTrue(Worker.objects.exists())
+        self.assertFalse(Worker.objects.exists())
+        
+        with routers.use_primary_if_changed(datetime.now().timestamp()):
+            self.assertTrue(Worker.objects.exists())
+        with routers.use_primary_if_changed(datetime.now().timestamp() - 60):
+            self.assertFalse(Worker.objects.exists())
+    
+    def test_validate_reads_primary(self):
+        today = date.today()
+        serializer = AppointmentSerializer()
+        data = {
+            'worker': self.worker,
+            'client': self.client_user,
+            'service': self.service,
+            'scheduled_for': datetime.combine(today + timedelta(days=7 - today.weekday()), time(9))
+        }
+        
+        # Bookings are validated in a transaction, which holds the lock of the worker
+        with transaction.atomic():
+            self.assertEqual(serializer.validate(data), data)
+        self.assertFalse(routers.is_pinned())
+    
+    def test_requests(self):
+        url = reverse('client_api:workers')
+        
+        # Long after the last change of the directory
+        with mock.patch.object(routers, 'time') as clock:
+            clock.time.return_value = datetime.now().timestamp() + 3600
+            self.assertEqual(self.client.get(url).data['results'], [])
+            
+            # Another page size, so the cached response isn't used
+            self.client.cookies[PIN_COOKIE] = '1'
+            self.assertEqual(len(self.client.get(url, {'page_size': 10}).data['results']), 1)
+        
+        del self.client.cookies[PIN_COOKIE]
+        response = self.client.post(reverse('client_api:register'), {
+            'username': 'username',
+            'first_name': 'First',
+            'last_name': 'Last',
+            'email': 'testmail@mail.com',
+            'password': 'Testpass123!',
+            'confirm_password': 'Testpass123!'
+        })
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertNotIn(PIN_COOKIE, self.client.get(url).cookies)
+
+
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+    """
+    Provides tests for `specialist_api.middleware.ReplicaPinningMiddleware`.
+    """
+    def setUp(self):
+        self.addCleanup(routers.exit_request, routers.enter_request())
+    
+    def get_response(self, request):
+        self.assertTrue(routers.is_pinned())
+        routers.ReplicaRouter().db_for_write(Service)
+        return HttpResponse()
+    
+    def test_sync(self):
+        middleware = ReplicaPinningMiddleware(self.get_response)
+        response = middleware(RequestFactory().post('/'))
+        
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertFalse(routers.has_written())
+    
+    def test_async(self):
+        async def get_response(request):
+            return self.get_response(request)
+        middleware = ReplicaPinningMiddleware(get_response)
+        response = async_to_sync(middleware)(RequestFactory().post('/'))
+        
+        # Django calls async views directly, only if the middleware is a coroutine function
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertFalse(routers.has_written())
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+    
+    def get_transaction_status(self):
+        if self.closed:
+            raise OperationalError('connection already closed')
+        return self.status
+    
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+    
+    def cursor(self):
+        if self.broken:
+            raise OperationalError('server closed the connection unexpectedly')
+        return mock.MagicMock()
+    
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    Provides tests for `appointments_project.pooled_postgresql.pool.ConnectionPool`.
+    """
+    def test_reuses_connections(self):
+        pool = ConnectionPool(size=2)
+        connection = pool.get(FakeConnection)
+        connection.status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.put(connection)
+        
+        self.assertIs(pool.get(FakeConnection), connection)
+        self.assertEqual(connection.status, extensions.TRANSACTION_STATUS_IDLE)
+        self.assertEqual(pool.get_stats()['checkouts'], 2)
+        self.assertEqual(pool.get_stats()['opened'], 1)
+        
+        connection.close()
+        pool.put(connection)
+        self.assertEqual(pool.get_stats()['opened'], 0)
+    
+    def test_waits_for_connection(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        connection = pool.get(FakeConnection)
+        
+        with self.assertRaises(OperationalError):
+            pool.get(FakeConnection)
+        self.assertEqual(pool.get_stats()['timeouts'], 1)
+        
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.put, [connection])
+        timer.start()
+        self.assertIs(pool.get(FakeConnection), connection)
+        timer.join()
+        
+        stats = pool.get_stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time'], 0)
+    
+    def test_checks_and_evicts_idle_connections(self):
+        pool = ConnectionPool(size=2, max_idle=60, check_after=0)
+        connection = pool.get(FakeConnection)
+        pool.put(connection)
+        connection.broken = True
+        
+        self.assertIsNot(pool.get(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.get_stats()['failed_checks'], 1)
+        
+        pool.max_idle = 0
+        pool.put(pool.get(FakeConnection))
+        pool.get(FakeConnection)
+        self.assertEqual(pool.get_stats()['evictions'], 1)
+
+
+class DatabasePoolStatsAPIViewTests(APITestCase):
+    """
+    Provides tests for :view: `specialist_api.DatabasePoolStatsAPIView`.
+    """
+    def test_stats(self):
+        url = reverse('specialist_api:database_pool_stats')
+        user = User.objects.create_user(username='user', email='user@mail.com', password='testpass1')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        
+        user.is_superuser = True
+        user.save()
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(('default', connection.settings_dict['NAME']),
+                      [(pool['alias'], pool['database']) for pool in response.data])
+
+
+class GenerateDataCommandTests(TestCase):
+    """
+    Provides tests for `generate_data` management command.
+    """
+    def generate(self, **options):
+        options = {'users': 20, 'workers': 6, 'services': 4, 'appointments': 100, 'start': '03-01-2050',
+                   'weeks': 2, 'seed': 1, 'chunk_size': 30, 'stdout': StringIO(), **options}
+        with transaction.atomic():
+            call_command('generate_data', **options)
+            data = (
+                list(Appointment.objects.values_list('client__username', 'worker_id', 'service_id',
+                                                     'scheduled_for', 'ends_at').order_by('id')),
+                list(Schedule.objects.values_list('worker_id', 'location_id', 'day_of_week',
+                                                  'start_time', 'end_time').order_by('id')),
+            )
+            transaction.set_rollback(True)
+        return data
+    
+    def test_generate(self):
+        for method in ('copy', 'bulk_create'):
+            with self.subTest(method=method), transaction.atomic():
+                call_command('generate_data', users=20, workers=6, services=4, appointments=100,
+                             weeks=2, chunk_size=30, method=method, stdout=StringIO())
+                
+                self.assertEqual(User.objects.count(), 26)
+                self.assertEqual(Worker.objects.count(), 6)
+                self.assertEqual(Location.objects.count(), 3)
+                self.assertEqual(Service.objects.count(), 4)
+                self.assertEqual(Appointment.objects.count(), 100)
+                self.assertFalse(Appointment.objects.exclude(ends_at=F('scheduled_for') + F('service__duration')))
+                # Sequences continue after generated ids
+                self.assertGreater(Service.objects.create(name='new', price=1, currency='UAH',
+                                                          duration=timedelta(hours=1)).id, 4)
+                transaction.set_rollback(True)
+    
+    def test_seed(self):
+        self.assertEqual(self.generate(), self.generate())
+        self.assertNotEqual(self.generate(), self.generate(seed=2))
+    
+    def test_too_many_workers(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_data', workers=7, locations=3, stdout=StringIO())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Checks budgets of SQL queries of specialist endpoints and model methods,
+    which must not depend on the number of appointments, workers or schedules.
+    """
+    query_budgets = {
+        # worker of the permission, worker of the queryset, page
+        'appointment_list': 3,
+        # worker of the permission, worker of the queryset, the whole export,
+        # series and their exceptions
+        'appointment_export': 5,
+        # worker of the permission, schedules
+        'worker_schedule': 2,
+        # schedules, appointments, series
+        'is_apoointment_avaliable': 3,
+        'is_location_free': 1,
+        'get_worker_schedule': 1,
+        'get_worker_services': 1,
+    }
+    
+    def setUp(self):
+        cache.clear()
+    
+    def get_busiest_worker(self):
+        return (Worker.objects.annotate(appointment_count=Count('appointment'))
+                .select_related('profile').order_by('-appointment_count', 'id').first())
+    
+    def get_endpoint(self, name, **params):
+        def setup():
+            worker = self.get_busiest_worker()
+            self.client.force_authenticate(worker.profile)
+            url = reverse(f'specialist_api:{name}', kwargs={'worker_id': worker.id})
+            return lambda: self.assertEqual(self.client.get(url, params).status_code, 200)
+        return setup
+    
+    def test_appointment_list(self):
+        self.assertQueryBudget('appointment_list', self.get_endpoint('appointment_list', page_size=50))
+    
+    def test_appointment_export(self):
+        def setup():
+            worker = self.get_busiest_worker()
+            self.client.force_authenticate(worker.profile)
+            url = reverse('specialist_api:appointment_export', kwargs={'worker_id': worker.id})
+            return lambda: b''.join(self.client.get(url).streaming_content)
+        self.assertQueryBudget('appointment_export', setup)
+    
+    def test_worker_schedule(self):
+        self.assertQueryBudget('worker_schedule', self.get_endpoint('worker_schedule'))
+    
+    def test_is_apoointment_avaliable(self):
+        def setup():
+            appointment = Appointment.objects.filter(worker=self.get_busiest_worker()).select_related(
+                'worker', 'service').first()
+            return lambda: self.assertIs(Appointment.is_apoointment_avaliable(
+                appointment.worker, appointment.scheduled_for, appointment.service, exclude=appointment.id
+            ), True)
+        self.assertQueryBudget('is_apoointment_avaliable', setup)
+    
+    def test_is_location_free(self):
+        def setup():
+            schedule = Schedule.objects.order_by('id').first()
+            return lambda: self.assertIs(Schedule.is_location_free(
+                schedule.location_id, schedule.day_of_week, schedule.start_time, schedule.end_time,
+                exclude=schedule.id
+            ), True)
+        self.assertQueryBudget('is_location_free', setup)
+    
+    def test_get_worker_schedule(self):
+        def setup():
+            worker = self.get_busiest_worker()
+            return lambda: list(worker.get_worker_schedule())
+        self.assertQueryBudget('get_worker_schedule', setup)
+    
+    def test_get_worker_services(self):
+        def setup():
+            worker = self.get_busiest_worker()
+            return lambda: list(worker.get_worker_services())
+        self.assertQueryBudget('get_worker_services', setup)
+    
+    def test_failure_shows_duplicates(self):
+        with self.assertRaises(AssertionError) as context:
+            with self.assertMaxQueries(1, 'loop'):
+                for i in range(3):
+                    list(Schedule.objects.filter(worker_id=i))
+        
+        message = str(context.exception)
+        self.assertIn('loop made 3 queries, the budget is 1.', message)
+        self.assertIn('Duplicated queries:\n  3x SELECT', message)
+        self.assertIn('WHERE "schedule"."worker_id" = ?', message)
+
+
+class RecurrenceTests(SimpleTestCase):
+    """
+    Provides tests for `specialist_api.recurrence`.
+    """
+    def test_add_months_clamps_day(self):
+        starts_at = datetime(2031, 1, 31, 9)
+        
+        self.assertEqual(recurrence.add_months(starts_at, 1), datetime(2031, 2, 28, 9))
+        self.assertEqual(recurrence.add_months(starts_at, 13), datetime(2032, 2, 29, 9))
+        # Every occurrence is counted from the start, so shorter months don't shift later ones
+        self.assertEqual(list(recurrence.iter_starts(starts_at, recurrence.MONTHLY, count=3)),
+                         [datetime(2031, 1, 31, 9), datetime(2031, 2, 28, 9), datetime(2031, 3, 31, 9)])
@@ -1,9 +1,19 @@
 from django.urls import path
 
-from .views import AppointmentListAPIVIew
+from .views import (
+    AppointmentListAPIVIew, AppointmentExportAPIView, AppointmentFeedAPIView,
+    AppointmentFeedUrlAPIView, WorkerScheduleAPIView, AvailabilityCacheStatsAPIView,
+    DatabasePoolStatsAPIView
+)
 
 
 app_name = 'specialist_api'
 urlpatterns = [
     path('<int:worker_id>/appointments/', AppointmentListAPIVIew.as_view(), name='appointment_list'),
+    path('<int:worker_id>/appointments/export/', AppointmentExportAPIView.as_view(), name='appointment_export'),
+    path('<int:worker_id>/appointments/feed.ics', AppointmentFeedAPIView.as_view(), name='appointment_feed'),
+    path('<int:worker_id>/appointments/feed/', AppointmentFeedUrlAPIView.as_view(), name='appointment_feed_url'),
+    path('<int:worker_id>/schedule/', WorkerScheduleAPIView.as_view(), name='worker_schedule'),
+    path('availability/cache/', AvailabilityCacheStatsAPIView.as_view(), name='availability_cache_stats'),
+    path('db/pools/', DatabasePoolStatsAPIView.as_view(), name='database_pool_stats'),
 ]
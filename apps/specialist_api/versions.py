@@ -0,0 +1,73 @@
+import hashlib
+import math
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+WORKER = 'worker'
+CLIENT = 'client'
+# The public worker directory as a whole
+DIRECTORY = 'directory'
+DIRECTORY_ID = 0
+
+
+def _get_key(kind, object_id):
+    return f'versions:{kind}:{object_id}'
+
+
+def _new_version(previous=None):
+    # Last-Modified has a precision of a second, so a new version always
+    # gets a later one, even if it's made within the second of the previous
+    last_modified = math.ceil(time.time())
+    if previous is not None:
+        last_modified = max(last_modified, previous[1] + 1)
+    return uuid.uuid4().hex, last_modified
+
+
+def bump(kind, object_ids):
+    """Gives new versions to objects of given kind with given ids."""
+    keys = [_get_key(kind, object_id) for object_id in object_ids]
+    if not keys:
+        return
+
+    previous = cache.get_many(keys)
+    cache.set_many({key: _new_version(previous.get(key)) for key in keys}, timeout=None)
+
+
+def get_version(*keys):
+    """
+    Versions, which aren't in the cache yet, are created, so a lost
+    version only costs clients one full response.
+    :returns: (etag, last modified timestamp) tuple of given (kind, id) keys together.
+    """
+    cache_keys = [_get_key(kind, object_id) for kind, object_id in keys]
+    versions = cache.get_many(cache_keys)
+
+    missing = [key for key in cache_keys if key not in versions]
+    for key in missing:
+        cache.add(key, _new_version(), timeout=None)
+    if missing:
+        versions.update(cache.get_many(missing))
+
+    etags = [versions[key][0] for key in cache_keys]
+    etag = etags[0] if len(etags) == 1 else hashlib.md5(':'.join(etags).encode()).hexdigest()
+    return etag, max(versions[key][1] for key in cache_keys)
+
+
+def get_not_modified_response(request, version):
+    """:returns: 304 response if the client already has given version, else None."""
+    etag, last_modified = version
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    return None if response is None else set_version_headers(response, version)
+
+
+def set_version_headers(response, version):
+    etag, last_modified = version
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,41 +1,72 @@
+import heapq
+
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 
-from django.utils.timezone import datetime
+from django.db.models import F, IntegerField, TimeField, Value
+from django.http import StreamingHttpResponse
+from django.db.models.functions import Cast
+from django.utils.timezone import datetime, timedelta
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 
-from .permissions import IsWorkerOrAdmin
-from .serializers import AppointmentSerializer
-from .models import Appointment, Worker
+from appointments_project.pooled_postgresql.pool import get_pools
+from .availability import get_cache_stats
+from .export import APPOINTMENT_FIELDS, iter_csv, iter_ndjson
+from .feeds import AppointmentFeedMixin, get_feed_token, revoke_feed_tokens
+from .pagination import AppointmentCursorPagination
+from .permissions import IsWorkerOrAdmin, IsSuperuser, HasFeedToken
+from . import routers, versions
+from .serializers import (
+    WorkerAppointmentSerializer, ScheduleSerializer, WeekScheduleSerializer
+)
+from .models import Appointment, AppointmentSeries, Worker, Schedule
 
 
 class AppointmentListAPIVIew(APIView):
     """
     get:
-    Returns a list of all appointments for specific worker
+    Returns a list of all appointments for specific worker.
+    Use `ordering=scheduled_for` with `lower_date` and `page_size`
+    to get next N appointments. Supports conditional requests
+    with `If-None-Match` and `If-Modified-Since` headers.
+    
+    Occurrences of recurring appointments aren't stored, so cursors
+    can't point at them and they aren't listed. They are included
+    in the export and the iCalendar feed.
     """
     permission_classes = [IsWorkerOrAdmin]
     model = Appointment
-    serializer_class = AppointmentSerializer
+    serializer_class = WorkerAppointmentSerializer
+    pagination_class = AppointmentCursorPagination
     
     def get(self, request, worker_id, **kwargs):
+        version = versions.get_version((versions.WORKER, worker_id))
+        not_modified = versions.get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+        
         try:
             queryset = self.filter_queryset(self.get_queryset(worker_id))
         except ValueError as e:
             content = {'query params': e.args[0]}
             return Response(content, status.HTTP_400_BAD_REQUEST)
         
-        serializer = self.serializer_class(queryset, many=True)
+        paginator = self.pagination_class()
+        with routers.use_primary_if_changed(version[1]):
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = self.serializer_class(page, many=True)
+            data = serializer.data
         
-        for item, obj in zip(serializer.data, queryset):
-            item['end_time'] = obj.get_service_endtime()
-        
-        return Response(serializer.data)
+        return versions.set_version_headers(paginator.get_paginated_response(data), version)
     
     def get_queryset(self, worker_id):
         worker = get_object_or_404(Worker, id=worker_id)
-        return self.model.objects.filter(worker=worker)
+        return (self.model.objects
+                    .filter(worker=worker)
+                    .select_related('service')
+                    .annotate(end_time=Cast('ends_at', output_field=TimeField())))
     
     def filter_queryset(self, queryset):
         """
@@ -45,31 +76,199 @@ class AppointmentListAPIVIew(APIView):
             - specific_date (date): a date in format `dd-mm-yyyy`
             - lower_date (date): a bottom bound of date filter
             - upper_date (date): a top bound of date filter
+        
+        Dates are turned into half-open ranges of `scheduled_for`, so
+        the filter can use (worker, scheduled_for) index.
+        """
+        lower, upper = self.get_range()
+        
+        if lower is not None:
+            queryset = queryset.filter(scheduled_for__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(scheduled_for__lt=upper)
+        
+        return queryset
+    
+    def get_range(self):
+        """
+        Returns (lower, upper) datetimes of the range of `scheduled_for`, given by
+        filter params of `filter_queryset`. Either of them is None if it isn't given.
         """
         DATE_FORMAT = '%d-%m-%Y'
+        ONE_DAY = timedelta(days=1)
         
         specific_date = self.request.query_params.get('specific_date')
         lower_date = self.request.query_params.get('lower_date')
         upper_date = self.request.query_params.get('upper_date')
         
-        if (specific_date is None) and (lower_date is None) and (upper_date is None):
-            return queryset
-        
         # Filtering queryset by given date
         if specific_date is not None:
             specific_date = datetime.strptime(specific_date, DATE_FORMAT)
-            return queryset.filter(scheduled_for__date=specific_date)
+            return specific_date, specific_date + ONE_DAY
         
-        if (lower_date is not None) and (upper_date is None):
-            lower_date = datetime.strptime(lower_date, DATE_FORMAT)
-            return queryset.filter(scheduled_for__date__gte=lower_date)
+        lower = datetime.strptime(lower_date, DATE_FORMAT) if lower_date is not None else None
+        upper = datetime.strptime(upper_date, DATE_FORMAT) + ONE_DAY if upper_date is not None else None
+        return lower, upper
+
+
+class AppointmentExportAPIView(AppointmentListAPIVIew):
+    """
+    get:
+    Streams all appointments for specific worker as NDJSON (by default)
+    or CSV, chosen with `file_format` param. Takes the same date filters
+    as the appointment list. Rows are read from a server-side cursor,
+    so memory use doesn't depend on the date range.
+    
+    Occurrences of recurring appointments are merged in by start, with
+    empty `id` and the id of their series in `series`.
+    """
+    chunk_size = 2000
+    file_formats = {
+        'ndjson': ('application/x-ndjson', iter_ndjson),
+        'csv': ('text/csv', iter_csv),
+    }
+    
+    def get(self, request, worker_id, **kwargs):
+        # `format` is taken by DRF for picking a renderer
+        file_format = request.query_params.get('file_format', 'ndjson')
         
-        if (upper_date is not None) and (lower_date is None):
-            upper_date = datetime.strptime(upper_date, DATE_FORMAT)
-            return queryset.filter(scheduled_for__date__lte=upper_date)
+        try:
+            if file_format not in self.file_formats:
+                raise ValueError(f'file_format must be one of: {", ".join(self.file_formats)}.')
+            queryset = self.filter_queryset(self.get_queryset(worker_id))
+        except ValueError as e:
+            content = {'query params': e.args[0]}
+            return Response(content, status.HTTP_400_BAD_REQUEST)
         
-        lower_date = datetime.strptime(lower_date, DATE_FORMAT)
-        upper_date = datetime.strptime(upper_date, DATE_FORMAT)
+        rows = (queryset
+                    .annotate(service_name=F('service__name'), series=Value(None, output_field=IntegerField()))
+                    .order_by('scheduled_for', 'id')
+                    .values(*APPOINTMENT_FIELDS)
+                    .iterator(chunk_size=self.chunk_size))
+        rows = heapq.merge(rows, self.get_occurrence_rows(worker_id, *self.get_range()),
+                           key=lambda row: row['scheduled_for'])
+        content_type, iter_content = self.file_formats[file_format]
         
-        return queryset.filter(scheduled_for__date__gte=lower_date,
-                               scheduled_for__date__lte=upper_date)
+        response = StreamingHttpResponse(iter_content(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="appointments-{worker_id}.{file_format}"'
+        return response
+    
+    def get_occurrence_rows(self, worker_id, lower, upper):
+        """:returns: sorted list of rows of occurrences of the worker's series, which start within the range."""
+        series = (AppointmentSeries.objects
+                      .filter(worker_id=worker_id)
+                      .select_related('service')
+                      .prefetch_related('exceptions'))
+        # The duration is subtracted from the lower bound, so it can't be the minimal datetime
+        expand_lower = lower or datetime.min + timedelta(days=1)
+        rows = [
+            {
+                'id': None,
+                'worker': item.worker_id,
+                'client': item.client_id,
+                'scheduled_for': start,
+                'service': item.service_id,
+                'end_time': end.time(),
+                'service_name': item.service.name,
+                'series': item.id,
+            }
+            for item in series
+            for _, start, end in item.get_occurrences(expand_lower, upper or datetime.max)
+            if lower is None or start >= lower
+        ]
+        return sorted(rows, key=lambda row: (row['scheduled_for'], row['series']))
+
+
+class AppointmentFeedAPIView(AppointmentFeedMixin, APIView):
+    """
+    get:
+    Returns appointments and occurrences of recurring appointments for
+    specific worker as an iCalendar feed. Calendar apps subscribe to it
+    with the url from `appointment_feed_url`.
+    """
+    permission_classes = [IsWorkerOrAdmin | HasFeedToken]
+    model = Appointment
+    feed_kind = versions.WORKER
+    counterpart_field = 'client__username'
+    counterpart_label = 'Client'
+    
+    def get(self, request, worker_id, **kwargs):
+        worker = get_object_or_404(Worker.objects.select_related('profile'), id=worker_id)
+        return self.get_feed_response(request,
+                                      f'Appointments of {worker}',
+                                      self.model.objects.filter(worker=worker),
+                                      AppointmentSeries.objects.filter(worker=worker),
+                                      versions.get_version((versions.WORKER, worker.id)))
+
+
+class AppointmentFeedUrlAPIView(APIView):
+    """
+    get:
+    Returns an iCalendar feed url for specific worker, which works
+    without logging in, so it can be given to calendar apps.
+    
+    post:
+    Revokes all the feed urls of specific worker and returns a new one.
+    """
+    permission_classes = [IsWorkerOrAdmin]
+    
+    def get(self, request, worker_id, **kwargs):
+        url = reverse('specialist_api:appointment_feed', kwargs={'worker_id': worker_id})
+        token = get_feed_token(versions.WORKER, worker_id)
+        return Response({'url': request.build_absolute_uri(f'{url}?token={token}')})
+    
+    def post(self, request, worker_id, **kwargs):
+        revoke_feed_tokens(versions.WORKER, worker_id)
+        return self.get(request, worker_id)
+
+
+class WorkerScheduleAPIView(APIView):
+    """
+    get:
+    Returns the week's schedule of specific worker.
+    
+    put:
+    Replaces the week's schedule of specific worker with given one.
+    Either the whole schedule is saved or none of it, in which case
+    errors are returned for each schedule.
+    """
+    permission_classes = [IsWorkerOrAdmin]
+    model = Schedule
+    serializer_class = WeekScheduleSerializer
+    
+    def get(self, request, worker_id, **kwargs):
+        schedules = self.model.objects.filter(worker_id=worker_id).order_by('day_of_week', 'start_time')
+        return Response(ScheduleSerializer(schedules, many=True).data)
+    
+    def put(self, request, worker_id, **kwargs):
+        worker = get_object_or_404(Worker, id=worker_id)
+        serializer = self.serializer_class(data=request.data, context={'worker': worker})
+        serializer.is_valid(raise_exception=True)
+        schedules = serializer.save()
+        
+        return Response(ScheduleSerializer(schedules, many=True).data)
+
+
+class AvailabilityCacheStatsAPIView(APIView):
+    """
+    get:
+    Returns numbers of hits and misses of the worker availability cache.
+    """
+    permission_classes = [IsSuperuser]
+    
+    def get(self, request, **kwargs):
+        return Response(get_cache_stats())
+
+
+class DatabasePoolStatsAPIView(APIView):
+    """
+    get:
+    Returns sizes and counters of database connection pools of the current process.
+    Is empty if the pooled database backend isn't used.
+    """
+    permission_classes = [IsSuperuser]
+    
+    def get(self, request, **kwargs):
+        content = [{'alias': alias, 'database': name, **pool.get_stats()}
+                   for (alias, name, *_), pool in get_pools().items()]
+        return Response(content)
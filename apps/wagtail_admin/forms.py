@@ -42,6 +42,10 @@ class ServiceAdminForm(WagtailAdminModelForm):
         
         data['duration'] = timedelta(hours=duration_hours, minutes=duration_minutes)
         
+        if (self.instance.pk is not None and
+                self.instance.get_overlapping_appointments(data['duration']).exists()):
+            self.add_error('duration', self.instance.OVERLAP_ERROR)
+        
         return data
 
 
@@ -60,8 +64,9 @@ class ScheduleAdminForm(WagtailAdminModelForm):
         if not Schedule.is_location_free(data['location'],
                                            data['day_of_week'],
                                            data['start_time'],
-                                           data['end_time']):
-            raise ValidationError('Location is not free at that time.')
+                                           data['end_time'],
+                                           exclude=self.instance.pk):
+            raise ValidationError(Schedule.NOT_FREE_ERROR)
         
         return data
 
@@ -75,7 +80,8 @@ class AppointmentAdminForm(WagtailAdminModelForm):
         try:
             Appointment.is_apoointment_avaliable(data['worker'],
                                                 data['scheduled_for'],
-                                                data['service'])
+                                                data['service'],
+                                                exclude=self.instance.pk)
         except ValueError as e:
             raise ValidationError(e.args)
         